@@ -0,0 +1,81 @@
+"""Benchmarks for the file and Earth Engine conversion functions."""
+
+from nclpy.common import csv_to_shp, geojson_to_ee, shp_to_geojson
+
+from .fixtures import (
+    SIZES,
+    FakeEE,
+    TempDir,
+    feature_collection,
+    point_features,
+    skip_large_polygons,
+    write_csv,
+    write_point_shapefile,
+    write_polygon_shapefile,
+)
+
+
+class ShpToGeoJSON:
+    params = (SIZES, ["point", "polygon"])
+    param_names = ["features", "geometry"]
+    timeout = 300
+
+    def setup(self, n, geometry):
+        skip_large_polygons(n, geometry)
+        self.tmp = TempDir()
+        if geometry == "point":
+            self.in_shp = write_point_shapefile(self.tmp.path("points.shp"), n)
+        else:
+            self.in_shp = write_polygon_shapefile(self.tmp.path("polygons.shp"), n)
+
+    def teardown(self, n, geometry):
+        self.tmp.cleanup()
+
+    def time_shp_to_geojson(self, n, geometry):
+        shp_to_geojson(self.in_shp)
+
+    def peakmem_shp_to_geojson(self, n, geometry):
+        shp_to_geojson(self.in_shp)
+
+    def time_shp_to_geojson_file(self, n, geometry):
+        shp_to_geojson(self.in_shp, self.tmp.path("out.geojson"))
+
+    def peakmem_shp_to_geojson_file(self, n, geometry):
+        shp_to_geojson(self.in_shp, self.tmp.path("out.geojson"))
+
+
+class CsvToShp:
+    params = SIZES
+    param_names = ["rows"]
+    timeout = 300
+
+    def setup(self, n):
+        self.tmp = TempDir()
+        self.in_csv = write_csv(self.tmp.path("points.csv"), n)
+
+    def teardown(self, n):
+        self.tmp.cleanup()
+
+    def time_csv_to_shp(self, n):
+        csv_to_shp(self.in_csv, self.tmp.path("points.shp"))
+
+    def peakmem_csv_to_shp(self, n):
+        csv_to_shp(self.in_csv, self.tmp.path("points.shp"))
+
+
+class GeoJSONToEE:
+    params = SIZES
+    param_names = ["features"]
+
+    def setup(self, n):
+        self.fake_ee = FakeEE()
+        self.geojson = feature_collection(point_features(n))
+
+    def teardown(self, n):
+        self.fake_ee.restore()
+
+    def time_geojson_to_ee(self, n):
+        geojson_to_ee(self.geojson)
+
+    def peakmem_geojson_to_ee(self, n):
+        geojson_to_ee(self.geojson)
@@ -0,0 +1,51 @@
+"""Benchmarks for Earth Engine layers, against a stand-in ee module so that only the time
+spent in nclpy is measured."""
+
+from .fixtures import FakeEE, TempDir
+
+
+class EETileLayer:
+    def setup(self):
+        self.fake_ee = FakeEE()
+        from nclpy import map_id_cache
+        from nclpy.nclpy import ee_tile_layer
+
+        map_id_cache.clear()
+        self.ee_tile_layer = ee_tile_layer
+        self.image = self.fake_ee.ee.Image()
+        self.features = self.fake_ee.ee.FeatureCollection()
+
+    def teardown(self):
+        self.fake_ee.restore()
+
+    def time_image(self):
+        self.ee_tile_layer(self.fake_ee.ee.Image(), {"min": 0, "max": 3000})
+
+    def time_image_cached(self):
+        self.ee_tile_layer(self.image, {"min": 0, "max": 3000})
+
+    def time_features(self):
+        self.ee_tile_layer(self.features, {"color": "FF0000"}, use_cache=False)
+
+
+class AddEELayers:
+    params = [1, 12, 48]
+    param_names = ["layers"]
+
+    def setup(self, n):
+        self.fake_ee = FakeEE()
+        self.tmp = TempDir()
+        from nclpy import Map
+
+        self.map = Map()
+        self.layers = [
+            (self.fake_ee.ee.Image(), {"min": 0}, "layer {}".format(i))
+            for i in range(n)
+        ]
+
+    def teardown(self, n):
+        self.tmp.cleanup()
+        self.fake_ee.restore()
+
+    def time_add_ee_layers(self, n):
+        self.map.add_ee_layers(self.layers)
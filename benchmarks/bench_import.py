@@ -0,0 +1,9 @@
+"""Benchmarks for importing nclpy. Each runs in a fresh interpreter."""
+
+
+class Import:
+    def timeraw_import_nclpy(self):
+        return "import nclpy"
+
+    def timeraw_import_map(self):
+        return "from nclpy import Map"
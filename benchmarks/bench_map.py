@@ -0,0 +1,104 @@
+"""Benchmarks for building maps and adding vector layers to them."""
+
+from nclpy.simplify import geojson_size
+
+from .fixtures import (
+    SIZES,
+    TempDir,
+    feature_collection,
+    point_features,
+    polygon_features,
+    skip_large_polygons,
+)
+
+
+class MapConstruction:
+    def setup(self):
+        self.tmp = TempDir()
+        from nclpy import Map
+
+        self.Map = Map
+
+    def teardown(self):
+        self.tmp.cleanup()
+
+    def time_map(self):
+        self.Map()
+
+    def peakmem_map(self):
+        self.Map()
+
+    def time_map_headless(self):
+        self.Map(headless=True)
+
+    def peakmem_map_headless(self):
+        self.Map(headless=True)
+
+    def time_small_multiples(self):
+        # A notebook cell laying out a grid of small maps.
+        for _ in range(30):
+            self.Map(height="200px")
+
+
+class OpenToolbar:
+    """The cost moved out of Map() into the first use of each toolbar tool."""
+
+    def setup(self):
+        self.tmp = TempDir()
+        from nclpy import Map
+
+        self.map = Map()
+        toolbar = self.map.controls[2].widget
+        self.toolbar_button = toolbar.children[0]
+
+    def teardown(self):
+        self.tmp.cleanup()
+
+    def time_open_toolbar(self):
+        self.toolbar_button.value = True
+
+    def time_open_file_chooser(self):
+        self.toolbar_button.value = True
+        grid = self.map.controls[2].widget.children[1]
+        grid.children[0].click()
+
+
+class AddGeoJSON:
+    params = (SIZES, ["point", "polygon"])
+    param_names = ["features", "geometry"]
+    timeout = 300
+
+    def setup(self, n, geometry):
+        skip_large_polygons(n, geometry)
+        from nclpy import Map
+
+        self.tmp = TempDir()
+        if geometry == "point":
+            self.geojson = feature_collection(point_features(n))
+        else:
+            self.geojson = feature_collection(polygon_features(n))
+        self.map = Map()
+
+    def teardown(self, n, geometry):
+        self.tmp.cleanup()
+
+    def time_add_geojson(self, n, geometry):
+        self.map.add_geojson(self.geojson)
+
+    def peakmem_add_geojson(self, n, geometry):
+        self.map.add_geojson(self.geojson)
+
+    def time_add_geojson_simplified(self, n, geometry):
+        self.map.add_geojson(self.geojson, simplify=True)
+
+    def track_payload_bytes(self, n, geometry):
+        self.map.add_geojson(self.geojson)
+        return geojson_size(self.map.layers[-1].data)
+
+    track_payload_bytes.unit = "bytes"
+
+    def track_payload_bytes_simplified(self, n, geometry):
+        self.map.add_geojson(self.geojson, simplify=True)
+        return geojson_size(self.map.layers[-1].data)
+
+    track_payload_bytes_simplified.unit = "bytes"
@@ -0,0 +1,227 @@
+"""Synthetic data and a stand-in Earth Engine module shared by the benchmarks."""
+
+import json
+import os
+import sys
+import tempfile
+import types
+
+import numpy as np
+
+# Number of features of the small, medium and large fixtures.
+SIZES = [1000, 10000, 100000]
+
+# Polygon fixtures stop at the medium size, which already takes seconds to process.
+MAX_POLYGONS = 10000
+
+
+def random_points(n, seed=0):
+    """Returns n longitude/latitude pairs over the conterminous United States."""
+    rng = np.random.default_rng(seed)
+    return rng.uniform([-125.0, 25.0], [-67.0, 49.0], (n, 2))
+
+
+def point_features(n, seed=0):
+    """Returns n GeoJSON point features with a few attributes each."""
+    return [
+        {
+            "type": "Feature",
+            "properties": {"id": i, "name": "site {}".format(i), "value": i * 0.5},
+            "geometry": {"type": "Point", "coordinates": [x, y]},
+        }
+        for i, (x, y) in enumerate(random_points(n, seed).tolist())
+    ]
+
+
+def polygon_features(n, vertices=32, seed=0):
+    """Returns n GeoJSON polygon features, each a circle with a number of vertices."""
+    # Exterior rings run counterclockwise, as GeoJSON recommends.
+    angles = np.linspace(0, 2 * np.pi, vertices)
+    ring = np.column_stack([np.cos(angles), np.sin(angles)]) * 0.05
+    return [
+        {
+            "type": "Feature",
+            "properties": {"id": i},
+            "geometry": {"type": "Polygon", "coordinates": [(ring + center).tolist()]},
+        }
+        for i, center in enumerate(random_points(n, seed))
+    ]
+
+
+def feature_collection(features):
+    return {"type": "FeatureCollection", "features": features}
+
+
+def write_geojson(path, features):
+    with open(path, "w") as f:
+        json.dump(feature_collection(features), f)
+    return path
+
+
+def write_csv(path, n):
+    """Writes a CSV of n points with longitude and latitude columns."""
+    with open(path, "w") as f:
+        f.write("id,name,longitude,latitude\n")
+        for i, (x, y) in enumerate(random_points(n).tolist()):
+            f.write("{},site {},{},{}\n".format(i, i, x, y))
+    return path
+
+
+def write_point_shapefile(path, n):
+    """Writes a point shapefile of n features with pyshp."""
+    import shapefile
+
+    with shapefile.Writer(path, shapeType=shapefile.POINT) as w:
+        w.field("id", "N")
+        w.field("name", "C", size=20)
+        for i, (x, y) in enumerate(random_points(n).tolist()):
+            w.point(x, y)
+            w.record(i, "site {}".format(i))
+    return path
+
+
+def write_polygon_shapefile(path, n, vertices=32):
+    """Writes a polygon shapefile of n features with pyshp."""
+    import shapefile
+
+    with shapefile.Writer(path, shapeType=shapefile.POLYGON) as w:
+        w.field("id", "N")
+        for feature in polygon_features(n, vertices):
+            # Shapefile exterior rings run clockwise.
+            w.poly([ring[::-1] for ring in feature["geometry"]["coordinates"]])
+            w.record(feature["properties"]["id"])
+    return path
+
+
+def skip_large_polygons(n, geometry):
+    """Skips a benchmark, the asv way, for polygon fixtures above MAX_POLYGONS."""
+    if geometry == "polygon" and n > MAX_POLYGONS:
+        raise NotImplementedError
+
+
+class TempDir:
+    """A scratch directory holding a data/ folder, made the working directory while in use,
+    since the file chooser of the toolbar browses ./data."""
+
+    def __init__(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.name = self.tmp_dir.name
+        os.makedirs(os.path.join(self.name, "data"))
+        self.cwd = os.getcwd()
+        os.chdir(self.name)
+
+    def path(self, name):
+        return os.path.join(self.name, name)
+
+    def cleanup(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+
+class _TileFetcher:
+    def __init__(self, url_format):
+        self.url_format = url_format
+
+
+class _EEObject:
+    """Stands in for the Earth Engine classes, returning map IDs without any server call."""
+
+    _count = 0
+
+    def __init__(self, *args, **kwargs):
+        _EEObject._count += 1
+        self.args = args
+        self.id = _EEObject._count
+
+    def serialize(self):
+        return "{}:{}".format(type(self).__name__, self.id)
+
+    def getMapId(self, vis_params=None):
+        return {
+            "tile_fetcher": _TileFetcher(
+                "https://ee/{}/{{z}}/{{x}}/{{y}}".format(self.id)
+            )
+        }
+
+    def style(self, **kwargs):
+        return Image()
+
+    def updateMask(self, mask):
+        return self
+
+    def blend(self, other):
+        return self
+
+    def mosaic(self):
+        return Image()
+
+    def flatten(self):
+        return self
+
+    @classmethod
+    def constant(cls, value):
+        return Image()
+
+
+class Image(_EEObject):
+    pass
+
+
+class ImageCollection(_EEObject):
+    pass
+
+
+class Feature(_EEObject):
+    pass
+
+
+class FeatureCollection(_EEObject):
+    pass
+
+
+class Geometry(_EEObject):
+    Point = _EEObject
+
+
+def fake_ee():
+    """Returns a module standing in for ee, with the classes used by nclpy."""
+    ee = types.ModuleType("ee")
+    for cls in (Image, ImageCollection, Feature, FeatureCollection, Geometry):
+        setattr(ee, cls.__name__, cls)
+    for name, cls in [
+        ("image", Image),
+        ("imagecollection", ImageCollection),
+        ("feature", Feature),
+        ("featurecollection", FeatureCollection),
+        ("geometry", Geometry),
+    ]:
+        submodule = types.ModuleType("ee." + name)
+        setattr(submodule, cls.__name__, cls)
+        setattr(ee, name, submodule)
+    ee.List = list
+    return ee
+
+
+class FakeEE:
+    """Replaces ee, and the Earth Engine initialization, for nclpy while in use."""
+
+    def __init__(self):
+        from nclpy import common, nclpy
+
+        self.ee = fake_ee()
+        self._saved = [
+            (sys.modules, "ee", sys.modules.get("ee")),
+            (nclpy, "ee", nclpy.ee),
+            (nclpy, "ee_initialize", nclpy.ee_initialize),
+            (common, "ee_initialize", common.ee_initialize),
+        ]
+        sys.modules["ee"] = self.ee
+        nclpy.ee = self.ee
+        nclpy.ee_initialize = lambda *args, **kwargs: None
+        common.ee_initialize = lambda *args, **kwargs: None
+
+    def restore(self):
+        target, name, value = self._saved[0]
+        target[name] = value
+        for target, name, value in self._saved[1:]:
+            setattr(target, name, value)
@@ -4,6 +4,57 @@ __author__ = """Hannah Rubin"""
 __email__ = "hannahrubin100@gmail.com"
 __version__ = "0.0.11"
 
-from .nclpy import *
-from .utils import *
-from .common import *
+import importlib
+import types
+
+# Public names mapped to the submodule that defines them. Submodules are only
+# imported on first attribute access, so ``import nclpy`` does not pull in
+# ipyleaflet, ipywidgets or Earth Engine until they are actually needed.
+_lazy_attrs = {
+    "Map": "nclpy",
+    "ee_tile_layer": "nclpy",
+    "ee_tile_url": "nclpy",
+    "map_id_cache": "cache",
+    "map_id_cache_stats": "cache",
+    "layer_cache": "layer_cache",
+    "layer_cache_info": "layer_cache",
+    "get_tile_proxy": "tile_proxy",
+    "render_map": "static_maps",
+    "render_maps": "static_maps",
+    "basemaps": "basemaps",
+    "basemap_tiles": "basemaps",
+    "main_toolbar": "toolbar",
+    "random_points": "generate_points",
+    "random_points_local": "generate_points",
+    "random_string": "utils",
+    "add": "utils",
+    "subtract": "utils",
+    "multiply": "utils",
+    "divide": "utils",
+    "ee_initialize": "common",
+    "tool_template": "common",
+    "geojson_to_ee": "common",
+    "shp_to_geojson": "common",
+    "iter_shp_features": "common",
+    "csv_to_shp": "common",
+}
+
+__all__ = sorted(_lazy_attrs)
+
+
+def __getattr__(name):
+    module_name = _lazy_attrs.get(name)
+    if module_name is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    module = importlib.import_module("." + module_name, __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    # Importing a submodule binds it on the package, which would shadow the
+    # ``basemaps`` Box exported under the same name.
+    if isinstance(globals().get("basemaps"), types.ModuleType):
+        del globals()["basemaps"]
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attrs))
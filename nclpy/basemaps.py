@@ -1,103 +1,199 @@
 """Module for basemaps. Each basemap is defined as item in the ee_basemaps dictionary. For example, to access Google basemaps, use the following:
 ee_basemaps['ROADMAP'], ee_basemaps['SATELLITE'], ee_basemaps['HYBRID'].
+The dictionary only holds descriptors (url, attribution, name); TileLayer widgets are built on first access.
 More WMS basemaps can be found at the following websites:
 1. USGS National Map: https://viewer.nationalmap.gov/services/
 2. MRLC NLCD Land Cover data: https://viewer.nationalmap.gov/services/
 3. FWS NWI Wetlands data: https://www.fws.gov/wetlands/Data/Web-Map-Services.html
 """
 
+from collections.abc import Mapping
 from box import Box
-from ipyleaflet import TileLayer, WMSLayer, basemap_to_tiles
+from ipyleaflet import TileLayer, basemap_to_tiles
 import ipyleaflet.basemaps as ipybasemaps
 
 
 _ee_basemaps = {
-    "ROADMAP": TileLayer(
-        url="https://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}",
-        attribution="Google",
-        name="Google Maps",
-    ),
-    "SATELLITE": TileLayer(
-        url="https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}",
-        attribution="Google",
-        name="Google Satellite",
-    ),
-    "TERRAIN": TileLayer(
-        url="https://mt1.google.com/vt/lyrs=p&x={x}&y={y}&z={z}",
-        attribution="Google",
-        name="Google Terrain",
-    ),
-    "HYBRID": TileLayer(
-        url="https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}",
-        attribution="Google",
-        name="Google Satellite",
-    ),
-    "ESRI": TileLayer(
-        url="https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
-        attribution="Esri",
-        name="Esri Satellite",
-    ),
-    "Esri Ocean": TileLayer(
-        url="https://services.arcgisonline.com/ArcGIS/rest/services/Ocean/World_Ocean_Base/MapServer/tile/{z}/{y}/{x}",
-        attribution="Esri",
-        name="Esri Ocean",
-    ),
-    "Esri Satellite": TileLayer(
-        url="https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
-        attribution="Esri",
-        name="Esri Satellite",
-    ),
-    "Esri Standard": TileLayer(
-        url="https://server.arcgisonline.com/ArcGIS/rest/services/World_Street_Map/MapServer/tile/{z}/{y}/{x}",
-        attribution="Esri",
-        name="Esri Standard",
-    ),
-    "Esri Terrain": TileLayer(
-        url="https://server.arcgisonline.com/ArcGIS/rest/services/World_Terrain_Base/MapServer/tile/{z}/{y}/{x}",
-        attribution="Esri",
-        name="Esri Terrain",
-    ),
-    "Esri Transportation": TileLayer(
-        url="https://server.arcgisonline.com/ArcGIS/rest/services/Reference/World_Transportation/MapServer/tile/{z}/{y}/{x}",
-        attribution="Esri",
-        name="Esri Transportation",
-    ),
-    "Esri Topo World": TileLayer(
-        url="https://services.arcgisonline.com/ArcGIS/rest/services/World_Topo_Map/MapServer/tile/{z}/{y}/{x}",
-        attribution="Esri",
-        name="Esri Topo World",
-    ),
-    "Esri National Geographic": TileLayer(
-        url="http://services.arcgisonline.com/ArcGIS/rest/services/NatGeo_World_Map/MapServer/tile/{z}/{y}/{x}",
-        attribution="Esri",
-        name="Esri National Geographic",
-    ),
-    "Esri Shaded Relief": TileLayer(
-        url="https://services.arcgisonline.com/arcgis/rest/services/World_Shaded_Relief/MapServer/tile/{z}/{y}/{x}",
-        attribution="Esri",
-        name="Esri Shaded Relief",
-    ),
-    "Esri Physical Map": TileLayer(
-        url="https://services.arcgisonline.com/arcgis/rest/services/World_Physical_Map/MapServer/tile/{z}/{y}/{x}",
-        attribution="Esri",
-        name="Esri Physical Map",
-    ),
+    "ROADMAP": {
+        "url": "https://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}",
+        "attribution": "Google",
+        "name": "Google Maps",
+    },
+    "SATELLITE": {
+        "url": "https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}",
+        "attribution": "Google",
+        "name": "Google Satellite",
+    },
+    "TERRAIN": {
+        "url": "https://mt1.google.com/vt/lyrs=p&x={x}&y={y}&z={z}",
+        "attribution": "Google",
+        "name": "Google Terrain",
+    },
+    "HYBRID": {
+        "url": "https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}",
+        "attribution": "Google",
+        "name": "Google Satellite",
+    },
+    "ESRI": {
+        "url": "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
+        "attribution": "Esri",
+        "name": "Esri Satellite",
+    },
+    "Esri Ocean": {
+        "url": "https://services.arcgisonline.com/ArcGIS/rest/services/Ocean/World_Ocean_Base/MapServer/tile/{z}/{y}/{x}",
+        "attribution": "Esri",
+        "name": "Esri Ocean",
+    },
+    "Esri Satellite": {
+        "url": "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
+        "attribution": "Esri",
+        "name": "Esri Satellite",
+    },
+    "Esri Standard": {
+        "url": "https://server.arcgisonline.com/ArcGIS/rest/services/World_Street_Map/MapServer/tile/{z}/{y}/{x}",
+        "attribution": "Esri",
+        "name": "Esri Standard",
+    },
+    "Esri Terrain": {
+        "url": "https://server.arcgisonline.com/ArcGIS/rest/services/World_Terrain_Base/MapServer/tile/{z}/{y}/{x}",
+        "attribution": "Esri",
+        "name": "Esri Terrain",
+    },
+    "Esri Transportation": {
+        "url": "https://server.arcgisonline.com/ArcGIS/rest/services/Reference/World_Transportation/MapServer/tile/{z}/{y}/{x}",
+        "attribution": "Esri",
+        "name": "Esri Transportation",
+    },
+    "Esri Topo World": {
+        "url": "https://services.arcgisonline.com/ArcGIS/rest/services/World_Topo_Map/MapServer/tile/{z}/{y}/{x}",
+        "attribution": "Esri",
+        "name": "Esri Topo World",
+    },
+    "Esri National Geographic": {
+        "url": "http://services.arcgisonline.com/ArcGIS/rest/services/NatGeo_World_Map/MapServer/tile/{z}/{y}/{x}",
+        "attribution": "Esri",
+        "name": "Esri National Geographic",
+    },
+    "Esri Shaded Relief": {
+        "url": "https://services.arcgisonline.com/arcgis/rest/services/World_Shaded_Relief/MapServer/tile/{z}/{y}/{x}",
+        "attribution": "Esri",
+        "name": "Esri Shaded Relief",
+    },
+    "Esri Physical Map": {
+        "url": "https://services.arcgisonline.com/arcgis/rest/services/World_Physical_Map/MapServer/tile/{z}/{y}/{x}",
+        "attribution": "Esri",
+        "name": "Esri Physical Map",
+    },
 }
 
-# Adds ipyleaflet basemaps
-for item in ipybasemaps.values():
-    try:
-        name = item["name"]
-        basemap = "ipybasemaps.{}".format(name)
-        _ee_basemaps[name] = basemap_to_tiles(eval(basemap))
-    except Exception:
-        for sub_item in item:
-            name = item[sub_item]["name"]
-            basemap = "ipybasemaps.{}".format(name)
-            basemap = basemap.replace("Mids", "Modis")
-            _ee_basemaps[name] = basemap_to_tiles(eval(basemap))
-
-basemap_tiles = Box(_ee_basemaps, frozen_box=True)
+
+def _iter_ipybasemaps(item):
+    """Yields the tile providers in a (possibly nested) ipyleaflet basemaps group."""
+    if "url" in item:
+        yield item
+    else:
+        for sub_item in item.values():
+            yield from _iter_ipybasemaps(sub_item)
+
+
+# Adds ipyleaflet basemaps. The provider itself is kept as the descriptor.
+for provider in _iter_ipybasemaps(ipybasemaps):
+    if hasattr(provider, "requires_token") and provider.requires_token():
+        continue
+    _ee_basemaps[provider["name"]] = {"basemap": provider}
+
+
+def basemap_to_layer(descriptor, proxy=None):
+    """Builds a new TileLayer from a basemap descriptor.
+    Args:
+        descriptor (dict): A descriptor from the ee_basemaps dictionary.
+        proxy (TileProxy, optional): A tile proxy the tiles are loaded through. Defaults to None.
+    Returns:
+        object: An ipyleaflet TileLayer.
+    """
+    if "local" in descriptor:
+        # Local tile packages are always served by the kernel's tile proxy.
+        from .tile_proxy import get_tile_proxy
+
+        descriptor = dict(descriptor)
+        source = descriptor.pop("local")
+        return TileLayer(url=get_tile_proxy().local_url(source), **descriptor)
+    if "basemap" in descriptor:
+        layer = basemap_to_tiles(descriptor["basemap"])
+    else:
+        layer = TileLayer(**descriptor)
+    if proxy is not None:
+        layer.url = proxy.proxy_url(layer.url)
+    return layer
+
+
+class BasemapTiles(Mapping):
+    """A read-only mapping of basemap names to TileLayer objects.
+    Each TileLayer is built on first access and reused afterwards. Every Map owns its
+    own BasemapTiles so that maps never share widget instances.
+    Args:
+        descriptors (dict, optional): Basemap descriptors keyed by name. Defaults to the ee_basemaps dictionary.
+        proxy (TileProxy, optional): A tile proxy the tiles are loaded through. Defaults to None.
+    """
+
+    def __init__(self, descriptors=None, proxy=None):
+        if descriptors is None:
+            descriptors = _ee_basemaps
+        self._descriptors = descriptors
+        self._layers = {}
+        self._upstream_urls = {}
+        self._proxy = proxy
+
+    def __getitem__(self, name):
+        layer = self._layers.get(name)
+        if layer is None:
+            descriptor = self._descriptors[name]
+            layer = basemap_to_layer(descriptor)
+            if "local" not in descriptor:
+                self._upstream_urls[name] = layer.url
+                if self._proxy is not None:
+                    layer.url = self._proxy.proxy_url(layer.url)
+            self._layers[name] = layer
+        return layer
+
+    def add(self, name, descriptor):
+        """Adds a basemap to this mapping only, e.g. a local tile package.
+        Args:
+            name (str): The name of the basemap.
+            descriptor (dict): The basemap descriptor.
+        """
+        if self._descriptors is _ee_basemaps:
+            self._descriptors = dict(_ee_basemaps)
+        self._descriptors[name] = descriptor
+        self._layers.pop(name, None)
+        self._upstream_urls.pop(name, None)
+
+    def set_proxy(self, proxy):
+        """Loads the tiles of every basemap, including the ones already built, through a tile proxy.
+        Args:
+            proxy (TileProxy): The tile proxy, or None to load the tiles from upstream again.
+        """
+        for name, url in self._upstream_urls.items():
+            layer = self._layers[name]
+            layer.url = proxy.proxy_url(url) if proxy is not None else url
+        self._proxy = proxy
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __iter__(self):
+        return iter(self._descriptors)
+
+    def __len__(self):
+        return len(self._descriptors)
+
+
+basemap_tiles = BasemapTiles()
 basemaps = Box(
     dict(zip(list(_ee_basemaps.keys()), list(_ee_basemaps.keys()))), frozen_box=True
 )
@@ -0,0 +1,237 @@
+"""Module for caching Earth Engine map IDs. ee_tile_layer() looks up the tile URL of an
+expression here before calling getMapId(), so rendering the same image with the same
+visualization parameters again does not need a server round trip.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from .perf import count
+
+# Earth Engine map IDs stop serving tiles after a few hours, so cached tile URLs are
+# only reused within this window.
+DEFAULT_MAP_ID_TTL = 4 * 60 * 60
+
+DEFAULT_MAP_ID_CACHE_SIZE = 256
+
+# The on-disk tier is shared by every kernel, so it holds more entries than memory.
+DEFAULT_MAP_ID_DISK_SIZE = 4096
+
+
+def normalize_vis_params(vis_params):
+    """Normalizes visualization parameters so that equivalent dictionaries compare equal.
+    Lists and tuples (e.g. bands, palette, min, max) are joined into the comma-separated
+    strings Earth Engine uses on the server.
+    Args:
+        vis_params (dict): The visualization parameters.
+    Returns:
+        str: A canonical JSON string of the visualization parameters.
+    """
+    normalized = {}
+    for key, value in (vis_params or {}).items():
+        if isinstance(value, (list, tuple)):
+            value = ",".join(str(item) for item in value)
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+class MapIdCache:
+    """An LRU cache of Earth Engine tile URLs with an optional on-disk tier.
+    Args:
+        max_size (int, optional): The maximum number of entries kept in memory. Defaults to 256.
+        ttl (float, optional): The number of seconds an entry stays valid. Defaults to 4 hours.
+        cache_dir (str, optional): A directory shared across kernels for the on-disk tier. Defaults to None (memory only).
+        max_disk_size (int, optional): The maximum number of entries kept on disk. Expired entries, then the oldest ones, are removed when an entry is written. Defaults to 4096.
+    """
+
+    def __init__(
+        self,
+        max_size=DEFAULT_MAP_ID_CACHE_SIZE,
+        ttl=DEFAULT_MAP_ID_TTL,
+        cache_dir=None,
+        max_disk_size=DEFAULT_MAP_ID_DISK_SIZE,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.max_disk_size = max_disk_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(image, vis_params=None):
+        """Builds the cache key of an image and its visualization parameters.
+        Args:
+            image (ee.Image): The image to render.
+            vis_params (dict, optional): The visualization parameters. Defaults to None.
+        Returns:
+            str: A hex digest of the serialized expression and the normalized vis_params.
+        """
+        text = image.serialize() + "\n" + normalize_vis_params(vis_params)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry["created"], entry["url_format"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_disk(self, key, created, url_format):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"created": created, "url_format": url_format}, f)
+        # Other kernels may read the same file, so it is replaced atomically.
+        os.replace(tmp_path, self._disk_path(key))
+        self._prune_disk()
+
+    def _prune_disk(self):
+        # Entries are written after a getMapId() round trip, so listing the directory
+        # here costs little. The modification time of a file is its creation time.
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith((".json", ".tmp")):
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            # Temporary files are left behind by kernels that died while writing.
+            if now - mtime >= self.ttl:
+                self._remove_disk(entry.path)
+            elif entry.name.endswith(".json"):
+                entries.append((mtime, entry.path))
+        entries.sort()
+        for _, path in entries[: max(len(entries) - self.max_disk_size, 0)]:
+            self._remove_disk(path)
+
+    @staticmethod
+    def _remove_disk(path):
+        try:
+            os.remove(path)
+        except OSError:
+            # Another kernel removed it first.
+            pass
+
+    def get(self, key):
+        """Returns the cached tile URL for a key, or None if it is missing or expired.
+        Args:
+            key (str): A key built with make_key().
+        Returns:
+            str: The tile URL format, or None.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        if self.cache_dir is not None:
+            entry = self._read_disk(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                with self._lock:
+                    self._store(key, entry)
+                    self.hits += 1
+                return entry[1]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, url_format):
+        """Adds a tile URL to the cache.
+        Args:
+            key (str): A key built with make_key().
+            url_format (str): The tile URL format returned by getMapId().
+        """
+        created = time.time()
+        with self._lock:
+            self._store(key, (created, url_format))
+        if self.cache_dir is not None:
+            try:
+                self._write_disk(key, created, url_format)
+            except OSError:
+                pass
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_url_format(self, image, vis_params=None):
+        """Returns the tile URL of an image, calling getMapId() only on a cache miss.
+        Args:
+            image (ee.Image): The image to render.
+            vis_params (dict, optional): The visualization parameters. Defaults to None.
+        Returns:
+            str: The tile URL format.
+        """
+        if vis_params is None:
+            vis_params = {}
+        key = self.make_key(image, vis_params)
+        url_format = self.get(key)
+        if url_format is None:
+            count("ee.getMapId")
+            map_id_dict = image.getMapId(dict(vis_params))
+            url_format = map_id_dict["tile_fetcher"].url_format
+            self.set(key, url_format)
+        return url_format
+
+    def clear(self, disk=False):
+        """Removes all entries and resets the counters.
+        Args:
+            disk (bool, optional): Whether to remove the on-disk entries as well. Defaults to False.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+        if disk and self.cache_dir is not None and os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".json"):
+                    self._remove_disk(os.path.join(self.cache_dir, name))
+
+    def stats(self):
+        """Returns the cache counters.
+        Returns:
+            dict: The number of hits, misses and entries, and the hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# The cache used by ee_tile_layer(). Set NCLPY_MAP_ID_CACHE_DIR to share map IDs
+# across kernels, or assign map_id_cache.cache_dir at runtime.
+map_id_cache = MapIdCache(cache_dir=os.environ.get("NCLPY_MAP_ID_CACHE_DIR"))
+
+
+def map_id_cache_stats():
+    """Returns the hit/miss counters of the map ID cache used by ee_tile_layer().
+    Returns:
+        dict: The number of hits, misses and entries, and the hit rate.
+    """
+    return map_id_cache.stats()
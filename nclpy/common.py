@@ -1,15 +1,44 @@
 """A module with some common functions to be used with ipyleaflet and folium.
 """
 
+import collections
 import os
-import ee
-import ipywidgets as widgets
-from ipyleaflet import WidgetControl
+
+from .perf import count, timed
+
+# Set once the Earth Engine session has been initialized in this process.
+_ee_initialized = False
+
+# Largest total size of the GeoJSON files whose parsed content read_geojson() keeps.
+# The parsed dicts and lists take several times the size of the file.
+GEOJSON_CACHE_BYTES = 64 * 1024 * 1024
+
+_geojson_cache = collections.OrderedDict()
+
+# Largest serialized size of the features geojson_to_ee() sends inline with a request.
+# Larger collections are uploaded as table assets when an asset id is given.
+EE_INLINE_BYTES = 1024 * 1024
 
 
 def ee_initialize(token_name="EARTHENGINE_TOKEN"):
-    """Authenticates Earth Engine and initialize an Earth Engine session"""
-    if ee.data._credentials is None:
+    """Authenticates Earth Engine and initialize an Earth Engine session.
+
+    Nothing happens at import time. Functions that talk to Earth Engine call this
+    on first use, and subsequent calls return immediately.
+    """
+    global _ee_initialized
+
+    if _ee_initialized:
+        return
+
+    import ee
+
+    if hasattr(ee.data, "is_initialized"):
+        initialized = ee.data.is_initialized()
+    else:
+        initialized = ee.data._credentials is not None
+
+    if not initialized:
         try:
             ee_token = os.environ.get(token_name)
             if ee_token is not None:
@@ -20,16 +49,18 @@ def ee_initialize(token_name="EARTHENGINE_TOKEN"):
                     with open(credential_file_path + "credentials", "w") as file:
                         file.write(credential)
 
+            count("ee.Initialize")
             ee.Initialize()
         except Exception:
             ee.Authenticate()
             ee.Initialize()
 
-
-ee_initialize()
+    _ee_initialized = True
 
 
 def tool_template(m=None):
+    import ipywidgets as widgets
+    from ipyleaflet import WidgetControl
 
     widget_width = "250px"
     padding = "0px 0px 0px 5px"  # upper, right, bottom, left
@@ -189,26 +220,151 @@ def tool_template(m=None):
         return toolbar_widget
 
 
-def geojson_to_ee(geo_json, geodesic=True):
+@timed()
+def read_geojson(in_geojson):
+    """Reads a GeoJSON file. The parsed content is reused until the file changes, for
+    the most recently read files up to a total file size of GEOJSON_CACHE_BYTES.
+    Args:
+        in_geojson (str): The file path to the GeoJSON.
+    Returns:
+        dict: The GeoJSON. It is shared between calls and must not be modified.
+    """
+    import json
+
+    path = os.path.abspath(in_geojson)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key in _geojson_cache:
+        _geojson_cache.move_to_end(key)
+        return _geojson_cache[key]
+
+    with open(path, encoding="utf-8") as f:
+        geojson = json.load(f)
+    if stat.st_size <= GEOJSON_CACHE_BYTES:
+        for cached in list(_geojson_cache):
+            if cached[0] == path:
+                del _geojson_cache[cached]
+        _geojson_cache[key] = geojson
+        while sum(cached[2] for cached in _geojson_cache) > GEOJSON_CACHE_BYTES:
+            _geojson_cache.popitem(last=False)
+    return geojson
+
+
+def chunk_features(features, max_bytes=EE_INLINE_BYTES):
+    """Splits features into consecutive chunks whose serialized size is at most max_bytes.
+    Args:
+        features (list): The GeoJSON features.
+        max_bytes (int, optional): The largest size of a chunk. A feature larger than this is put in a chunk of its own. Defaults to EE_INLINE_BYTES.
+    Returns:
+        list: The chunks, each a list of features.
+    """
+    import json
+
+    chunks = []
+    chunk = []
+    size = 0
+    for feature in features:
+        feature_size = len(json.dumps(feature, separators=(",", ":"))) + 1
+        if chunk and size + feature_size > max_bytes:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+        chunk.append(feature)
+        size += feature_size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def upload_geojson(
+    geo_json, asset_id, max_bytes=EE_INLINE_BYTES, wait=True, poll_interval=5
+):
+    """Uploads a GeoJSON FeatureCollection to Earth Engine table assets. The features are
+    exported in chunks of at most max_bytes, so no request carries the whole collection.
+    Args:
+        geo_json (dict | str): A GeoJSON FeatureCollection dictionary or file path.
+        asset_id (str): The asset id. With more than one chunk, the chunks are written to asset_id_0, asset_id_1, ...
+        max_bytes (int, optional): The largest serialized size of the features in one export. Defaults to EE_INLINE_BYTES.
+        wait (bool, optional): Whether to wait for the exports to finish. Defaults to True.
+        poll_interval (float, optional): The seconds between checks of the export status. Defaults to 5.
+    Raises:
+        RuntimeError: If an export fails or is cancelled.
+    Returns:
+        ee.FeatureCollection: The features, read from the uploaded assets.
+    """
+    import time
+
+    import ee
+
+    ee_initialize()
+
+    if not isinstance(geo_json, dict):
+        geo_json = read_geojson(geo_json)
+
+    chunks = chunk_features(geo_json["features"], max_bytes)
+    if len(chunks) == 1:
+        asset_ids = [asset_id]
+    else:
+        asset_ids = ["{}_{}".format(asset_id, i) for i in range(len(chunks))]
+
+    tasks = []
+    for chunk, chunk_id in zip(chunks, asset_ids):
+        task = ee.batch.Export.table.toAsset(
+            collection=ee.FeatureCollection(chunk),
+            description="nclpy_upload_{}".format(len(tasks)),
+            assetId=chunk_id,
+        )
+        task.start()
+        tasks.append(task)
+    count("ee.upload.chunks", len(tasks))
+
+    if wait:
+        for task in tasks:
+            status = task.status()
+            while status["state"] not in ("COMPLETED", "FAILED", "CANCELLED"):
+                time.sleep(poll_interval)
+                status = task.status()
+            if status["state"] != "COMPLETED":
+                raise RuntimeError(
+                    "Uploading {} failed: {}".format(
+                        status.get("description"), status.get("error_message")
+                    )
+                )
+
+    collection = ee.FeatureCollection(asset_ids[0])
+    for chunk_id in asset_ids[1:]:
+        collection = collection.merge(ee.FeatureCollection(chunk_id))
+    return collection
+
+
+@timed()
+def geojson_to_ee(geo_json, geodesic=True, asset_id=None, max_bytes=EE_INLINE_BYTES):
     """Converts a geojson to ee.Geometry()
     Args:
         geo_json (dict): A geojson geometry dictionary or file path.
         geodesic (bool, optional): Whether line segments should be interpreted as spherical geodesics. If false, indicates that line segments should be interpreted as planar lines in the specified CRS. If absent, defaults to true if the CRS is geographic (including the default EPSG:4326), or to false if the CRS is projected.
+        asset_id (str, optional): The table asset to upload a FeatureCollection larger than max_bytes to, see upload_geojson(). Defaults to None, which always sends the features inline.
+        max_bytes (int, optional): The largest serialized size of the features sent inline when asset_id is given. Defaults to EE_INLINE_BYTES.
     Returns:
         ee_object: An ee.Geometry object
     """
 
-    try:
+    import ee
 
-        import json
+    ee_initialize()
+
+    try:
 
         if not isinstance(geo_json, dict) and os.path.isfile(geo_json):
-            with open(os.path.abspath(geo_json), encoding="utf-8") as f:
-                geo_json = json.load(f)
+            geo_json = read_geojson(geo_json)
 
         if geo_json["type"] == "FeatureCollection":
-            features = ee.FeatureCollection(geo_json["features"])
-            return features
+            # The features are sent inline with every request that uses the collection,
+            # unless they are uploaded to a table asset.
+            if asset_id is not None:
+                if len(chunk_features(geo_json["features"], max_bytes)) > 1:
+                    return upload_geojson(geo_json, asset_id, max_bytes)
+            return ee.FeatureCollection(geo_json["features"])
         elif geo_json["type"] == "Feature":
             geom = None
             keys = geo_json["properties"]["style"].keys()
@@ -232,43 +388,159 @@ def geojson_to_ee(geo_json, geodesic=True):
         print("Could not convert the geojson to ee.Geometry()")
         raise Exception(e)
 
-def csv_to_shp(in_csv, out_shp=None, latitude="latitude", longitude="longitude"):
+
+def iter_shp_features(in_shp, chunk_size=None):
+    """Yields the features of a shapefile one at a time as GeoJSON dictionaries.
+    Point and polyline shapefiles are decoded with NumPy a chunk of records at a time,
+    other shapefiles one shape and record at a time with pyshp.
+    Args:
+        in_shp (str): The file path to the input shapefile.
+        chunk_size (int, optional): The number of records decoded at a time. Defaults to 100000.
+    Raises:
+        FileNotFoundError: If the input shapefile does not exist.
+    Yields:
+        dict: A GeoJSON feature.
+    """
+    import shapefile
+    from . import shp_io
+
+    in_shp = os.path.abspath(in_shp)
+
+    if not os.path.exists(in_shp):
+        raise FileNotFoundError("The provided shapefile could not be found.")
+
+    info = shp_io.shapefile_info(in_shp)
+    if info["shape_type"] in shp_io.READABLE_SHAPE_TYPES:
+        chunk_size = chunk_size or shp_io.DEFAULT_CHUNK_SIZE
+        for start in range(0, info["num_records"], chunk_size):
+            geojson = shp_io.read_shapefile(in_shp, start, start + chunk_size)
+            yield from geojson["features"]
+        return
+
+    with shapefile.Reader(in_shp) as sf:
+        for shape_record in sf.iterShapeRecords():
+            yield shape_record.__geo_interface__
+
+
+@timed()
+def shp_to_geojson(in_shp, out_geojson=None):
+    """Converts a shapefile to GeoJSON. When out_geojson is given, features are streamed to
+    the file one at a time, so memory use does not grow with the size of the shapefile.
+    Point and polyline shapefiles are decoded with NumPy, see shp_io.read_shapefile().
+    Args:
+        in_shp (str): The file path to the input shapefile.
+        out_geojson (str, optional): The file path to the output GeoJSON. Defaults to None.
+    Raises:
+        FileNotFoundError: If the input shapefile does not exist.
+    Returns:
+        dict: The dictionary of the GeoJSON.
+    """
+    import json
+    import shapefile
+
+    in_shp = os.path.abspath(in_shp)
+
+    if not os.path.exists(in_shp):
+        raise FileNotFoundError("The provided shapefile could not be found.")
+
+    if out_geojson is None:
+        from . import shp_io
+
+        if shp_io.shapefile_info(in_shp)["shape_type"] in shp_io.READABLE_SHAPE_TYPES:
+            return shp_io.read_shapefile(in_shp)
+        with shapefile.Reader(in_shp) as sf:
+            return sf.__geo_interface__
+    else:
+        out_geojson = os.path.abspath(out_geojson)
+        out_dir = os.path.dirname(out_geojson)
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+
+        with shapefile.Reader(in_shp) as sf:
+            bbox = json.dumps(list(sf.bbox))
+
+        with open(out_geojson, "w") as f:
+            f.write('{"type": "FeatureCollection", "bbox": %s, "features": [' % bbox)
+            for index, feature in enumerate(iter_shp_features(in_shp)):
+                if index > 0:
+                    f.write(", ")
+                f.write(json.dumps(feature))
+            f.write("]}")
+
+
+def download_from_url(url, out_file_name=None, out_dir="."):
+    """Downloads a file from a URL.
+    Args:
+        url (str): The URL of the file.
+        out_file_name (str, optional): The output file name. Defaults to the base name of the URL.
+        out_dir (str, optional): The output directory. Defaults to '.'.
+    Returns:
+        str: The file path to the downloaded file.
+    """
+    from urllib.request import urlretrieve
+
+    if out_file_name is None:
+        out_file_name = os.path.basename(url)
+    out_file = os.path.join(os.path.abspath(out_dir), out_file_name)
+    urlretrieve(url, out_file)
+    return out_file
+
+
+@timed()
+def csv_to_shp(
+    in_csv,
+    out_shp=None,
+    latitude="latitude",
+    longitude="longitude",
+    chunk_size=100000,
+    workers=None,
+    verbose=False,
+):
     """Converts a csv file with latlon info to a point shapefile.
+    The csv is processed in chunks with NumPy/pandas, and numeric, date and text fields are
+    typed and sized from the data instead of all being written as default text fields.
     Args:
         in_csv (str): The input csv file containing longitude and latitude columns.
-        out_shp (str): The file path to the output shapefile.
+        out_shp (str, optional): The file path to the output shapefile. Defaults to the input path with a .shp extension.
         latitude (str, optional): The column name of the latitude column. Defaults to 'latitude'.
         longitude (str, optional): The column name of the longitude column. Defaults to 'longitude'.
+        chunk_size (int, optional): The number of rows processed at a time. Defaults to 100000.
+        workers (int, optional): The number of processes used to analyze and encode chunks. Defaults to None (in-process).
+        verbose (bool, optional): Whether to print the conversion rate. Defaults to False.
+    Returns:
+        dict: The output shapefile path, the number of rows, the elapsed seconds and the rows per second.
     """
-    import shapefile as shp
+    from .shp_io import csv_to_points
 
     if in_csv.startswith("http") and in_csv.endswith(".csv"):
         out_dir = os.path.join(os.path.expanduser("~"), "Downloads")
-        out_name = os.path.basename(in_csv)
 
         if not os.path.exists(out_dir):
             os.makedirs(out_dir)
-        download_from_url(in_csv, out_dir=out_dir)
-        in_csv = os.path.join(out_dir, out_name)
+        in_csv = download_from_url(in_csv, out_dir=out_dir)
+
+    if out_shp is None:
+        out_shp = os.path.splitext(in_csv)[0] + ".shp"
+    out_shp = os.path.abspath(out_shp)
 
     out_dir = os.path.dirname(out_shp)
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
-    try:
-        points = shp.Writer(out_shp, shapeType=shp.POINT)
-        with open(in_csv, encoding="utf-8") as csvfile:
-            csvreader = csv.DictReader(csvfile)
-            header = csvreader.fieldnames
-            [points.field(field) for field in header]
-            for row in csvreader:
-                points.point((float(row[longitude])), (float(row[latitude])))
-                points.record(*tuple([row[f] for f in header]))
-
-        out_prj = out_shp.replace(".shp", ".prj")
-        with open(out_prj, "w") as f:
-            prj_str = 'GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137,298.257223563]],PRIMEM["Greenwich",0],UNIT["Degree",0.0174532925199433]] '
-            f.write(prj_str)
-
-    except Exception as e:
-        print(e)
+    stats = csv_to_points(
+        in_csv,
+        out_shp,
+        latitude=latitude,
+        longitude=longitude,
+        chunk_size=chunk_size,
+        workers=workers,
+    )
+    stats["out_shp"] = out_shp
+
+    if verbose:
+        print(
+            "Converted {} rows in {:.2f} seconds ({:,.0f} rows/sec).".format(
+                stats["rows"], stats["seconds"], stats["rows_per_sec"]
+            )
+        )
+    return stats
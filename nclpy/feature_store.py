@@ -0,0 +1,213 @@
+"""Module for keeping track of the features drawn on a map. Features are indexed by a stable
+id so that adding, editing and deleting a feature does not depend on the number of features.
+"""
+
+import json
+import os
+import uuid
+
+
+def feature_id(geo_json):
+    """Returns the id of a GeoJSON feature: its "id" member, or the "id" of its properties.
+    Args:
+        geo_json (dict): A GeoJSON feature.
+    Returns:
+        str: The id of the feature, or None if it has none.
+    """
+    if geo_json.get("id") is not None:
+        return str(geo_json["id"])
+    properties = geo_json.get("properties") or {}
+    if properties.get("id") is not None:
+        return str(properties["id"])
+    return None
+
+
+def geometry_key(geo_json):
+    """Returns a key identifying the shape of a GeoJSON feature: its geometry, and the radius
+    of a drawn circle.
+    Args:
+        geo_json (dict): A GeoJSON feature.
+    Returns:
+        str: The key.
+    """
+    style = (geo_json.get("properties") or {}).get("style") or {}
+    return json.dumps(
+        [geo_json.get("geometry"), style.get("radius")],
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+
+
+def with_id(geo_json, key):
+    """Returns a copy of a GeoJSON feature with its id written into its properties.
+    Args:
+        geo_json (dict): A GeoJSON feature.
+        key (str): The id.
+    Returns:
+        dict: The GeoJSON feature.
+    """
+    feature = dict(geo_json)
+    feature["properties"] = dict(geo_json.get("properties") or {}, id=key)
+    return feature
+
+
+class FeatureStore:
+    """An insertion-ordered store of GeoJSON features keyed by feature id.
+    Adding, editing, looking up and deleting a feature are O(1). Features without an id
+    are given one when they are added, written into their properties. Features are also
+    indexed by geometry, so the DrawControl's events, which carry no id, can be matched.
+    """
+
+    def __init__(self, features=None):
+        self._features = {}
+        self._geometries = {}
+        if features is not None:
+            self.load(features)
+
+    def __len__(self):
+        return len(self._features)
+
+    def __iter__(self):
+        return iter(list(self._features.values()))
+
+    def __contains__(self, key):
+        if isinstance(key, dict):
+            key = feature_id(key)
+        return key in self._features
+
+    def ids(self):
+        """Returns the ids of the stored features in insertion order.
+        Returns:
+            list: The feature ids.
+        """
+        return list(self._features)
+
+    def get(self, key, default=None):
+        """Returns the feature with the given id.
+        Args:
+            key (str): The feature id.
+            default (optional): The value returned if the id is missing. Defaults to None.
+        Returns:
+            dict: The GeoJSON feature, with its id in its properties.
+        """
+        return self._features.get(key, default)
+
+    def find(self, geo_json):
+        """Returns the id of a stored feature, matched by its id, or by its geometry if it has none.
+        Args:
+            geo_json (dict): A GeoJSON feature, e.g. from the DrawControl.
+        Returns:
+            str: The id of the feature, or None if it was not found.
+        """
+        key = feature_id(geo_json)
+        if key is not None:
+            return key if key in self._features else None
+        keys = self._geometries.get(geometry_key(geo_json))
+        return next(iter(keys)) if keys else None
+
+    def _put(self, key, geo_json):
+        self._unindex(key)
+        feature = with_id(geo_json, key)
+        self._features[key] = feature
+        self._geometries.setdefault(geometry_key(feature), {})[key] = None
+
+    def _unindex(self, key):
+        feature = self._features.get(key)
+        if feature is None:
+            return
+        geometry = geometry_key(feature)
+        keys = self._geometries[geometry]
+        del keys[key]
+        if not keys:
+            del self._geometries[geometry]
+
+    def add(self, geo_json):
+        """Adds a new feature. A feature without an id, or with the id of a stored one,
+        gets a new id.
+        Args:
+            geo_json (dict): The GeoJSON feature.
+        Returns:
+            str: The id of the added feature.
+        """
+        key = feature_id(geo_json)
+        if key is None:
+            key = uuid.uuid4().hex[:16]
+        elif key in self._features:
+            base, count = key, 1
+            while key in self._features:
+                key = "{}-{}".format(base, count)
+                count += 1
+        self._put(key, geo_json)
+        return key
+
+    def edit(self, geo_json, key=None):
+        """Replaces a stored feature, or adds it if its id is unknown.
+        Args:
+            geo_json (dict): The edited GeoJSON feature.
+            key (str, optional): The id of the feature to replace. Defaults to the id of geo_json.
+        Returns:
+            str: The id of the feature.
+        """
+        if key is None:
+            key = feature_id(geo_json)
+        if key not in self._features:
+            return self.add(geo_json)
+        self._put(key, geo_json)
+        return key
+
+    def remove(self, key):
+        """Removes a feature.
+        Args:
+            key (str|dict): The feature id, or the GeoJSON feature itself, see find().
+        Returns:
+            str: The id of the removed feature, or None if it was not found.
+        """
+        if isinstance(key, dict):
+            key = self.find(key)
+        if key not in self._features:
+            return None
+        self._unindex(key)
+        del self._features[key]
+        return key
+
+    def clear(self):
+        """Removes all features."""
+        self._features.clear()
+        self._geometries.clear()
+
+    def load(self, features):
+        """Adds features in bulk.
+        Args:
+            features (dict|list|str): A GeoJSON FeatureCollection, a list of features or a file path.
+        Returns:
+            list: The ids of the added features.
+        """
+        if isinstance(features, str):
+            with open(os.path.abspath(features), encoding="utf-8") as f:
+                features = json.load(f)
+        if isinstance(features, dict):
+            features = features["features"]
+        return [self.add(feature) for feature in features]
+
+    def to_geojson(self, out_geojson=None):
+        """Exports the features as a GeoJSON FeatureCollection. Each feature carries its id.
+        Args:
+            out_geojson (str, optional): The file path to the output GeoJSON. Defaults to None.
+        Returns:
+            dict: The GeoJSON FeatureCollection.
+        """
+        features = []
+        for key, feature in self._features.items():
+            feature = dict(feature)
+            feature["id"] = key
+            features.append(feature)
+        geojson = {"type": "FeatureCollection", "features": features}
+
+        if out_geojson is not None:
+            out_geojson = os.path.abspath(out_geojson)
+            out_dir = os.path.dirname(out_geojson)
+            if not os.path.exists(out_dir):
+                os.makedirs(out_dir)
+            with open(out_geojson, "w") as f:
+                f.write(json.dumps(geojson))
+        return geojson
@@ -1,9 +1,16 @@
 """This module lets you draw shapes and generate random points inside."""
-import ee
-import ipywidgets as widgets
+import math
+
+import numpy as np
+
 from .common import ee_initialize
 
-ee_initialize()
+# Maximum number of dart-throwing rounds used to fill a region in the Poisson-disk mode.
+POISSON_ROUNDS = 16
+
+# Maximum number of background grid cells in the Poisson-disk mode. Each cell takes
+# about 100 bytes while sampling.
+POISSON_MAX_CELLS = 4000000
 
 
 def random_points(region, color="00FFFF", points=100, seed=0):
@@ -14,6 +21,9 @@ def random_points(region, color="00FFFF", points=100, seed=0):
           seed:(numeric): default is 0
     Returns: a feature collection of locations
     """
+    import ee
+
+    ee_initialize()
 
     if not isinstance(region, ee.Geometry):
         err_str = "\n\nThe region of interest must be an ee.Geometry."
@@ -30,3 +40,212 @@ def random_points(region, color="00FFFF", points=100, seed=0):
         region=region, points=points, seed=seed
     )
     return points_rand
+
+
+def _local_region(roi):
+    # Returns the region in an equirectangular projection centered on it, where one unit
+    # is one degree of latitude in both directions, and the longitude scale factor.
+    import shapely
+    from .spatial_index import roi_to_geometry
+
+    geometry = roi_to_geometry(roi)
+    scale = max(math.cos(math.radians(geometry.centroid.y)), 1e-6)
+    region = shapely.transform(geometry, lambda coords: coords * [scale, 1.0])
+    shapely.prepare(region)
+    return region, scale
+
+
+def _inside(region, xy):
+    import shapely
+
+    return xy[shapely.contains_xy(region, xy[:, 0], xy[:, 1])]
+
+
+def _uniform(region, points, rng):
+    xmin, ymin, xmax, ymax = region.bounds
+    acceptance = max(region.area / ((xmax - xmin) * (ymax - ymin)), 1e-3)
+    batches = []
+    count = 0
+    while count < points:
+        # Each batch is sized from the share of the bounding box covered by the region,
+        # so a single batch is usually enough.
+        size = int((points - count) / acceptance * 1.1) + 16
+        xy = rng.uniform([xmin, ymin], [xmax, ymax], (size, 2))
+        xy = _inside(region, xy)
+        batches.append(xy)
+        count += len(xy)
+    return np.concatenate(batches)[:points]
+
+
+def _stratified(region, points, rng):
+    xmin, ymin, xmax, ymax = region.bounds
+    cell = math.sqrt(region.area / points)
+    while True:
+        # One jittered point per cell of a grid with about `points` cells in the region.
+        columns = max(int(math.ceil((xmax - xmin) / cell)), 1)
+        rows = max(int(math.ceil((ymax - ymin) / cell)), 1)
+        i, j = np.meshgrid(np.arange(columns), np.arange(rows))
+        corners = np.column_stack([xmin + i.ravel() * cell, ymin + j.ravel() * cell])
+        xy = _inside(region, corners + rng.uniform(0, cell, corners.shape))
+        if len(xy) >= points:
+            return xy[np.sort(rng.choice(len(xy), points, replace=False))]
+        cell *= 0.9
+
+
+def _poisson_disk(region, points, min_distance, rng):
+    import shapely
+
+    xmin, ymin, xmax, ymax = region.bounds
+    if min_distance is None:
+        # A maximal Poisson-disk sample holds about 0.7 / r^2 points per unit area, so
+        # this distance leaves room for more points than needed.
+        min_distance = math.sqrt(0.5 * region.area / points)
+
+    # Cells are small enough to hold a single point, so the grid stores point indices,
+    # -1 for empty cells and -2 for cells that are too close to a point to take one.
+    cell = min_distance / math.sqrt(2)
+    columns = int(math.ceil((xmax - xmin) / cell)) + 1
+    rows = int(math.ceil((ymax - ymin) / cell)) + 1
+    if rows * columns > POISSON_MAX_CELLS:
+        raise ValueError(
+            "The Poisson-disk grid would have {} cells, more than the limit of {} "
+            "(POISSON_MAX_CELLS). Use a larger min_distance or fewer points.".format(
+                rows * columns, POISSON_MAX_CELLS
+            )
+        )
+    grid = np.full((rows + 4, columns + 4), -1, dtype="int64")
+    xy = np.empty((rows * columns, 2))
+    count = 0
+    # Neighbor cells that can hold a point closer than min_distance. The corners of the
+    # 5 x 5 block are too far away.
+    offsets = np.array(
+        [(a, b) for a in range(-2, 3) for b in range(-2, 3) if abs(a) + abs(b) < 4]
+    )
+
+    # Only cells that overlap the region are ever tried.
+    j, i = np.divmod(np.arange(rows * columns), columns)
+    centers_x = xmin + (i + 0.5) * cell
+    centers_y = ymin + (j + 0.5) * cell
+    near = shapely.buffer(region, cell)
+    shapely.prepare(near)
+    keep = shapely.contains_xy(near, centers_x, centers_y)
+    j, i = j[keep], i[keep]
+
+    # Cells three apart cannot hold conflicting points, so each of the nine phases throws
+    # one dart in each of its empty cells at once.
+    phase = (j % 3) * 3 + i % 3
+    phases = [(j[phase == k], i[phase == k]) for k in range(9)]
+    for _ in range(POISSON_ROUNDS):
+        round_start = count
+        for k, (j, i) in enumerate(phases):
+            empty = grid[j + 2, i + 2] == -1
+            j, i = j[empty], i[empty]
+            phases[k] = (j, i)
+            if len(j) == 0:
+                continue
+            darts = np.column_stack(
+                [
+                    xmin + (i + rng.random(len(i))) * cell,
+                    ymin + (j + rng.random(len(j))) * cell,
+                ]
+            )
+            neighbors = grid[
+                j[:, None] + 2 + offsets[:, 0], i[:, None] + 2 + offsets[:, 1]
+            ]
+            # Distances are only computed for the neighbor cells that hold a point.
+            dart, slot = np.nonzero(neighbors >= 0)
+            near = xy[neighbors[dart, slot]]
+            delta = near - darts[dart]
+            close = (delta**2).sum(axis=1) < min_distance**2
+            ok = np.bincount(dart[close], minlength=len(darts)) == 0
+
+            # A cell lying entirely within min_distance of a point can never take one.
+            corner = np.column_stack([xmin + i[dart] * cell, ymin + j[dart] * cell])
+            far = np.maximum(np.abs(near - corner), np.abs(near - corner - cell))
+            covered = (far**2).sum(axis=1) < min_distance**2
+            covered = np.bincount(dart[covered], minlength=len(darts)) > 0
+            grid[j[covered] + 2, i[covered] + 2] = -2
+            ok[ok] = shapely.contains_xy(region, darts[ok, 0], darts[ok, 1])
+            accepted = int(ok.sum())
+            grid[j[ok] + 2, i[ok] + 2] = np.arange(count, count + accepted)
+            xy[count : count + accepted] = darts[ok]
+            count += accepted
+        if points is not None and count >= points:
+            break
+        if count - round_start < 0.001 * count:
+            break
+
+    xy = xy[:count]
+    if points is not None and len(xy) > points:
+        xy = xy[np.sort(rng.choice(len(xy), points, replace=False))]
+    return xy
+
+
+def random_points_local(roi, points=100, seed=0, mode="uniform", min_distance=None):
+    """Generates random points inside a region of interest locally, without Earth Engine.
+    Points are sampled in batches with NumPy and tested against the region with a single
+    vectorized point-in-polygon call per batch. Sampling is uniform on the ground, not in
+    degrees, so points do not bunch up towards the poles.
+    Args:
+        roi (dict): A GeoJSON feature or geometry, e.g. Map.user_roi. Drawn circles are supported.
+        points (int, optional): The number of points. In the 'poisson' mode with a min_distance, None fills the region. Defaults to 100.
+        seed (int, optional): The random seed. The same seed always yields the same points. Defaults to 0.
+        mode (str, optional): 'uniform' for independent points, 'stratified' for one jittered point per cell of a grid, or 'poisson' for points at least min_distance apart. Defaults to 'uniform'.
+        min_distance (float, optional): The minimum distance between points in meters in the 'poisson' mode. Defaults to None (derived from the number of points).
+    Raises:
+        ValueError: If the number of points is negative or missing, the mode is unknown, the region has no area, or min_distance is so small that the 'poisson' grid would exceed POISSON_MAX_CELLS.
+    Returns:
+        numpy.ndarray: An (n, 2) array of longitude/latitude pairs. The 'poisson' mode returns fewer points when no more fit.
+    """
+    from .spatial_index import METERS_PER_DEGREE
+
+    if points is None:
+        if mode != "poisson" or min_distance is None:
+            raise ValueError(
+                "The number of points is required, except in the 'poisson' mode "
+                "with a min_distance."
+            )
+    elif points < 0:
+        raise ValueError("The number of points must not be negative.")
+
+    region, scale = _local_region(roi)
+    if region.area <= 0:
+        raise ValueError("The region of interest must be a polygon or a circle.")
+    if points == 0:
+        return np.empty((0, 2))
+
+    rng = np.random.default_rng(seed)
+    if mode == "uniform":
+        xy = _uniform(region, points, rng)
+    elif mode == "stratified":
+        xy = _stratified(region, points, rng)
+    elif mode == "poisson":
+        if min_distance is not None:
+            min_distance = min_distance / METERS_PER_DEGREE
+        xy = _poisson_disk(region, points, min_distance, rng)
+    else:
+        raise ValueError(
+            "The mode must be one of 'uniform', 'stratified' or 'poisson'."
+        )
+
+    return xy / [scale, 1.0]
+
+
+def points_to_geojson(coords):
+    """Converts an array of longitude/latitude pairs to a GeoJSON FeatureCollection.
+    Args:
+        coords (numpy.ndarray): An (n, 2) array of longitude/latitude pairs.
+    Returns:
+        dict: The GeoJSON FeatureCollection.
+    """
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {},
+                "geometry": {"type": "Point", "coordinates": point},
+            }
+            for point in np.asarray(coords).tolist()
+        ],
+    }
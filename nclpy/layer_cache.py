@@ -0,0 +1,466 @@
+"""Module for caching parsed vector files on disk. The first time a shapefile or GeoJSON file
+is loaded, its features are stored as flat NumPy arrays (coordinates plus offsets, in the
+spirit of GeoArrow) and JSON columns of properties. Later loads of the same unmodified
+file read those arrays back, memory-mapped, instead of parsing the file again.
+
+A cache hit returns the same features as a miss, with two restrictions: coordinates come
+back as lists of floats, and property values that are tuples come back as lists. Dates and
+datetimes are kept as such; files with other values that JSON cannot store are not cached.
+"""
+
+import datetime
+import gc
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_LAYER_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "nclpy", "layers"
+)
+
+DEFAULT_LAYER_CACHE_SIZE = 1024 * 1024 * 1024
+
+# Each geometry is stored as features -> parts -> rings -> coordinates. The type code and
+# the depth at which the GeoJSON coordinates start tell how to nest them back.
+GEOMETRY_TYPES = {
+    None: 0,
+    "Point": 1,
+    "MultiPoint": 2,
+    "LineString": 3,
+    "MultiLineString": 4,
+    "Polygon": 5,
+    "MultiPolygon": 6,
+    "GeometryCollection": 7,
+}
+_GEOMETRY_NAMES = {code: name for name, code in GEOMETRY_TYPES.items()}
+
+ARRAYS = ["types", "feature_offsets", "part_offsets", "ring_offsets", "coords"]
+
+
+def _parts(geometry_type, coordinates):
+    if geometry_type == "Point":
+        return [[[coordinates]]]
+    if geometry_type in ("MultiPoint", "LineString"):
+        return [[coordinates]]
+    if geometry_type in ("MultiLineString", "Polygon"):
+        return [coordinates]
+    if geometry_type == "MultiPolygon":
+        return coordinates
+    return []
+
+
+def _unparts(geometry_type, parts):
+    if geometry_type == "Point":
+        return parts[0][0][0]
+    if geometry_type in ("MultiPoint", "LineString"):
+        return parts[0][0]
+    if geometry_type in ("MultiLineString", "Polygon"):
+        return parts[0]
+    return parts
+
+
+def encode_features(geojson):
+    """Converts a GeoJSON FeatureCollection to flat arrays and property columns.
+    Args:
+        geojson (dict): A GeoJSON FeatureCollection.
+    Returns:
+        tuple: A dict of NumPy arrays and a JSON-serializable dict of the rest.
+    """
+    features = geojson.get("features", [])
+    types = np.zeros(len(features), dtype="int8")
+    feature_offsets = [0]
+    part_offsets = [0]
+    ring_offsets = [0]
+    coords = []
+    collections = {}
+
+    for index, feature in enumerate(features):
+        geometry = feature.get("geometry")
+        geometry_type = geometry.get("type") if geometry else None
+        types[index] = GEOMETRY_TYPES.get(geometry_type, 0)
+        if geometry_type == "GeometryCollection":
+            collections[str(index)] = geometry
+        else:
+            for part in _parts(geometry_type, geometry and geometry["coordinates"]):
+                for ring in part:
+                    coords.extend(ring)
+                    ring_offsets.append(len(coords))
+                part_offsets.append(len(ring_offsets) - 1)
+        feature_offsets.append(len(part_offsets) - 1)
+
+    dim = len(coords[0]) if len(coords) > 0 else 2
+    arrays = {
+        "types": types,
+        "feature_offsets": np.array(feature_offsets, dtype="int64"),
+        "part_offsets": np.array(part_offsets, dtype="int64"),
+        "ring_offsets": np.array(ring_offsets, dtype="int64"),
+        "coords": np.array(coords, dtype="float64").reshape(-1, dim),
+    }
+
+    properties = [feature.get("properties") or {} for feature in features]
+    names = list(properties[0]) if len(properties) > 0 else []
+    if all(list(p) == names for p in properties):
+        columns = {name: [p[name] for p in properties] for name in names}
+        records = None
+    else:
+        columns = None
+        records = properties
+
+    ids = [feature.get("id") for feature in features]
+    members = {
+        key: value for key, value in geojson.items() if key not in ("type", "features")
+    }
+    table = {
+        "columns": columns,
+        "records": records,
+        "ids": ids if any(i is not None for i in ids) else None,
+        "collections": collections,
+        "members": members,
+    }
+    return arrays, table
+
+
+def decode_features(arrays, table):
+    """Converts the arrays and property columns built by encode_features() back to GeoJSON.
+    Args:
+        arrays (dict): The NumPy arrays.
+        table (dict): The property columns and other members.
+    Returns:
+        dict: The GeoJSON FeatureCollection.
+    """
+    # Millions of small lists and dicts are created here and none of them form cycles,
+    # so the cyclic garbage collector would only rescan them over and over.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _decode_features(arrays, table)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _decode_features(arrays, table):
+    types = arrays["types"].tolist()
+    feature_offsets = arrays["feature_offsets"].tolist()
+    part_offsets = arrays["part_offsets"].tolist()
+    ring_offsets = arrays["ring_offsets"].tolist()
+    coords = arrays["coords"].tolist()
+    rings = [
+        coords[start:end] for start, end in zip(ring_offsets[:-1], ring_offsets[1:])
+    ]
+    parts = [
+        rings[start:end] for start, end in zip(part_offsets[:-1], part_offsets[1:])
+    ]
+
+    columns = table.get("columns")
+    records = table.get("records")
+    ids = table.get("ids")
+    collections = table.get("collections") or {}
+    if records is None:
+        names = list(columns)
+        if len(names) > 0:
+            records = [dict(zip(names, row)) for row in zip(*columns.values())]
+        else:
+            records = [{} for _ in types]
+
+    features = []
+    for index, code in enumerate(types):
+        geometry_type = _GEOMETRY_NAMES.get(code)
+        if geometry_type == "GeometryCollection":
+            geometry = collections[str(index)]
+        elif geometry_type is None:
+            geometry = None
+        else:
+            start, end = feature_offsets[index], feature_offsets[index + 1]
+            geometry = {
+                "type": geometry_type,
+                "coordinates": _unparts(geometry_type, parts[start:end]),
+            }
+        feature = {
+            "type": "Feature",
+            "properties": records[index],
+            "geometry": geometry,
+        }
+        if ids is not None and ids[index] is not None:
+            feature["id"] = ids[index]
+        features.append(feature)
+
+    geojson = {"type": "FeatureCollection"}
+    geojson.update(table.get("members") or {})
+    geojson["features"] = features
+    return geojson
+
+
+def _encode_value(value):
+    # Tags the property values that JSON has no type for, so they are decoded as they
+    # were read instead of as strings.
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"__date__": value.isoformat()}
+    raise TypeError("{} values cannot be cached.".format(type(value).__name__))
+
+
+def _decode_value(obj):
+    if len(obj) == 1:
+        if "__datetime__" in obj:
+            return datetime.datetime.fromisoformat(obj["__datetime__"])
+        if "__date__" in obj:
+            return datetime.date.fromisoformat(obj["__date__"])
+    return obj
+
+
+def read_vector(in_file):
+    """Parses a shapefile or GeoJSON file.
+    Args:
+        in_file (str): The file path to the shapefile (.shp) or GeoJSON.
+    Returns:
+        dict: The GeoJSON FeatureCollection.
+    """
+    if in_file.lower().endswith(".shp"):
+        from .common import shp_to_geojson
+
+        return shp_to_geojson(in_file)
+
+    with open(in_file) as f:
+        return json.load(f)
+
+
+class LayerCache:
+    """A size-bounded on-disk cache of parsed vector files.
+    Entries are keyed on the absolute path, modification time and size of the source file,
+    so editing a file invalidates its entry. The least recently used entries are removed
+    once the cache grows beyond max_size.
+    Args:
+        cache_dir (str, optional): The cache directory. Defaults to ~/.cache/nclpy/layers.
+        max_size (int, optional): The maximum size of the cache in bytes. Defaults to 1 GB.
+    """
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_LAYER_CACHE_SIZE):
+        self.cache_dir = cache_dir or DEFAULT_LAYER_CACHE_DIR
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(in_file):
+        """Builds the cache key of a file from its path, modification time and size.
+        The .dbf of a shapefile is part of the key.
+        Args:
+            in_file (str): The file path.
+        Returns:
+            str: The hex digest of the key.
+        """
+        in_file = os.path.abspath(in_file)
+        paths = [in_file]
+        if in_file.lower().endswith(".shp"):
+            # The attributes of a shapefile live in its .dbf, which can change on its own.
+            paths.append(in_file[:-4] + ".dbf")
+        text = in_file
+        for path in paths:
+            if os.path.exists(path):
+                stat = os.stat(path)
+                text += "\n{}\n{}".format(stat.st_mtime_ns, stat.st_size)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _read_meta(self, entry_dir):
+        try:
+            with open(os.path.join(entry_dir, "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def read_arrays(self, in_file, mmap_mode="r"):
+        """Returns the cached arrays and property columns of a file, or None if it is not cached.
+        Args:
+            in_file (str): The file path.
+            mmap_mode (str, optional): The mode used to memory-map the arrays, or None to read them. Defaults to 'r'.
+        Returns:
+            tuple: A dict of NumPy arrays and a dict of property columns, or None.
+        """
+        entry_dir = self._entry_dir(self.make_key(in_file))
+        try:
+            arrays = {
+                name: np.load(
+                    os.path.join(entry_dir, name + ".npy"), mmap_mode=mmap_mode
+                )
+                for name in ARRAYS
+            }
+            with open(os.path.join(entry_dir, "table.json"), encoding="utf-8") as f:
+                table = json.load(f, object_hook=_decode_value)
+            # The modification time of meta.json records when the entry was last used.
+            os.utime(os.path.join(entry_dir, "meta.json"))
+        except (OSError, ValueError):
+            return None
+        return arrays, table
+
+    def write(self, in_file, geojson):
+        """Stores the parsed features of a file.
+        Args:
+            in_file (str): The file path.
+            geojson (dict): The GeoJSON FeatureCollection parsed from the file.
+        Raises:
+            TypeError: If a property value cannot be stored.
+        Returns:
+            str: The cache key.
+        """
+        in_file = os.path.abspath(in_file)
+        key = self.make_key(in_file)
+        arrays, table = encode_features(geojson)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, name + ".npy"), array)
+            with open(os.path.join(tmp_dir, "table.json"), "w", encoding="utf-8") as f:
+                json.dump(table, f, default=_encode_value)
+            meta = {
+                "source": in_file,
+                "features": len(arrays["types"]),
+                "vertices": len(arrays["coords"]),
+                "created": time.time(),
+                "bytes": sum(
+                    os.path.getsize(os.path.join(tmp_dir, name))
+                    for name in os.listdir(tmp_dir)
+                ),
+            }
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            # Other kernels may read the same entry, so it only appears once complete.
+            os.replace(tmp_dir, self._entry_dir(key))
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return key
+        except TypeError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        for entry in self.info():
+            if entry["source"] == in_file and entry["key"] != key:
+                self._remove_entry(entry["key"])
+        self.evict()
+        return key
+
+    def load(self, in_file):
+        """Returns the features of a shapefile or GeoJSON file, parsing it only on a cache miss.
+        A hit reads the coordinates from memory-mapped arrays instead of parsing the file,
+        but still builds the full GeoJSON FeatureCollection as Python lists and dicts.
+        Args:
+            in_file (str): The file path to the shapefile (.shp) or GeoJSON.
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        Returns:
+            dict: The GeoJSON FeatureCollection.
+        """
+        if not os.path.exists(in_file):
+            raise FileNotFoundError("The provided file could not be found.")
+
+        cached = self.read_arrays(in_file)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            return decode_features(*cached)
+
+        with self._lock:
+            self.misses += 1
+        geojson = read_vector(in_file)
+        try:
+            self.write(in_file, geojson)
+        except (OSError, ValueError, TypeError):
+            # Files that cannot be stored, e.g. with mixed coordinate dimensions, are
+            # simply parsed again next time.
+            pass
+        return geojson
+
+    def info(self):
+        """Lists the cached files.
+        Returns:
+            list: A dict per entry with its key, source file, number of features and vertices, size in bytes and last use, most recently used first.
+        """
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self._entry_dir(key)
+            meta = self._read_meta(entry_dir)
+            if meta is None:
+                continue
+            meta["key"] = key
+            try:
+                meta["last_used"] = os.path.getmtime(
+                    os.path.join(entry_dir, "meta.json")
+                )
+            except OSError:
+                continue
+            entries.append(meta)
+        entries.sort(key=lambda entry: entry["last_used"], reverse=True)
+        return entries
+
+    def _remove_entry(self, key):
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def remove(self, in_file):
+        """Removes the entries of a file.
+        Args:
+            in_file (str): The file path.
+        """
+        in_file = os.path.abspath(in_file)
+        for entry in self.info():
+            if entry["source"] == in_file:
+                self._remove_entry(entry["key"])
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in max_size."""
+        total = 0
+        for entry in self.info():
+            total += entry["bytes"]
+            if total > self.max_size:
+                self._remove_entry(entry["key"])
+
+    def clear(self):
+        """Removes all entries and resets the counters."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+        for entry in self.info():
+            self._remove_entry(entry["key"])
+
+    def stats(self):
+        """Returns the cache counters.
+        Returns:
+            dict: The number of hits, misses and entries, the size in bytes and the hit rate.
+        """
+        entries = self.info()
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(entries),
+                "bytes": sum(entry["bytes"] for entry in entries),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# The cache used by Map.add_shapefile() and Map.add_geojson(). Set NCLPY_LAYER_CACHE_DIR
+# to move it, or assign layer_cache.cache_dir at runtime.
+layer_cache = LayerCache(cache_dir=os.environ.get("NCLPY_LAYER_CACHE_DIR"))
+
+
+def layer_cache_info():
+    """Lists the files in the layer cache used by add_shapefile() and add_geojson().
+    Returns:
+        list: A dict per entry with its source file, size in bytes and last use.
+    """
+    return layer_cache.info()
@@ -0,0 +1,249 @@
+"""Module for offline basemaps read from local tile packages: MBTiles files (SQLite) and
+directory pyramids laid out as {z}/{x}/{y}.png. Tiles are served to the map by the kernel's
+tile proxy (see the tile_proxy module), from a pool of read-only SQLite connections and an
+in-memory cache of recently used tiles.
+"""
+
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Size of the in-memory cache of recently used tiles, shared by all local sources.
+HOT_TILE_CACHE_SIZE = 64 * 1024 * 1024
+
+MBTILES_POOL_SIZE = 4
+
+TILE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".pbf")
+
+
+class MemoryTileCache:
+    """A size-bounded in-memory LRU cache of tiles.
+    Args:
+        max_size (int, optional): The maximum size of the cache in bytes. Defaults to 64 MB.
+    """
+
+    def __init__(self, max_size=HOT_TILE_CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def get(self, tile):
+        """Returns a cached tile, or None if it is not cached."""
+        with self._lock:
+            data = self._tiles.get(tile)
+            if data is None:
+                self.misses += 1
+                return None
+            self._tiles.move_to_end(tile)
+            self.hits += 1
+            return data
+
+    def put(self, tile, data):
+        """Adds a tile, removing the least recently used tiles beyond max_size."""
+        if len(data) > self.max_size:
+            return
+        with self._lock:
+            old = self._tiles.pop(tile, None)
+            if old is not None:
+                self.size -= len(old)
+            self._tiles[tile] = data
+            self.size += len(data)
+            while self.size > self.max_size:
+                _, old = self._tiles.popitem(last=False)
+                self.size -= len(old)
+
+
+class MBTilesSource:
+    """A tile source reading an MBTiles file. Rows are counted from the south, unless the
+    metadata sets the scheme to 'xyz'.
+    Args:
+        path (str): The path to the .mbtiles file.
+        pool_size (int, optional): The maximum number of open SQLite connections. Defaults to 4.
+    """
+
+    def __init__(self, path, pool_size=MBTILES_POOL_SIZE):
+        self.path = os.path.abspath(path)
+        if not os.path.isfile(self.path):
+            raise FileNotFoundError("The file {} does not exist.".format(path))
+        self.key = _source_key(self.path)
+        self._pool = queue.LifoQueue()
+        self._semaphore = threading.BoundedSemaphore(pool_size)
+        self.metadata = self._read_metadata()
+        self.tms = str(self.metadata.get("scheme", "tms")).lower() != "xyz"
+
+    def _connect(self):
+        uri = "file:{}?mode=ro".format(self.path)
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def _query(self, sql, params=()):
+        # Connections are borrowed from the pool, and only opened when all the open ones
+        # are in use.
+        with self._semaphore:
+            try:
+                connection = self._pool.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            try:
+                return connection.execute(sql, params).fetchall()
+            finally:
+                self._pool.put(connection)
+
+    def _read_metadata(self):
+        try:
+            rows = self._query("SELECT name, value FROM metadata")
+        except sqlite3.DatabaseError as e:
+            raise ValueError("{} is not an MBTiles file: {}".format(self.path, e))
+        metadata = dict(rows)
+        if "minzoom" not in metadata or "maxzoom" not in metadata:
+            zooms = self._query("SELECT MIN(zoom_level), MAX(zoom_level) FROM tiles")
+            if zooms[0][0] is None:
+                raise ValueError("{} does not have any tiles.".format(self.path))
+            metadata.setdefault("minzoom", zooms[0][0])
+            metadata.setdefault("maxzoom", zooms[0][1])
+        return metadata
+
+    def get_tile(self, z, x, y):
+        """Returns a tile.
+        Args:
+            z (int): The zoom level.
+            x (int): The tile column.
+            y (int): The tile row, counted from the north as in XYZ URLs.
+        Returns:
+            bytes: The tile, or None if the file does not have it.
+        """
+        if self.tms:
+            y = (1 << z) - 1 - y
+        rows = self._query(
+            "SELECT tile_data FROM tiles "
+            "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, y),
+        )
+        return bytes(rows[0][0]) if rows else None
+
+    def close(self):
+        """Closes the pooled connections."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class DirectorySource:
+    """A tile source reading a directory pyramid laid out as {z}/{x}/{y}.ext.
+    Args:
+        path (str): The root directory of the pyramid.
+        tms (bool, optional): Whether rows are counted from the south, as in TMS pyramids. Defaults to False.
+    """
+
+    def __init__(self, path, tms=False):
+        self.path = os.path.abspath(path)
+        if not os.path.isdir(self.path):
+            raise FileNotFoundError("The directory {} does not exist.".format(path))
+        self.key = _source_key(self.path, tms)
+        self.tms = tms
+        zooms = sorted(int(name) for name in os.listdir(self.path) if name.isdigit())
+        if not zooms:
+            raise ValueError("{} is not a tile pyramid.".format(path))
+        self.extension = self._find_extension(zooms[0])
+        self.metadata = {"minzoom": zooms[0], "maxzoom": zooms[-1]}
+
+    def _find_extension(self, zoom):
+        zoom_dir = os.path.join(self.path, str(zoom))
+        for column in os.listdir(zoom_dir):
+            column_dir = os.path.join(zoom_dir, column)
+            if os.path.isdir(column_dir):
+                for name in os.listdir(column_dir):
+                    extension = os.path.splitext(name)[1].lower()
+                    if extension in TILE_EXTENSIONS:
+                        return extension
+        return ".png"
+
+    def get_tile(self, z, x, y):
+        """Returns a tile.
+        Args:
+            z (int): The zoom level.
+            x (int): The tile column.
+            y (int): The tile row, counted from the north as in XYZ URLs.
+        Returns:
+            bytes: The tile, or None if the pyramid does not have it.
+        """
+        if self.tms:
+            y = (1 << z) - 1 - y
+        path = os.path.join(self.path, str(z), str(x), str(y) + self.extension)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def close(self):
+        pass
+
+
+def _source_key(path, tms=False):
+    if tms:
+        path += "\ntms"
+    return "local-" + hashlib.sha1(path.encode("utf-8")).hexdigest()[:12]
+
+
+_sources = {}
+_sources_lock = threading.Lock()
+
+
+def open_tile_source(path, tms=False):
+    """Opens a local tile package. Each package is only opened once per kernel and row order.
+    Args:
+        path (str): The path to an .mbtiles file or to the root directory of a tile pyramid.
+        tms (bool, optional): Whether the rows of a directory pyramid are counted from the south. Defaults to False.
+    Raises:
+        FileNotFoundError: If the path does not exist.
+        ValueError: If the path is not a tile package.
+    Returns:
+        MBTilesSource | DirectorySource: The tile source.
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    key = (path, bool(tms))
+    with _sources_lock:
+        source = _sources.get(key)
+        if source is None:
+            if os.path.isdir(path):
+                source = DirectorySource(path, tms=tms)
+            else:
+                source = MBTilesSource(path)
+            _sources[key] = source
+    return source
+
+
+def local_basemap(path, name=None, attribution=None, tms=False):
+    """Builds a basemap descriptor for a local tile package, to be added to a BasemapTiles.
+    Args:
+        path (str): The path to an .mbtiles file or to the root directory of a tile pyramid.
+        name (str, optional): The name of the basemap. Defaults to the name in the MBTiles metadata, or the file name.
+        attribution (str, optional): The attribution. Defaults to the one in the MBTiles metadata.
+        tms (bool, optional): Whether the rows of a directory pyramid are counted from the south. Defaults to False.
+    Returns:
+        dict: The basemap descriptor.
+    """
+    source = open_tile_source(path, tms=tms)
+    metadata = source.metadata
+    if name is None:
+        name = metadata.get("name") or os.path.splitext(os.path.basename(path))[0]
+    if attribution is None:
+        attribution = metadata.get("attribution", "")
+    return {
+        "local": source,
+        "name": name,
+        "attribution": attribution,
+        "min_zoom": int(metadata["minzoom"]),
+        "max_native_zoom": int(metadata["maxzoom"]),
+    }
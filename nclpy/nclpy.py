@@ -1,8 +1,10 @@
 """Main module for the nclpy package."""
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import ipyleaflet
 import ee
-from .common import ee_initialize, geojson_to_ee, csv_to_shp
+from .common import ee_initialize, geojson_to_ee, csv_to_shp, shp_to_geojson
 from ipyleaflet import (
     FullScreenControl,
     LayersControl,
@@ -12,19 +14,37 @@ from ipyleaflet import (
     TileLayer,
 )
 from .utils import random_string
-from .generate_points import random_points
+from .generate_points import random_points, random_points_local
 from .toolbar import main_toolbar
-from .basemaps import basemaps, basemap_tiles
+from .basemaps import basemaps, basemap_tiles, BasemapTiles
+from .cache import map_id_cache
+from .feature_store import FeatureStore, geometry_key
+from .perf import count, profiler, timed
 
-ee_initialize()
+# Style of the client-side layer showing the features drawn with the DrawControl.
+DRAW_STYLE = {
+    "color": "blue",
+    "weight": 2,
+    "opacity": 0.5,
+    "fillColor": "blue",
+    "fillOpacity": 0.25,
+}
+
+# Maximum number of drawn features per LayerGroup bucket of the "Drawn Features" layer.
+DRAW_LAYER_BUCKET_SIZE = 256
+
+# Maximum number of getMapId() requests add_ee_layers() sends at the same time.
+EE_LAYER_WORKERS = 8
 
 
 class Map(ipyleaflet.Map):
     """This Map class inherits the ipyleaflet Map class.
     Args:
         ipyleaflet (ipyleaflet.Map): An ipyleaflet map.
+        headless (bool, optional): Whether to build the map without its controls, basemap and toolbar, as a plain layer container for scripts. Defaults to False.
     """
 
+    @timed("Map.__init__")
     def __init__(self, **kwargs):
 
         if "center" not in kwargs:
@@ -36,7 +56,16 @@ class Map(ipyleaflet.Map):
         if "scroll_wheel_zoom" not in kwargs:
             kwargs["scroll_wheel_zoom"] = True
 
+        # A headless map is only a layer container, e.g. for batch scripts exporting
+        # layers: it has no controls, no basemap and no toolbar.
+        headless = kwargs.pop("headless", False)
+        if headless:
+            kwargs.setdefault("layers", ())
+            kwargs.setdefault("zoom_control", False)
+            kwargs.setdefault("attribution_control", False)
+
         super().__init__(**kwargs)
+        self.headless = headless
 
         if "height" not in kwargs:
             self.layout.height = "600px"
@@ -44,120 +73,276 @@ class Map(ipyleaflet.Map):
             self.layout.height = kwargs["height"]
 
         self.draw_count = 0
-        self.draw_features = []
+        self.draw_features = FeatureStore()
         self.draw_last_feature = None
         self.draw_layer = None
         self.draw_last_json = None
         self.draw_last_bounds = None
         self.user_roi = None
         self.user_rois = None
-
-        main_toolbar(self)
+        self.train_props = {}
+        self.basemap_tiles = BasemapTiles()
+        self._draw_feature_layers = {}
+        self.vector_tiles = {}
+        self.spatial_indexes = {}
+        self.simplify_stats = {}
         self.toolbar = None
         self.toolbar_button = None
-        train_props = {}
-
-        def find_layer_index(self, name):
-            """Finds layer index by name
-            Args:
-                name (str): Name of the layer to find.
-            Returns:
-                int: Index of the layer with the specified name
-            """
-            layers = self.layers
+        self.draw_control = None
+        # The ids of the DrawControl's shapes, in the order of its data.
+        self._draw_order = []
+        self._draw_pending_edits = 0
+
+        if headless:
+            return
+
+        # The toolbar, the controls and the basemap reach the front end in one update.
+        with self.batch():
+            main_toolbar(self)
+
+            @timed("Map.handle_draw")
+            def handle_draw(target, action, geo_json):
+                try:
+                    self.user_roi = geo_json
+                    self.draw_last_json = geo_json
+                    self.draw_last_feature = geo_json
+                    with self.batch():
+                        if action == "deleted":
+                            key = self.remove_drawn_feature(geo_json)
+                            if key in self._draw_order:
+                                self._draw_order.remove(key)
+                        elif action == "edited":
+                            # An edited shape carries no id and its geometry has changed.
+                            # It is matched when the DrawControl syncs its data next.
+                            key = self.draw_features.find(geo_json)
+                            if key is not None:
+                                self.edit_drawn_feature(geo_json, key)
+                            else:
+                                self._draw_pending_edits += 1
+                        else:
+                            self._draw_order.append(self.add_drawn_feature(geo_json))
+
+                except Exception as e:
+                    self.clear_drawn_features()
+                    self.draw_last_feature = None
+                    self.user_roi = None
+                    self.roi_start = False
+                    self.roi_end = False
+                    print("There was an error handling the drawn feature.")
+                    raise Exception(e)
+
+            self.add_control(FullScreenControl())
+            self.add_control(LayersControl(position="topright"))
+            draw_control = DrawControl(position="topleft")
+            draw_control.on_draw(handle_draw)
+            draw_control.observe(self._draw_data_changed, "data")
+            self.draw_control = draw_control
+            self.add_control(draw_control)
+            self.add_control(MeasureControl())
+            self.add_control(ScaleControl(position="bottomleft"))
+
+            ###
+            ###
+
+            if "toolbar_ctrl" not in kwargs.keys():
+                kwargs["toolbar_ctrl"] = True
+
+            if "google_map" not in kwargs:
+                self.add_layer(self.basemap_tiles["ROADMAP"])
+            else:
+                if kwargs["google_map"] == "ROADMAP":
+                    self.add_layer(self.basemap_tiles["ROADMAP"])
+                elif kwargs["google_map"] == "HYBRID":
+                    self.add_layer(self.basemap_tiles["HYBRID"])
+
+    @contextmanager
+    def batch(self):
+        """Holds the layer and control changes made in the block, and sends them to the front
+        end in one update when the block exits. Blocks can be nested.
+
+            with m.batch():
+                for layer in layers:
+                    m.add_layer(layer)
+
+        Yields:
+            Map: The map.
+        """
+        with self.hold_sync():
+            yield self
 
-            for index, layer in enumerate(layers):
-                if layer.name == name:
-                    return index
+    @property
+    def user_rois(self):
+        """The drawn features as an ee.FeatureCollection. It is only built when an Earth Engine
+        operation asks for it, and rebuilt after the drawn features change.
+        """
+        if self._user_rois is None and len(self.draw_features) > 0:
+            ee_initialize()
+            if len(self.train_props) > 0:
+                features = [ee.Feature(f, self.train_props) for f in self.draw_features]
+            else:
+                features = [ee.Feature(f) for f in self.draw_features]
+            self._user_rois = ee.FeatureCollection(features)
+        return self._user_rois
+
+    @user_rois.setter
+    def user_rois(self, value):
+        self._user_rois = value
+
+    def add_drawn_feature(self, geo_json):
+        """Adds a drawn feature to the client-side "Drawn Features" layer. Only the new feature
+        is sent to the front end, and no Earth Engine request is made.
+        Args:
+            geo_json (dict): The GeoJSON feature from the DrawControl.
+        Returns:
+            str: The id of the feature.
+        """
+        key = self.draw_features.add(geo_json)
+        self._set_drawn_layer(key)
+        return key
 
-            return -1
+    def edit_drawn_feature(self, geo_json, key=None):
+        """Replaces a drawn feature, matched by its id. Unknown features are added.
+        Args:
+            geo_json (dict): The edited GeoJSON feature.
+            key (str, optional): The id of the feature to replace. Defaults to the id of geo_json.
+        Returns:
+            str: The id of the feature.
+        """
+        key = self.draw_features.edit(geo_json, key)
+        self._set_drawn_layer(key)
+        return key
 
-        def handle_draw(target, action, geo_json):
-            try:
-                print(target, action, geo_json, type(geo_json))
-                # geom = geojson_to_ee(geo_json, False)
-                self.user_roi = geo_json
-                if len(train_props) > 0:
-                    feature = ee.Feature(geo_json, train_props)
-                else:
-                    feature = ee.Feature(geo_json)  # geom
-                self.draw_last_json = geo_json
-                self.draw_last_feature = feature
-                if action == "deleted" and len(self.draw_features) > 0:
-                    self.draw_features.remove(feature)
-                    self.draw_count -= 1
-                else:
-                    self.draw_features.append(feature)
-                    self.draw_count += 1
-                collection = ee.FeatureCollection(self.draw_features)
-                self.user_rois = collection
-                ee_draw_layer = ee_tile_layer(
-                    collection, {"color": "blue"}, "Drawn Features", False, 0.5
-                )
-                draw_layer_index = find_layer_index(self, "Drawn Features")
+    def remove_drawn_feature(self, geo_json):
+        """Removes a drawn feature from the "Drawn Features" layer.
+        Args:
+            geo_json (dict|str): The GeoJSON feature from the DrawControl, or its id.
+        Returns:
+            str: The id of the removed feature, or None if it was not found.
+        """
+        key = self.draw_features.remove(geo_json)
+        if key is not None:
+            bucket, layer = self._draw_feature_layers.pop(key)
+            bucket.remove_layer(layer)
+            self.draw_count = len(self.draw_features)
+            self.user_rois = None
+        return key
+
+    def clear_drawn_features(self):
+        """Removes all drawn features and the "Drawn Features" layer."""
+        if self.draw_layer is not None and self.draw_layer in self.layers:
+            self.remove_layer(self.draw_layer)
+        self.draw_count = 0
+        self.draw_features = FeatureStore()
+        self._draw_feature_layers = {}
+        self.draw_layer = None
+        self.user_rois = None
+        self._draw_order = []
+        self._draw_pending_edits = 0
+        if self.draw_control is not None:
+            self.draw_control.clear()
 
-                if draw_layer_index == -1:
-                    self.add_layer(ee_draw_layer)
-                    self.draw_layer = ee_draw_layer
-                else:
-                    self.substitute_layer(self.draw_layer, ee_draw_layer)
-                    self.draw_layer = ee_draw_layer
+    def import_drawn_features(self, in_geojson):
+        """Adds features in bulk to the "Drawn Features" layer, e.g. a previously exported set.
+        Args:
+            in_geojson (dict|list|str): A GeoJSON FeatureCollection, a list of features or a file path.
+        Returns:
+            list: The ids of the added features.
+        """
+        keys = self.draw_features.load(in_geojson)
+        self._attach_drawn_layers(keys)
+        self.draw_count = len(self.draw_features)
+        self.user_rois = None
+        return keys
 
-            except Exception as e:
-                self.draw_count = 0
-                self.draw_features = []
-                self.draw_last_feature = None
-                self.draw_layer = None
-                self.user_roi = None
-                self.roi_start = False
-                self.roi_end = False
-                print("There was an error creating Earth Engine Feature.")
-                raise Exception(e)
-
-        self.add_control(FullScreenControl())
-        self.add_control(LayersControl(position="topright"))
-        draw_control = DrawControl(position="topleft")
-        draw_control.on_draw(handle_draw)
-        # self.draw_control = draw_control
-        self.add_control(draw_control)
-        self.add_control(MeasureControl())
-        self.add_control(ScaleControl(position="bottomleft"))
-
-        ###
-        ###
-
-        if "toolbar_ctrl" not in kwargs.keys():
-            kwargs["toolbar_ctrl"] = True
-
-        if "google_map" not in kwargs:
-            layer = TileLayer(
-                url="https://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}",
-                attribution="Google",
-                name="Google Maps",
+    def export_drawn_features(self, out_geojson=None):
+        """Exports the drawn features as a GeoJSON FeatureCollection. Each feature carries its id.
+        Args:
+            out_geojson (str, optional): The file path to the output GeoJSON. Defaults to None.
+        Returns:
+            dict: The GeoJSON FeatureCollection.
+        """
+        return self.draw_features.to_geojson(out_geojson)
+
+    def _attach_drawn_layers(self, keys):
+        # Features are spread over fixed-size LayerGroups inside the "Drawn Features"
+        # group, so adding or removing one only re-sends a bucket of bounded size.
+        if self.draw_layer is None:
+            self.draw_layer = ipyleaflet.LayerGroup(name="Drawn Features")
+            self.add_layer(self.draw_layer)
+
+        buckets = list(self.draw_layer.layers)
+        if len(buckets) > 0 and len(buckets[-1].layers) < DRAW_LAYER_BUCKET_SIZE:
+            bucket = buckets.pop()
+            pending = list(bucket.layers)
+        else:
+            bucket, pending = None, []
+        new_buckets = []
+
+        for key in keys:
+            if bucket is None or len(pending) == DRAW_LAYER_BUCKET_SIZE:
+                if bucket is not None:
+                    bucket.layers = tuple(pending)
+                bucket, pending = ipyleaflet.LayerGroup(), []
+                new_buckets.append(bucket)
+            layer = ipyleaflet.GeoJSON(
+                data=self.draw_features.get(key), style=DRAW_STYLE
             )
-            self.add_layer(layer)
+            self._draw_feature_layers[key] = (bucket, layer)
+            pending.append(layer)
+
+        if bucket is not None:
+            bucket.layers = tuple(pending)
+        if len(new_buckets) > 0:
+            self.draw_layer.layers = tuple(self.draw_layer.layers) + tuple(new_buckets)
+
+    def _set_drawn_layer(self, key):
+        if key in self._draw_feature_layers:
+            self._draw_feature_layers[key][1].data = self.draw_features.get(key)
         else:
-            if kwargs["google_map"] == "ROADMAP":
-                layer = TileLayer(
-                    url="https://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}",
-                    attribution="Google",
-                    name="Google Maps",
-                )
-                self.add_layer(layer)
-            elif kwargs["google_map"] == "HYBRID":
-                layer = TileLayer(
-                    url="https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}",
-                    attribution="Google",
-                    name="Google Satellite",
-                )
-                self.add_layer(layer)
+            self._attach_drawn_layers([key])
+        self.draw_count = len(self.draw_features)
+        self.user_rois = None
 
-    def add_geojson(self, in_geojson, style=None, layer_name="Untitled"):
+    def _draw_data_changed(self, change):
+        # The front end syncs the DrawControl's shapes after each event, in the order
+        # they were drawn. Edited shapes are the ones whose geometry changed. Nothing is
+        # sent back to the front end.
+        if self._draw_pending_edits == 0:
+            return
+        for key, feature in zip(self._draw_order, change["new"]):
+            stored = self.draw_features.get(key)
+            if stored is not None and geometry_key(stored) != geometry_key(feature):
+                with self.batch():
+                    self.edit_drawn_feature(feature, key)
+                self._draw_pending_edits -= 1
+                if self._draw_pending_edits == 0:
+                    break
+        self._draw_pending_edits = 0
+
+    @timed()
+    def add_geojson(
+        self,
+        in_geojson,
+        style=None,
+        layer_name="Untitled",
+        tiled=False,
+        spatial_index=False,
+        simplify=None,
+        precision=None,
+        use_cache=False,
+        **kwargs
+    ):
         """Adds a GeoJSON file to the map.
         Args:
             in_geojson (str): The file path to the input GeoJSON.
             style (dict, optional): The style for the GeoJSON layer. Defaults to None.
             layer_name (str, optional): The layer name for the GeoJSON layer. Defaults to "Untitled".
+            tiled (bool, optional): Whether to cut the data into vector tiles in the kernel and only send the features visible at the current zoom, simplified for that zoom. Recommended for large datasets. Defaults to False.
+            spatial_index (bool, optional): Whether to build a spatial index for identify(), query_bbox() and query_roi(). Defaults to False.
+            simplify (float|bool, optional): The Douglas-Peucker tolerance in degrees used to simplify the geometries before they are sent, or True to simplify for the current zoom of the map. Defaults to None.
+            precision (int, optional): The number of decimals kept in the coordinates sent. Defaults to None (all of them, or enough for the current zoom when simplify is True).
+            use_cache (bool, optional): Whether to load a file through the on-disk layer cache, so it is only parsed once. A cache hit skips the parsing but still builds the full GeoJSON in Python, see layer_cache.LayerCache.load(). Defaults to False.
+            **kwargs: Options passed to vector_tiles.TileIndex when tiled is True, e.g. max_zoom or tolerance.
         Raises:
             FileNotFoundError: If the provided file path does not exist.
             TypeError: If the input geojson is not a str or dict.
@@ -173,8 +358,13 @@ class Map(ipyleaflet.Map):
             if not os.path.exists(in_geojson):
                 raise FileNotFoundError("The provided GeoJSON file could not be found.")
 
-            with open(in_geojson) as f:
-                data = json.load(f)
+            if use_cache:
+                from .layer_cache import layer_cache
+
+                data = layer_cache.load(in_geojson)
+            else:
+                with open(in_geojson) as f:
+                    data = json.load(f)
 
         elif isinstance(in_geojson, dict):
             data = in_geojson
@@ -193,23 +383,219 @@ class Map(ipyleaflet.Map):
                 "fillOpacity": 0.4,
             }
 
-        geo_json = ipyleaflet.GeoJSON(data=data, style=style, name=layer_name)
-        self.add_layer(geo_json)
+        if spatial_index:
+            from .spatial_index import SpatialIndex
+
+            self.spatial_indexes[layer_name] = SpatialIndex(data)
+
+        if simplify or precision is not None:
+            from .simplify import (
+                simplify_geojson,
+                tolerance_for_zoom,
+                precision_for_zoom,
+            )
 
-    def add_shapefile(self, in_shp, style=None, layer_name="Untitled"):
+            if simplify is True:
+                simplify = tolerance_for_zoom(self.zoom)
+                if precision is None:
+                    precision = precision_for_zoom(self.zoom)
+            data, stats = simplify_geojson(data, simplify, precision)
+            self.simplify_stats[layer_name] = stats
+
+        if tiled:
+            from .vector_tiles import TileIndex, TiledGeoJSON
+
+            index = TileIndex(data, **kwargs)
+            geo_json = ipyleaflet.GeoJSON(
+                data={"type": "FeatureCollection", "features": []},
+                style=style,
+                name=layer_name,
+            )
+            self.add_layer(geo_json)
+            self.vector_tiles[layer_name] = TiledGeoJSON(self, geo_json, index)
+        else:
+            geo_json = ipyleaflet.GeoJSON(data=data, style=style, name=layer_name)
+            self.add_layer(geo_json)
+
+    @timed()
+    def add_shapefile(
+        self,
+        in_shp,
+        style=None,
+        layer_name="Untitled",
+        tiled=False,
+        spatial_index=False,
+        simplify=None,
+        precision=None,
+        use_cache=False,
+        **kwargs
+    ):
         """Adds a shapefile layer to the map.
         Args:
             in_shp (str): The file path to the input shapefile.
             style (dict, optional): The style dictionary. Defaults to None.
             layer_name (str, optional): The layer name for the shapefile layer. Defaults to "Untitled".
+            tiled (bool, optional): Whether to serve the layer as vector tiles, see add_geojson(). Defaults to False.
+            spatial_index (bool, optional): Whether to build a spatial index for identify(), query_bbox() and query_roi(). Defaults to False.
+            simplify (float|bool, optional): The simplification tolerance in degrees, or True for the current zoom, see add_geojson(). Defaults to None.
+            precision (int, optional): The number of decimals kept in the coordinates sent. Defaults to None.
+            use_cache (bool, optional): Whether to load the shapefile through the on-disk layer cache, so it is only parsed once, see add_geojson(). Defaults to False.
+            **kwargs: Options passed to vector_tiles.TileIndex when tiled is True.
+        """
+        if use_cache:
+            from .layer_cache import layer_cache
+
+            if not os.path.exists(in_shp):
+                raise FileNotFoundError("The provided shapefile could not be found.")
+            geojson = layer_cache.load(in_shp)
+        else:
+            geojson = shp_to_geojson(in_shp)
+        self.add_geojson(
+            geojson,
+            style=style,
+            layer_name=layer_name,
+            tiled=tiled,
+            spatial_index=spatial_index,
+            simplify=simplify,
+            precision=precision,
+            **kwargs
+        )
+
+    def _query_layers(self, layer_name, query):
+        if layer_name is None:
+            indexes = self.spatial_indexes
+        elif layer_name in self.spatial_indexes:
+            indexes = {layer_name: self.spatial_indexes[layer_name]}
+        else:
+            raise ValueError(
+                "The layer {} does not have a spatial index.".format(layer_name)
+            )
+        return {
+            name: index.to_geojson(query(index)) for name, index in indexes.items()
+        }
+
+    @timed()
+    def identify(self, lat, lon, layer_name=None, pixels=5):
+        """Finds the features of the indexed vector layers at a location.
+        Args:
+            lat (float): The latitude.
+            lon (float): The longitude.
+            layer_name (str, optional): The layer to query. Defaults to None (all indexed layers).
+            pixels (float, optional): The click tolerance in screen pixels at the current zoom, so that points and lines can be hit. Defaults to 5.
+        Returns:
+            dict: A GeoJSON FeatureCollection of the matching features for each layer name.
         """
-        geojson = shp_to_geojson(in_shp)
-        self.add_geojson(geojson, style=style, layer_name=layer_name)
+        from .simplify import tolerance_for_zoom
+
+        tolerance = tolerance_for_zoom(self.zoom, pixels)
+        return self._query_layers(
+            layer_name, lambda index: index.query_point(lon, lat, tolerance)
+        )
 
-    def add_points_from_csv(self, in_csv, x = "longitude", y= "latitude"):
-        shape = csv_to_shp(in_csv)
-        self.add_shapefile(shape)
+    @timed()
+    def query_bbox(self, bounds, layer_name=None):
+        """Finds the features of the indexed vector layers intersecting a bounding box.
+        Args:
+            bounds (list): The ((south, west), (north, east)) bounds, e.g. Map.bounds.
+            layer_name (str, optional): The layer to query. Defaults to None (all indexed layers).
+        Returns:
+            dict: A GeoJSON FeatureCollection of the matching features for each layer name.
+        """
+        (south, west), (north, east) = bounds
+        return self._query_layers(
+            layer_name, lambda index: index.query_bbox(west, south, east, north)
+        )
 
+    @timed()
+    def query_roi(self, roi=None, layer_name=None, predicate="intersects"):
+        """Finds the features of the indexed vector layers intersecting a region of interest.
+        Args:
+            roi (dict, optional): A GeoJSON feature or geometry. Defaults to the last drawn feature (user_roi).
+            layer_name (str, optional): The layer to query. Defaults to None (all indexed layers).
+            predicate (str, optional): A shapely predicate, e.g. 'intersects' or 'contains'. Defaults to 'intersects'.
+        Raises:
+            ValueError: If no region of interest was given or drawn.
+        Returns:
+            dict: A GeoJSON FeatureCollection of the matching features for each layer name.
+        """
+        if roi is None:
+            roi = self.user_roi
+        if roi is None:
+            raise ValueError("Draw a region of interest on the map first.")
+        return self._query_layers(
+            layer_name, lambda index: index.query_roi(roi, predicate)
+        )
+
+    @timed()
+    def add_points_from_csv(self, in_csv, x="longitude", y="latitude"):
+        """Adds points from a csv file with latlon info to the map.
+        Args:
+            in_csv (str): The input csv file containing longitude and latitude columns.
+            x (str, optional): The column name of the longitude column. Defaults to "longitude".
+            y (str, optional): The column name of the latitude column. Defaults to "latitude".
+        """
+        stats = csv_to_shp(in_csv, latitude=y, longitude=x)
+        self.add_shapefile(stats["out_shp"])
+
+    @timed()
+    def add_random_points(
+        self,
+        points=100,
+        roi=None,
+        seed=0,
+        mode="uniform",
+        min_distance=None,
+        layer_name="Random points",
+        color="#00FFFF",
+    ):
+        """Generates random points inside a region of interest locally and adds them to the map.
+        Args:
+            points (int, optional): The number of points. Defaults to 100.
+            roi (dict, optional): A GeoJSON feature or geometry. Defaults to the last drawn feature (user_roi).
+            seed (int, optional): The random seed. Defaults to 0.
+            mode (str, optional): 'uniform', 'stratified' or 'poisson', see generate_points.random_points_local(). Defaults to 'uniform'.
+            min_distance (float, optional): The minimum distance between points in meters in the 'poisson' mode. Defaults to None.
+            layer_name (str, optional): The layer name. Defaults to "Random points".
+            color (str, optional): The color of the points. Defaults to "#00FFFF".
+        Raises:
+            ValueError: If no region of interest was given or drawn, or the number of points is negative or missing.
+        Returns:
+            numpy.ndarray: An (n, 2) array of longitude/latitude pairs.
+        """
+        if roi is None:
+            roi = self.user_roi
+        if roi is None:
+            raise ValueError("Draw a region of interest on the map first.")
+
+        coords = random_points_local(roi, points, seed, mode, min_distance)
+        # A single MultiPoint with coordinates rounded to about 10 cm keeps the payload
+        # small for hundreds of thousands of points.
+        data = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {"name": layer_name},
+                    "geometry": {
+                        "type": "MultiPoint",
+                        "coordinates": coords.round(6).tolist(),
+                    },
+                }
+            ],
+        }
+        point_style = {
+            "radius": 2,
+            "weight": 0,
+            "fillColor": color,
+            "fillOpacity": 1,
+        }
+        geo_json = ipyleaflet.GeoJSON(
+            data=data, point_style=point_style, name=layer_name
+        )
+        self.add_layer(geo_json)
+        return coords
+
+    @timed()
     def add_ee_layer(
         self, ee_object, vis_params={}, name=None, shown=True, opacity=1.0
     ):
@@ -227,11 +613,141 @@ class Map(ipyleaflet.Map):
 
     addLayer = add_ee_layer
 
+    @timed()
+    def add_ee_layers(self, layers, max_workers=EE_LAYER_WORKERS):
+        """Adds several EE objects to the map, requesting their map IDs concurrently.
+        The layers are added in the given order with a single update of the map. A layer
+        that fails is skipped and reported without stopping the others.
+        Args:
+            layers (list): The layers, each a dict of add_ee_layer() arguments or a tuple of (ee_object, vis_params, name, shown, opacity).
+            max_workers (int, optional): The maximum number of concurrent getMapId() requests. Defaults to 8.
+        Returns:
+            dict: The error of each layer that could not be added, keyed by its (index, name) in layers.
+        """
+        specs = []
+        for i, layer in enumerate(layers):
+            if isinstance(layer, dict):
+                spec = dict(layer)
+            else:
+                keys = ["ee_object", "vis_params", "name", "shown", "opacity"]
+                spec = dict(zip(keys, layer))
+            if spec.get("name") is None:
+                spec["name"] = "Layer {}".format(len(self.layers) + i)
+            specs.append(spec)
+
+        if len(specs) == 0:
+            return {}
+
+        ee_initialize()
+
+        def resolve(spec):
+            try:
+                return ee_tile_url(spec["ee_object"], spec.get("vis_params") or {})
+            except Exception as e:
+                return e
+
+        max_workers = max(1, min(max_workers, len(specs)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(resolve, specs))
+
+        new_layers = []
+        errors = {}
+        for i, (spec, result) in enumerate(zip(specs, results)):
+            if isinstance(result, Exception):
+                errors[(i, spec["name"])] = result
+                continue
+            new_layers.append(
+                TileLayer(
+                    url=result,
+                    attribution="Google Earth Engine",
+                    name=spec["name"],
+                    opacity=spec.get("opacity", 1.0),
+                    visible=spec.get("shown", True),
+                )
+            )
+
+        # Assigning the layers at once syncs the widget once instead of once per layer.
+        self.layers = tuple(self.layers) + tuple(new_layers)
+
+        for (i, name), error in errors.items():
+            print("Could not add the layer {} ({}): {}".format(i, name, error))
+        return errors
+
+    def use_tile_proxy(self, proxy=True):
+        """Loads the basemap tiles through a local caching proxy, see the tile_proxy module.
+        The basemaps already on the map are switched over too.
+        Args:
+            proxy (bool | TileProxy, optional): True for the proxy shared by all maps, a TileProxy, or False to load the tiles from upstream again. Defaults to True.
+        Returns:
+            TileProxy: The tile proxy, or None.
+        """
+        from .tile_proxy import get_tile_proxy
+
+        if proxy is True:
+            proxy = get_tile_proxy()
+        elif proxy is False:
+            proxy = None
+        self.basemap_tiles.set_proxy(proxy)
+        return proxy
+
+    @timed()
+    def add_local_basemap(self, path, name=None, attribution=None, tms=False):
+        """Adds an offline basemap from a local tile package. The tiles are served by the
+        kernel, and the basemap can then be picked in the basemap dropdown like any other.
+        Args:
+            path (str): The path to an .mbtiles file or to the root directory of a {z}/{x}/{y} tile pyramid.
+            name (str, optional): The name of the basemap. Defaults to the name in the MBTiles metadata, or the file name.
+            attribution (str, optional): The attribution. Defaults to the one in the MBTiles metadata.
+            tms (bool, optional): Whether the rows of a directory pyramid are counted from the south. Defaults to False.
+        Returns:
+            str: The name of the basemap.
+        """
+        from .local_tiles import local_basemap
+
+        descriptor = local_basemap(path, name=name, attribution=attribution, tms=tms)
+        self.basemap_tiles.add(descriptor["name"], descriptor)
+        self.add_layer(self.basemap_tiles[descriptor["name"]])
+        return descriptor["name"]
+
+    @timed()
+    def to_png(self, out_png=None, bbox=None, zoom=None):
+        """Renders the map to a PNG image without a browser, e.g. for reports. See the
+        static_maps module, whose render_maps() renders many maps in parallel.
+        Args:
+            out_png (str, optional): The file path to write the image to. Defaults to None.
+            bbox (list, optional): The bounding box as [west, south, east, north] in degrees. Defaults to the bounds of the map as last shown.
+            zoom (int, optional): The zoom level. Defaults to the zoom of the map.
+        Returns:
+            bytes: The PNG image.
+        """
+        from .static_maps import map_spec, render_map
+
+        return render_map(**map_spec(self, bbox=bbox, zoom=zoom, out_png=out_png))
+
+    def perf_report(self, reset=False):
+        """Returns the time spent in nclpy's hot paths, and the number of Earth Engine calls
+        and widget messages sent to the front end. Profiling must be enabled first, with
+        nclpy.perf.enable(); see the perf module.
+        Args:
+            reset (bool, optional): Whether to clear the results after reading them. Defaults to False.
+        Returns:
+            dict: 'spans' maps each span, e.g. 'Map.add_geojson' or 'ee_tile_url', to its count and total, mean and max milliseconds; 'counters' holds 'ee.getMapId', 'widget.messages', 'widget.bytes' and the like.
+        """
+        report = profiler.report()
+        if reset:
+            profiler.reset()
+        return report
+
     def toolbar_reset(self):
-        """Reset the toolbar so that no tool is selected."""
-        toolbar_grid = self.toolbar
-        for tool in toolbar_grid:
-            tool.value = False
+        """Reset the toolbar so that no tool is selected. The toolbar stays open."""
+        from ipywidgets import ToggleButton
+
+        if self.toolbar is None:
+            return
+        for widget in self.toolbar.children:
+            for tool in getattr(widget, "children", [widget]):
+                if isinstance(tool, ToggleButton) and tool is not self.toolbar_button:
+                    tool.value = False
 
 
 # Handles draw events
@@ -280,49 +796,18 @@ class Map(ipyleaflet.Map):
 #     self.add_control(draw_control)
 
 
-def shp_to_geojson(in_shp, out_geojson=None):
-    """Converts a shapefile to GeoJSON.
+@timed()
+def ee_tile_url(ee_object, vis_params={}, use_cache=True):
+    """Returns the tile URL of an Earth Engine object.
     Args:
-        in_shp (str): The file path to the input shapefile.
-        out_geojson (str, optional): The file path to the output GeoJSON. Defaults to None.
-    Raises:
-        FileNotFoundError: If the input shapefile does not exist.
+        ee_object (Collection|Feature|Image|MapId): The object to render.
+        vis_params (dict, optional): The visualization parameters. Defaults to {}.
+        use_cache (bool, optional): Whether to reuse a cached map ID for the same expression and vis_params. Defaults to True.
     Returns:
-        dict: The dictionary of the GeoJSON.
+        str: The tile URL format.
     """
-    import json
-    import shapefile
 
-    in_shp = os.path.abspath(in_shp)
-
-    if not os.path.exists(in_shp):
-        raise FileNotFoundError("The provided shapefile could not be found.")
-
-    sf = shapefile.Reader(in_shp)
-    geojson = sf.__geo_interface__
-
-    if out_geojson is None:
-        return geojson
-    else:
-        out_geojson = os.path.abspath(out_geojson)
-        out_dir = os.path.dirname(out_geojson)
-        if not os.path.exists(out_dir):
-            os.makedirs(out_dir)
-        with open(out_geojson, "w") as f:
-            f.write(json.dumps(geojson))
-
-
-def ee_tile_layer(
-    ee_object, vis_params={}, name="Layer untitled", shown=True, opacity=1.0
-):
-    """Converts and Earth Engine layer to ipyleaflet TileLayer.
-    Args:
-        ee_object (Collection|Feature|Image|MapId): The object to add to the map.
-        vis_params (dict, optional): The visualization parameters. Defaults to {}.
-        name (str, optional): The name of the layer. Defaults to 'Layer untitled'.
-        shown (bool, optional): A flag indicating whether the layer should be on by default. Defaults to True.
-        opacity (float, optional): The layer's opacity represented as a number between 0 and 1. Defaults to 1.
-    """
+    ee_initialize()
 
     image = None
 
@@ -366,9 +851,36 @@ def ee_tile_layer(
     elif isinstance(ee_object, ee.imagecollection.ImageCollection):
         image = ee_object.mosaic()
 
-    map_id_dict = ee.Image(image).getMapId(vis_params)
+    if use_cache:
+        url_format = map_id_cache.get_url_format(ee.Image(image), vis_params)
+    else:
+        count("ee.getMapId")
+        url_format = ee.Image(image).getMapId(vis_params)["tile_fetcher"].url_format
+    return url_format
+
+
+@timed()
+def ee_tile_layer(
+    ee_object,
+    vis_params={},
+    name="Layer untitled",
+    shown=True,
+    opacity=1.0,
+    use_cache=True,
+):
+    """Converts and Earth Engine layer to ipyleaflet TileLayer.
+    Args:
+        ee_object (Collection|Feature|Image|MapId): The object to add to the map.
+        vis_params (dict, optional): The visualization parameters. Defaults to {}.
+        name (str, optional): The name of the layer. Defaults to 'Layer untitled'.
+        shown (bool, optional): A flag indicating whether the layer should be on by default. Defaults to True.
+        opacity (float, optional): The layer's opacity represented as a number between 0 and 1. Defaults to 1.
+        use_cache (bool, optional): Whether to reuse a cached map ID for the same expression and vis_params. Defaults to True.
+    """
+
+    url_format = ee_tile_url(ee_object, vis_params, use_cache)
     tile_layer = TileLayer(
-        url=map_id_dict["tile_fetcher"].url_format,
+        url=url_format,
         attribution="Google Earth Engine",
         name=name,
         opacity=opacity,
@@ -0,0 +1,243 @@
+"""Module for timing nclpy's hot paths. Map methods, Earth Engine layers, the conversion
+functions and the toolbar callbacks are wrapped in timing spans, and Earth Engine calls and
+widget messages are counted. Nothing is recorded until profiling is enabled, and a disabled
+span costs a single attribute check.
+
+    from nclpy import perf
+    perf.enable(log="perf.jsonl")  # the log is optional
+    m = nclpy.Map()
+    ...
+    m.perf_report()
+
+Setting NCLPY_PERF_LOG to a file path enables profiling, with that log, on import.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+
+
+class Profiler:
+    """Collects timing spans and counters.
+    Attributes:
+        enabled (bool): Whether spans and counters are recorded.
+        spans (dict): [count, total seconds, max seconds] keyed by span name.
+        counters (dict): Counts keyed by counter name.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = {}
+        self.counters = {}
+        self._log = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._patched = []
+
+    def enable(self, log=None):
+        """Starts recording spans and counters.
+        Args:
+            log (str, optional): A file to append every span and Earth Engine call to, as one JSON object per line. Defaults to None.
+        """
+        if log is not None:
+            if self._log is not None:
+                self._log.close()
+            self._log = open(log, "a", encoding="utf-8")
+        if not self._patched:
+            self._patch_widgets()
+        self.enabled = True
+
+    def disable(self):
+        """Stops recording. The results so far are kept until reset()."""
+        self.enabled = False
+        for owner, name, original in self._patched:
+            setattr(owner, name, original)
+        self._patched = []
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def reset(self):
+        """Clears the recorded spans and counters."""
+        with self._lock:
+            self.spans = {}
+            self.counters = {}
+
+    def _patch_widgets(self):
+        # Every widget sends its whole state when it is created, and each trait change
+        # afterwards, so both are counted.
+        from ipywidgets.widgets.widget import Widget, _remove_buffers
+
+        profiler = self
+        original_open = Widget.open
+        original_send = Widget._send
+
+        def open(widget):
+            if profiler.enabled and widget.comm is None:
+                state, buffer_paths, buffers = _remove_buffers(widget.get_state())
+                profiler.count_message({"state": state}, buffers)
+            return original_open(widget)
+
+        def _send(widget, msg, buffers=None):
+            if profiler.enabled:
+                profiler.count_message(msg, buffers)
+            return original_send(widget, msg, buffers)
+
+        Widget.open = open
+        Widget._send = _send
+        self._patched = [
+            (Widget, "open", original_open),
+            (Widget, "_send", original_send),
+        ]
+
+    def count_message(self, msg, buffers=None):
+        """Counts a widget message and its size in bytes."""
+        size = len(json.dumps(msg, default=str))
+        size += sum(len(memoryview(buffer).cast("B")) for buffer in buffers or [])
+        self.count("widget.messages")
+        self.count("widget.bytes", size)
+
+    def count(self, name, n=1):
+        """Increments a counter.
+        Args:
+            name (str): The counter, e.g. 'ee.getMapId'.
+            n (int, optional): The increment. Defaults to 1.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+        if self._log is not None and not name.startswith("widget."):
+            self._write({"type": "count", "name": name, "n": n})
+
+    def record(self, name, elapsed, depth=0):
+        """Records a span.
+        Args:
+            name (str): The span name, e.g. 'Map.add_geojson'.
+            elapsed (float): The duration in seconds.
+            depth (int, optional): The number of spans the span is nested in. Defaults to 0.
+        """
+        with self._lock:
+            span = self.spans.get(name)
+            if span is None:
+                self.spans[name] = [1, elapsed, elapsed]
+            else:
+                span[0] += 1
+                span[1] += elapsed
+                span[2] = max(span[2], elapsed)
+        if self._log is not None:
+            self._write(
+                {"type": "span", "name": name, "ms": elapsed * 1000, "depth": depth}
+            )
+
+    def _write(self, entry):
+        entry["time"] = time.time()
+        entry["thread"] = threading.current_thread().name
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            if self._log is not None:
+                self._log.write(line)
+                self._log.flush()
+
+    def span(self, name):
+        """Returns a context manager timing a block of code.
+        Args:
+            name (str): The span name.
+        """
+        return _Span(self, name)
+
+    def report(self):
+        """Returns the recorded spans and counters.
+        Returns:
+            dict: 'spans' maps each span name to its count and total, mean and max milliseconds, slowest total first; 'counters' maps each counter to its count.
+        """
+        with self._lock:
+            spans = sorted(self.spans.items(), key=lambda item: -item[1][1])
+            return {
+                "enabled": self.enabled,
+                "spans": {
+                    name: {
+                        "count": count,
+                        "total_ms": total * 1000,
+                        "mean_ms": total * 1000 / count,
+                        "max_ms": longest * 1000,
+                    }
+                    for name, (count, total, longest) in spans
+                },
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+
+class _Span:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.enabled = self.profiler.enabled
+        if self.enabled:
+            local = self.profiler._local
+            self.depth = getattr(local, "depth", 0)
+            local.depth = self.depth + 1
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.enabled:
+            elapsed = time.perf_counter() - self.start
+            self.profiler._local.depth = self.depth
+            self.profiler.record(self.name, elapsed, self.depth)
+        return False
+
+
+profiler = Profiler()
+
+
+def timed(name=None):
+    """Decorates a function so each call is recorded as a span while profiling is enabled.
+    Args:
+        name (str, optional): The span name. Defaults to the qualified name of the function.
+    """
+
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            with _Span(profiler, label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, n=1):
+    """Increments a counter while profiling is enabled.
+    Args:
+        name (str): The counter, e.g. 'ee.getMapId'.
+        n (int, optional): The increment. Defaults to 1.
+    """
+    if profiler.enabled:
+        profiler.count(name, n)
+
+
+def enable(log=None):
+    """Starts profiling, see Profiler.enable()."""
+    profiler.enable(log)
+
+
+def disable():
+    """Stops profiling, see Profiler.disable()."""
+    profiler.disable()
+
+
+def report():
+    """Returns the recorded spans and counters, see Profiler.report()."""
+    return profiler.report()
+
+
+if os.environ.get("NCLPY_PERF_LOG"):
+    enable(os.environ["NCLPY_PERF_LOG"])
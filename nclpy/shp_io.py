@@ -0,0 +1,752 @@
+"""Module for reading and writing shapefiles in bulk with NumPy. Records are encoded a whole
+chunk at a time instead of one Python call per shape, which is what makes converting
+multi-million row inputs practical.
+"""
+
+import datetime
+import os
+import struct
+import time
+
+import numpy as np
+
+WGS84_PRJ = 'GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137,298.257223563]],PRIMEM["Greenwich",0],UNIT["Degree",0.0174532925199433]] '
+
+DEFAULT_CHUNK_SIZE = 100000
+
+# A point record is an 8 byte big-endian header followed by the shape type and x/y.
+POINT_RECORD = np.dtype(
+    [
+        ("number", ">i4"),
+        ("length", ">i4"),
+        ("shape_type", "<i4"),
+        ("x", "<f8"),
+        ("y", "<f8"),
+    ]
+)
+INDEX_RECORD = np.dtype([("offset", ">i4"), ("length", ">i4")])
+
+SHP_HEADER_SIZE = 100
+MAX_NUMERIC_WIDTH = 19
+MAX_CHARACTER_WIDTH = 254
+
+MAX_DECIMALS = 15
+
+
+def _int_digits(max_abs):
+    return len(str(int(max_abs)))
+
+
+def _decimals(values):
+    # The smallest number of decimals that reproduces every value.
+    for decimals in range(MAX_DECIMALS + 1):
+        if np.allclose(np.round(values, decimals), values, rtol=1e-12, atol=0):
+            return decimals
+    return MAX_DECIMALS
+
+
+def field_stats(columns):
+    """Collects the statistics used to infer DBF field types from a chunk of the input.
+    The chunk is expected to be parsed with the pandas type inference, so numeric columns
+    arrive as int64/float64 arrays and only text columns need string processing.
+    Args:
+        columns (pandas.DataFrame): A chunk of the input.
+    Returns:
+        dict: Per-column statistics that can be combined with merge_field_stats().
+    """
+    import pandas as pd
+    from pandas.api import types
+
+    stats = {}
+    for name in columns.columns:
+        column = columns[name]
+        column = column[column.notna()]
+        if len(column) == 0:
+            stats[name] = {"kind": "empty"}
+        elif types.is_integer_dtype(column) and not types.is_bool_dtype(column):
+            values = column.to_numpy()
+            stats[name] = {
+                "kind": "int",
+                "sign": bool((values < 0).any()),
+                "int_digits": _int_digits(np.abs(values).max()),
+                "decimals": 0,
+            }
+        elif types.is_float_dtype(column) and np.isfinite(column.to_numpy()).all():
+            values = column.to_numpy()
+            stats[name] = {
+                "kind": "float",
+                "sign": bool((values < 0).any()),
+                "int_digits": _int_digits(np.abs(values).max()),
+                "decimals": _decimals(values),
+            }
+        else:
+            text = column.astype(str)
+            dates = pd.to_datetime(text, format="%Y-%m-%d", errors="coerce")
+            if dates.notna().all() and (text.str.len() == 10).all():
+                stats[name] = {"kind": "date"}
+            else:
+                stats[name] = {
+                    "kind": "text",
+                    "bytes": int(text.str.encode("utf-8").str.len().max()),
+                }
+    return stats
+
+
+def merge_field_stats(stats, other):
+    """Combines the field statistics of two chunks.
+    A column that is numeric in one chunk and text in another becomes a text column that
+    needs a rescan, see text_widths().
+    Args:
+        stats (dict): Statistics from field_stats(), or None.
+        other (dict): Statistics from field_stats().
+    Returns:
+        dict: The combined statistics.
+    """
+    if stats is None:
+        return other
+    merged = {}
+    for name, a in stats.items():
+        b = other[name]
+        kinds = {a["kind"], b["kind"]}
+        if "empty" in kinds:
+            merged[name] = b if a["kind"] == "empty" else a
+        elif kinds <= {"int", "float"}:
+            merged[name] = {
+                "kind": "float" if "float" in kinds else "int",
+                "sign": a["sign"] or b["sign"],
+                "int_digits": max(a["int_digits"], b["int_digits"]),
+                "decimals": max(a["decimals"], b["decimals"]),
+            }
+        elif kinds == {"date"}:
+            merged[name] = a
+        elif kinds == {"text"} and not (a.get("rescan") or b.get("rescan")):
+            merged[name] = {"kind": "text", "bytes": max(a["bytes"], b["bytes"])}
+        else:
+            merged[name] = {"kind": "text", "rescan": True}
+    return merged
+
+
+def text_widths(in_csv, names, chunk_size=DEFAULT_CHUNK_SIZE, encoding="utf-8"):
+    """Measures the longest value, in bytes, of some columns of a csv file.
+    Args:
+        in_csv (str): The input csv file.
+        names (list): The column names.
+        chunk_size (int, optional): The number of rows read at a time. Defaults to 100000.
+        encoding (str, optional): The encoding of the csv file. Defaults to 'utf-8'.
+    Returns:
+        dict: The width of each column.
+    """
+    import pandas as pd
+
+    widths = dict.fromkeys(names, 0)
+    chunks = pd.read_csv(
+        in_csv,
+        usecols=names,
+        dtype=str,
+        keep_default_na=False,
+        chunksize=chunk_size,
+        encoding=encoding,
+    )
+    for chunk in chunks:
+        for name in names:
+            width = chunk[name].str.encode("utf-8").str.len().max()
+            if width == width:
+                widths[name] = max(widths[name], int(width))
+    return widths
+
+
+def infer_fields(stats):
+    """Infers DBF field definitions from merged field statistics.
+    Integer and decimal columns become numeric (N) fields, ISO dates become date (D)
+    fields, and everything else becomes a character (C) field as wide as its longest value.
+    Args:
+        stats (dict): Statistics from field_stats()/merge_field_stats().
+    Returns:
+        list: A list of (name, type, width, decimals) tuples.
+    """
+    fields = []
+    for name, s in stats.items():
+        kind = s["kind"]
+        if kind in ("int", "float"):
+            int_width = s["int_digits"] + int(s["sign"])
+            decimals = s["decimals"]
+            if int_width <= MAX_NUMERIC_WIDTH:
+                decimals = max(min(decimals, MAX_NUMERIC_WIDTH - int_width - 1), 0)
+                width = int_width + (decimals + 1 if decimals > 0 else 0)
+                fields.append((name, "N", width, decimals))
+                continue
+            # Too wide for a numeric field, so the value is kept as text.
+            kind = "text"
+            s = {"bytes": int_width + decimals + 1}
+        if kind == "date":
+            fields.append((name, "D", 8, 0))
+        elif kind == "empty":
+            fields.append((name, "C", 1, 0))
+        else:
+            fields.append((name, "C", min(max(s["bytes"], 1), MAX_CHARACTER_WIDTH), 0))
+    return fields
+
+
+def read_dtypes(stats, fields):
+    """Returns the pandas dtypes used to read each column when writing records.
+    Args:
+        stats (dict): Statistics from field_stats()/merge_field_stats().
+        fields (list): Field definitions from infer_fields().
+    Returns:
+        dict: The dtype of each column.
+    """
+    dtypes = {}
+    for name, field_type, width, decimals in fields:
+        if field_type != "N":
+            dtypes[name] = str
+        elif stats[name]["kind"] == "int":
+            dtypes[name] = "Int64"
+        else:
+            dtypes[name] = "float64"
+    return dtypes
+
+
+def _format_column(column, field_type, width, decimals):
+    empty = column.isna().to_numpy()
+
+    if field_type == "N" and decimals == 0:
+        values = column.fillna(0).to_numpy(dtype="float64")
+        text = np.rint(values).astype("int64").astype("S")
+    elif field_type == "N":
+        # Fixed-point formatting with integer arithmetic, much faster than "%.nf" % x.
+        values = column.fillna(0).to_numpy(dtype="float64")
+        scale = 10 ** decimals
+        scaled = np.rint(np.abs(values) * scale).astype("int64")
+        fraction = np.char.zfill((scaled % scale).astype("S"), decimals)
+        text = np.char.add(np.char.add((scaled // scale).astype("S"), b"."), fraction)
+        text = np.where((values < 0) & (scaled != 0), np.char.add(b"-", text), text)
+    elif field_type == "D":
+        text = np.char.replace(column.fillna("").to_numpy(dtype="U"), "-", "")
+        text = np.char.encode(text, "ascii")
+    else:
+        text = np.char.encode(column.fillna("").to_numpy(dtype="U"), "utf-8")
+        return np.char.ljust(text.astype("S{}".format(width)), width)
+
+    text = np.char.rjust(text.astype("S"), width)
+    return np.where(empty, b" " * width, text).astype("S{}".format(width))
+
+
+def format_records(columns, fields):
+    """Encodes a chunk of the input as fixed-width DBF records.
+    Args:
+        columns (pandas.DataFrame): A chunk of the input, read with read_dtypes().
+        fields (list): Field definitions from infer_fields().
+    Returns:
+        bytes: The encoded records.
+    """
+    dtype = [("deleted", "S1")] + [
+        ("f{}".format(i), "S{}".format(f[2])) for i, f in enumerate(fields)
+    ]
+    records = np.empty(len(columns), dtype=dtype)
+    records["deleted"] = b" "
+    for i, (name, field_type, width, decimals) in enumerate(fields):
+        records["f{}".format(i)] = _format_column(
+            columns[name], field_type, width, decimals
+        )
+    return records.tobytes()
+
+
+def encode_chunk(columns, fields, longitude="longitude", latitude="latitude"):
+    """Encodes the coordinates and DBF records of a chunk of the input.
+    Args:
+        columns (pandas.DataFrame): A chunk of the input, read with read_dtypes().
+        fields (list): Field definitions from infer_fields().
+        longitude (str, optional): The column name of the longitude column. Defaults to 'longitude'.
+        latitude (str, optional): The column name of the latitude column. Defaults to 'latitude'.
+    Raises:
+        ValueError: If a latitude or longitude value is not a number.
+    Returns:
+        tuple: The x and y arrays and the encoded DBF records.
+    """
+    import pandas as pd
+
+    x = pd.to_numeric(columns[longitude], errors="coerce").to_numpy("f8")
+    y = pd.to_numeric(columns[latitude], errors="coerce").to_numpy("f8")
+    if np.isnan(x).any() or np.isnan(y).any():
+        raise ValueError("The latitude and longitude columns must only contain numbers.")
+    return x, y, format_records(columns, fields)
+
+
+def point_records(x, y, start=0):
+    """Encodes point coordinates as .shp and .shx records.
+    Args:
+        x (numpy.ndarray): The x coordinates.
+        y (numpy.ndarray): The y coordinates.
+        start (int, optional): The number of records already written. Defaults to 0.
+    Returns:
+        tuple: The .shp and .shx record bytes.
+    """
+    count = len(x)
+    records = np.empty(count, dtype=POINT_RECORD)
+    records["number"] = np.arange(start + 1, start + count + 1)
+    records["length"] = (POINT_RECORD.itemsize - 8) // 2
+    records["shape_type"] = 1
+    records["x"] = x
+    records["y"] = y
+
+    index = np.empty(count, dtype=INDEX_RECORD)
+    offsets = SHP_HEADER_SIZE + POINT_RECORD.itemsize * np.arange(
+        start, start + count, dtype="int64"
+    )
+    index["offset"] = offsets // 2
+    index["length"] = records["length"]
+    return records.tobytes(), index.tobytes()
+
+
+def shp_header(file_length, shape_type, bbox):
+    """Builds the 100 byte header shared by .shp and .shx files.
+    Args:
+        file_length (int): The file length in bytes.
+        shape_type (int): The shapefile shape type.
+        bbox (list): The [xmin, ymin, xmax, ymax] bounding box.
+    Returns:
+        bytes: The header.
+    """
+    return struct.pack(">6iI", 9994, 0, 0, 0, 0, 0, file_length // 2) + struct.pack(
+        "<2i8d", 1000, shape_type, *bbox, 0.0, 0.0, 0.0, 0.0
+    )
+
+
+def dbf_header(num_records, fields):
+    """Builds a dBase III header for the given fields.
+    Args:
+        num_records (int): The number of records.
+        fields (list): Field definitions from infer_fields().
+    Returns:
+        bytes: The header, including the field descriptors.
+    """
+    today = datetime.date.today()
+    header_length = 32 + 32 * len(fields) + 1
+    record_length = 1 + sum(f[2] for f in fields)
+    header = struct.pack(
+        "<4BIHH20x",
+        3,
+        today.year - 1900,
+        today.month,
+        today.day,
+        num_records,
+        header_length,
+        record_length,
+    )
+    for name, field_type, width, decimals in fields:
+        name = name.encode("utf-8")[:10]
+        header += struct.pack(
+            "<11sc4xBB14x", name, field_type.encode("ascii"), width, decimals
+        )
+    return header + b"\r"
+
+
+def csv_to_points(
+    in_csv,
+    out_shp,
+    latitude="latitude",
+    longitude="longitude",
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    workers=None,
+    encoding="utf-8",
+):
+    """Converts a csv file with latlon info to a point shapefile in chunks.
+    The csv is read twice, one chunk at a time: the first pass infers the field types
+    and widths, the second reads each chunk with those types, encodes its shapes and
+    records with NumPy and appends them to the output files.
+    Args:
+        in_csv (str): The input csv file containing longitude and latitude columns.
+        out_shp (str): The file path to the output shapefile.
+        latitude (str, optional): The column name of the latitude column. Defaults to 'latitude'.
+        longitude (str, optional): The column name of the longitude column. Defaults to 'longitude'.
+        chunk_size (int, optional): The number of rows per chunk. Defaults to 100000.
+        workers (int, optional): The number of processes used to analyze and encode chunks. Defaults to None (in-process).
+        encoding (str, optional): The encoding of the csv file. Defaults to 'utf-8'.
+    Raises:
+        ValueError: If a latitude or longitude value is not a number.
+    Returns:
+        dict: The number of rows, the elapsed seconds and the rows per second.
+    """
+    import pandas as pd
+
+    start = time.perf_counter()
+
+    def read_chunks(dtype=None):
+        return pd.read_csv(
+            in_csv,
+            dtype=dtype,
+            keep_default_na=False,
+            na_values=[""],
+            chunksize=chunk_size,
+            encoding=encoding,
+        )
+
+    executor = None
+    if workers is not None and workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(max_workers=workers)
+
+    try:
+        stats = None
+        for s in _imap(executor, field_stats, read_chunks()):
+            stats = merge_field_stats(stats, s)
+        if stats is None:
+            stats = {
+                name: {"kind": "empty"}
+                for name in pd.read_csv(in_csv, nrows=0, encoding=encoding).columns
+            }
+        rescan = [name for name, s in stats.items() if s.get("rescan")]
+        if len(rescan) > 0:
+            widths = text_widths(in_csv, rescan, chunk_size, encoding)
+            for name in rescan:
+                stats[name] = {"kind": "text", "bytes": widths[name]}
+        fields = infer_fields(stats)
+        dtypes = read_dtypes(stats, fields)
+
+        base = os.path.splitext(out_shp)[0]
+        num_records = 0
+        bbox = [np.inf, np.inf, -np.inf, -np.inf]
+
+        with open(base + ".shp", "wb") as shp, open(base + ".shx", "wb") as shx, open(
+            base + ".dbf", "wb"
+        ) as dbf:
+            shp.write(b"\0" * SHP_HEADER_SIZE)
+            shx.write(b"\0" * SHP_HEADER_SIZE)
+            dbf.write(dbf_header(0, fields))
+
+            encoded = _imap(
+                executor,
+                encode_chunk,
+                read_chunks(dtypes),
+                fields,
+                longitude,
+                latitude,
+            )
+            for x, y, dbf_records in encoded:
+                shp_records, shx_records = point_records(x, y, num_records)
+                shp.write(shp_records)
+                shx.write(shx_records)
+                dbf.write(dbf_records)
+                num_records += len(x)
+                bbox = [
+                    min(bbox[0], x.min()),
+                    min(bbox[1], y.min()),
+                    max(bbox[2], x.max()),
+                    max(bbox[3], y.max()),
+                ]
+
+            dbf.write(b"\x1a")
+            if num_records == 0:
+                bbox = [0.0, 0.0, 0.0, 0.0]
+            shp.seek(0)
+            shp.write(
+                shp_header(
+                    SHP_HEADER_SIZE + POINT_RECORD.itemsize * num_records, 1, bbox
+                )
+            )
+            shx.seek(0)
+            shx.write(
+                shp_header(
+                    SHP_HEADER_SIZE + INDEX_RECORD.itemsize * num_records, 1, bbox
+                )
+            )
+            dbf.seek(0)
+            dbf.write(dbf_header(num_records, fields))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    with open(base + ".prj", "w") as f:
+        f.write(WGS84_PRJ)
+    with open(base + ".cpg", "w") as f:
+        f.write("UTF-8")
+
+    seconds = time.perf_counter() - start
+    return {
+        "rows": num_records,
+        "seconds": seconds,
+        "rows_per_sec": num_records / seconds if seconds > 0 else float("inf"),
+    }
+
+
+def _imap(executor, func, iterable, *args):
+    # Like executor.map(), but only keeps a few chunks in flight so memory stays bounded.
+    if executor is None:
+        for item in iterable:
+            yield func(item, *args)
+        return
+
+    from collections import deque
+
+    pending = deque()
+    window = 2 * executor._max_workers
+    for item in iterable:
+        pending.append(executor.submit(func, item, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# Shape types decoded by read_shapefile(). Other types are read with pyshp.
+NULL_SHAPE = 0
+POINT_SHAPE = 1
+POLYLINE_SHAPE = 3
+READABLE_SHAPE_TYPES = (POINT_SHAPE, POLYLINE_SHAPE)
+
+
+def _take(raw, positions, dtype):
+    # Gathers values at arbitrary byte positions. Records are only 2-byte aligned, so the
+    # buffer is viewed once per alignment and each view serves the positions it lines up with.
+    dtype = np.dtype(dtype)
+    positions = np.asarray(positions, dtype="int64")
+    values = np.empty(len(positions), dtype=dtype)
+    residues = positions % dtype.itemsize
+    for residue in np.unique(residues):
+        view = np.frombuffer(
+            raw,
+            dtype=dtype,
+            count=(len(raw) - residue) // dtype.itemsize,
+            offset=int(residue),
+        )
+        mask = residues == residue
+        values[mask] = view[(positions[mask] - residue) // dtype.itemsize]
+    return values
+
+
+def _runs(starts, counts, step=1):
+    # Concatenates the ranges starts[i], starts[i] + step, ... of counts[i] values each.
+    counts = np.asarray(counts, dtype="int64")
+    total = int(counts.sum())
+    ends = np.cumsum(counts)
+    first = np.repeat(ends - counts, counts)
+    return np.repeat(np.asarray(starts, dtype="int64"), counts) + step * (
+        np.arange(total, dtype="int64") - first
+    )
+
+
+def shapefile_info(in_shp):
+    """Reads the shape type, bounding box and number of records of a shapefile.
+    Args:
+        in_shp (str): The file path to the shapefile.
+    Returns:
+        dict: The shape type, the [xmin, ymin, xmax, ymax] bounding box and the number of records.
+    """
+    with open(in_shp, "rb") as f:
+        header = f.read(SHP_HEADER_SIZE)
+    shape_type = struct.unpack("<i", header[32:36])[0]
+    bbox = list(struct.unpack("<4d", header[36:68]))
+    shx = os.path.splitext(in_shp)[0] + ".shx"
+    num_records = (os.path.getsize(shx) - SHP_HEADER_SIZE) // INDEX_RECORD.itemsize
+    return {"shape_type": shape_type, "bbox": bbox, "num_records": num_records}
+
+
+def read_geometries(in_shp, start=0, stop=None):
+    """Decodes the point or polyline records of a shapefile into flat NumPy arrays.
+    The .shp and .shx files are memory-mapped and each field of every record is gathered
+    with a single NumPy call. The arrays use the layout of layer_cache.encode_features().
+    Args:
+        in_shp (str): The file path to the shapefile.
+        start (int, optional): The first record to read. Defaults to 0.
+        stop (int, optional): The record to stop at. Defaults to None (the last record).
+    Raises:
+        ValueError: If the shapefile does not hold points or polylines.
+    Returns:
+        dict: The geometry types, the feature, part and ring offsets and the coordinates.
+    """
+    from .layer_cache import GEOMETRY_TYPES
+
+    shape_type = shapefile_info(in_shp)["shape_type"]
+    if shape_type not in READABLE_SHAPE_TYPES:
+        raise ValueError("Only point and polyline shapefiles can be read with NumPy.")
+
+    base = os.path.splitext(in_shp)[0]
+    index = np.memmap(
+        base + ".shx", dtype=INDEX_RECORD, mode="r", offset=SHP_HEADER_SIZE
+    )[start:stop]
+    raw = np.memmap(in_shp, dtype="uint8", mode="r")
+    offsets = index["offset"].astype("int64") * 2
+    count = len(offsets)
+    is_null = _take(raw, offsets + 8, "<i4") == NULL_SHAPE
+
+    if shape_type == POINT_SHAPE:
+        valid = offsets[~is_null]
+        coords = np.column_stack(
+            [_take(raw, valid + 12, "<f8"), _take(raw, valid + 20, "<f8")]
+        )
+        types = np.where(is_null, 0, GEOMETRY_TYPES["Point"]).astype("int8")
+        feature_offsets = np.concatenate([[0], np.cumsum(~is_null)])
+        part_offsets = np.arange(len(valid) + 1, dtype="int64")
+        ring_offsets = np.arange(len(valid) + 1, dtype="int64")
+    else:
+        valid = offsets[~is_null]
+        num_parts = np.zeros(count, dtype="int64")
+        num_points = np.zeros(count, dtype="int64")
+        num_parts[~is_null] = _take(raw, valid + 44, "<i4")
+        num_points[~is_null] = _take(raw, valid + 48, "<i4")
+
+        # Points follow the part indices, which follow the 44 byte record header.
+        point_starts = _runs(offsets + 52 + 4 * num_parts, num_points, 16)
+        coords = np.column_stack(
+            [_take(raw, point_starts, "<f8"), _take(raw, point_starts + 8, "<f8")]
+        )
+
+        # A polyline is one part whose rings are its lines. A polyline without parts
+        # still gets one empty line, like the pyshp GeoJSON.
+        num_rings = np.where(is_null, 0, np.maximum(num_parts, 1))
+        first_point = np.cumsum(num_points) - num_points
+        ring_index = np.cumsum(num_rings) - num_rings
+        ring_starts = np.repeat(first_point, num_rings)
+        has_parts = num_parts > 0
+        part_starts = _take(
+            raw,
+            _runs(offsets[has_parts] + 52, num_parts[has_parts], 4),
+            "<i4",
+        )
+        ring_starts[_runs(ring_index[has_parts], num_parts[has_parts])] += part_starts
+
+        types = np.where(
+            num_parts > 1,
+            GEOMETRY_TYPES["MultiLineString"],
+            GEOMETRY_TYPES["LineString"],
+        )
+        types = np.where(is_null, 0, types).astype("int8")
+        feature_offsets = np.concatenate([[0], np.cumsum(~is_null)])
+        part_offsets = np.concatenate([[0], np.cumsum(num_rings[~is_null])])
+        ring_offsets = np.concatenate([ring_starts, [len(coords)]])
+
+    return {
+        "types": types,
+        "feature_offsets": feature_offsets.astype("int64"),
+        "part_offsets": part_offsets.astype("int64"),
+        "ring_offsets": ring_offsets.astype("int64"),
+        "coords": coords.reshape(-1, 2),
+    }
+
+
+def _dbf_fields(f):
+    num_records, header_length, record_length = struct.unpack("<4xIHH20x", f.read(32))
+    fields = []
+    while True:
+        descriptor = f.read(32)
+        if len(descriptor) < 32 or descriptor[0:1] == b"\r":
+            break
+        name, field_type, width, decimals = struct.unpack("<11sc4xBB14x", descriptor)
+        name = name.split(b"\0", 1)[0].decode("ascii", "replace")
+        fields.append((name, field_type.decode("ascii"), width, decimals))
+    return num_records, header_length, record_length, fields
+
+
+def _decode_column(values, field_type, decimals, encoding):
+    import pandas as pd
+
+    stripped = np.char.strip(values, b" \0*")
+    missing = stripped == b""
+    if field_type in ("N", "F"):
+        column = np.full(len(values), None, dtype=object)
+        try:
+            numbers = stripped[~missing].astype("float64")
+        except ValueError:
+            # Values that are not numbers become None, like with pyshp.
+            numbers = pd.to_numeric(
+                pd.Series(np.char.decode(stripped, "ascii", "replace")),
+                errors="coerce",
+            )
+            missing |= numbers.isna().to_numpy()
+            numbers = stripped[~missing].astype("float64")
+        if decimals == 0 and field_type == "N":
+            try:
+                numbers = stripped[~missing].astype("int64")
+            except (ValueError, OverflowError):
+                numbers = numbers.astype("int64")
+        column[~missing] = numbers.tolist()
+        return column.tolist()
+    if field_type == "D":
+        # GeoJSON properties keep dates as the YYYYMMDD text, as pyshp does.
+        text = np.char.decode(stripped, "ascii", "replace")
+        missing |= np.char.strip(text, "0") == ""
+        column = np.array(text, dtype=object)
+        column[missing] = None
+        return column.tolist()
+    if field_type == "L":
+        column = np.full(len(values), None, dtype=object)
+        column[np.isin(values, [b"Y", b"y", b"T", b"t", b"1"])] = True
+        column[np.isin(values, [b"N", b"n", b"F", b"f", b"0"])] = False
+        return column.tolist()
+    return np.char.decode(np.char.rstrip(values, b" \0"), encoding).tolist()
+
+
+def read_records(in_dbf, start=0, stop=None, encoding=None):
+    """Reads the attributes of a .dbf file one whole column at a time.
+    The file is memory-mapped as fixed-width records and each column is decoded with
+    vectorized NumPy calls. Values are the same as in the pyshp GeoJSON properties.
+    Args:
+        in_dbf (str): The file path to the .dbf file.
+        start (int, optional): The first record to read. Defaults to 0.
+        stop (int, optional): The record to stop at. Defaults to None (the last record).
+        encoding (str, optional): The encoding of text fields. Defaults to the .cpg file, or 'utf-8'.
+    Returns:
+        tuple: A dict of column lists and a boolean array marking deleted records.
+    """
+    if encoding is None:
+        cpg = os.path.splitext(in_dbf)[0] + ".cpg"
+        encoding = "utf-8"
+        if os.path.exists(cpg):
+            with open(cpg) as f:
+                encoding = f.read().strip() or encoding
+
+    with open(in_dbf, "rb") as f:
+        num_records, header_length, record_length, fields = _dbf_fields(f)
+
+    dtype = [("deleted", "S1")] + [
+        (name, "S{}".format(width)) for name, _, width, _ in fields
+    ]
+    dtype = np.dtype(
+        {
+            "names": [d[0] for d in dtype],
+            "formats": [d[1] for d in dtype],
+            "itemsize": record_length,
+        }
+    )
+    records = np.memmap(
+        in_dbf, dtype=dtype, mode="r", offset=header_length, shape=(num_records,)
+    )[start:stop]
+
+    columns = {}
+    for name, field_type, width, decimals in fields:
+        columns[name] = _decode_column(
+            np.array(records[name]), field_type, decimals, encoding
+        )
+    return columns, np.array(records["deleted"]) == b"*"
+
+
+def read_shapefile(in_shp, start=0, stop=None, encoding=None):
+    """Reads a point or polyline shapefile as GeoJSON without going through pyshp.
+    Args:
+        in_shp (str): The file path to the shapefile.
+        start (int, optional): The first record to read. Defaults to 0.
+        stop (int, optional): The record to stop at. Defaults to None (the last record).
+        encoding (str, optional): The encoding of text fields. Defaults to the .cpg file, or 'utf-8'.
+    Raises:
+        ValueError: If the shapefile does not hold points or polylines.
+    Returns:
+        dict: The GeoJSON FeatureCollection. Deleted records are skipped.
+    """
+    from .layer_cache import decode_features
+
+    arrays = read_geometries(in_shp, start, stop)
+    columns, deleted = read_records(
+        os.path.splitext(in_shp)[0] + ".dbf", start, stop, encoding
+    )
+    geojson = decode_features(
+        arrays,
+        {"columns": columns, "members": {"bbox": shapefile_info(in_shp)["bbox"]}},
+    )
+    if deleted.any():
+        geojson["features"] = [
+            feature
+            for feature, is_deleted in zip(geojson["features"], deleted)
+            if not is_deleted
+        ]
+    return geojson
@@ -0,0 +1,87 @@
+"""Module for shrinking GeoJSON before it is sent to the map. Geometries are simplified with
+Douglas-Peucker and their coordinates snapped to a fixed number of decimals, both in
+vectorized shapely/NumPy calls over all the features of a layer.
+"""
+
+import json
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from .vector_tiles import TILE_SIZE
+
+
+def tolerance_for_zoom(zoom, pixels=1.0):
+    """Returns the simplification tolerance matching a number of screen pixels at a zoom level.
+    Args:
+        zoom (int): The zoom level.
+        pixels (float, optional): The tolerance in screen pixels. Defaults to 1.
+    Returns:
+        float: The tolerance in degrees.
+    """
+    return pixels * 360.0 / (TILE_SIZE * 2**zoom)
+
+
+def precision_for_zoom(zoom):
+    """Returns the number of decimals needed to place coordinates within a pixel at a zoom level.
+    Args:
+        zoom (int): The zoom level.
+    Returns:
+        int: The number of decimals.
+    """
+    return max(0, int(np.ceil(np.log10(1.0 / tolerance_for_zoom(zoom)))))
+
+
+def geojson_size(geojson):
+    """Returns the size of a GeoJSON object once serialized, as sent to the front end.
+    Args:
+        geojson (dict): The GeoJSON object.
+    Returns:
+        int: The size in bytes.
+    """
+    return len(json.dumps(geojson).encode("utf-8"))
+
+
+def simplify_geojson(geojson, tolerance=None, precision=None, preserve_topology=True):
+    """Simplifies the geometries of a GeoJSON FeatureCollection and rounds their coordinates.
+    Args:
+        geojson (dict): A GeoJSON FeatureCollection.
+        tolerance (float, optional): The Douglas-Peucker tolerance in degrees. Defaults to None (no simplification).
+        precision (int, optional): The number of decimals kept in the coordinates. Defaults to None (no rounding).
+        preserve_topology (bool, optional): Whether to keep every geometry valid, so rings never collapse or cross. Defaults to True.
+    Returns:
+        tuple: The simplified FeatureCollection and a dict with the number of bytes and vertices before and after.
+    """
+    features = geojson.get("features", [])
+    geometries = np.array(
+        [shape(f["geometry"]) if f.get("geometry") else None for f in features],
+        dtype=object,
+    ).reshape(-1)
+
+    stats = {
+        "features": len(features),
+        "bytes_before": geojson_size(geojson),
+        "vertices_before": int(shapely.get_num_coordinates(geometries).sum()),
+    }
+
+    if tolerance:
+        geometries = shapely.simplify(
+            geometries, tolerance, preserve_topology=preserve_topology
+        )
+    if precision is not None:
+        # Snapping to the grid, unlike rounding each coordinate, keeps the geometries
+        # valid: collapsed rings are dropped and crossing edges are noded.
+        geometries = shapely.set_precision(geometries, 10.0**-precision)
+
+    simplified = []
+    for feature, text in zip(features, shapely.to_geojson(geometries)):
+        feature = dict(feature)
+        feature["geometry"] = json.loads(text) if text is not None else None
+        simplified.append(feature)
+    result = dict(geojson)
+    result["features"] = simplified
+
+    stats["vertices_after"] = int(shapely.get_num_coordinates(geometries).sum())
+    stats["bytes_after"] = geojson_size(result)
+    return result, stats
@@ -0,0 +1,135 @@
+"""Module for querying the features of vector layers by location. Each SpatialIndex keeps
+the layer geometries in a shapely STRtree built over their bounding boxes, so point, box
+and region queries do not scan every feature.
+"""
+
+import math
+
+import numpy as np
+import shapely
+import shapely.affinity
+from shapely.geometry import shape
+
+# Meters per degree of latitude, used to turn drawn circles into polygons.
+METERS_PER_DEGREE = 111320.0
+
+
+def roi_to_geometry(roi):
+    """Converts a drawn region of interest to a shapely geometry.
+    Circles drawn with the DrawControl are GeoJSON points with a radius in meters, and are
+    approximated by a polygon.
+    Args:
+        roi (dict): A GeoJSON feature or geometry.
+    Returns:
+        shapely.Geometry: The region of interest.
+    """
+    if roi.get("type") == "Feature":
+        style = (roi.get("properties") or {}).get("style") or {}
+        geometry = shape(roi["geometry"])
+        radius = style.get("radius")
+        if radius is not None and geometry.geom_type == "Point":
+            scale = math.cos(math.radians(geometry.y))
+            circle = geometry.buffer(radius / METERS_PER_DEGREE)
+            return shapely.affinity.scale(
+                circle, xfact=1 / max(scale, 1e-6), yfact=1, origin=geometry
+            )
+        return geometry
+    return shape(roi)
+
+
+def _geometries(features):
+    geometries = np.empty(len(features), dtype=object)
+    points = []
+    for i, feature in enumerate(features):
+        geometry = feature.get("geometry")
+        if geometry is None:
+            geometries[i] = None
+        elif geometry["type"] == "Point":
+            points.append(i)
+        else:
+            geometries[i] = shape(geometry)
+
+    # Points are by far the most common large layers, so they are built in one call.
+    if len(points) > 0:
+        coords = np.array(
+            [features[i]["geometry"]["coordinates"][:2] for i in points],
+            dtype="float64",
+        )
+        geometries[points] = shapely.points(coords)
+    return geometries
+
+
+class SpatialIndex:
+    """An STR-tree over the features of a GeoJSON FeatureCollection.
+    Args:
+        geojson (dict): A GeoJSON FeatureCollection.
+    """
+
+    def __init__(self, geojson):
+        self.features = geojson.get("features", [])
+        self.geometries = _geometries(self.features)
+        self.tree = shapely.STRtree(self.geometries)
+
+    def __len__(self):
+        return len(self.features)
+
+    def query(self, geometry, predicate="intersects"):
+        """Returns the indices of the features that satisfy a predicate with a geometry.
+        Args:
+            geometry (shapely.Geometry): The query geometry.
+            predicate (str, optional): A shapely predicate, e.g. 'intersects', 'within' or 'contains'. Defaults to 'intersects'.
+        Returns:
+            list: The sorted feature indices.
+        """
+        return sorted(self.tree.query(geometry, predicate=predicate).tolist())
+
+    def query_point(self, lon, lat, tolerance=0):
+        """Returns the indices of the features at a location.
+        Points and lines have no area, so clicking them needs a tolerance.
+        Args:
+            lon (float): The longitude.
+            lat (float): The latitude.
+            tolerance (float, optional): The distance in degrees within which features match. Defaults to 0.
+        Returns:
+            list: The sorted feature indices.
+        """
+        point = shapely.Point(lon, lat)
+        if tolerance > 0:
+            return sorted(
+                self.tree.query(point, predicate="dwithin", distance=tolerance).tolist()
+            )
+        return self.query(point)
+
+    def query_bbox(self, west, south, east, north):
+        """Returns the indices of the features intersecting a bounding box.
+        Args:
+            west (float): The western longitude.
+            south (float): The southern latitude.
+            east (float): The eastern longitude.
+            north (float): The northern latitude.
+        Returns:
+            list: The sorted feature indices.
+        """
+        return self.query(shapely.box(west, south, east, north))
+
+    def query_roi(self, roi, predicate="intersects"):
+        """Returns the indices of the features intersecting a drawn region of interest.
+        Args:
+            roi (dict): A GeoJSON feature or geometry, e.g. Map.user_roi.
+            predicate (str, optional): A shapely predicate. Defaults to 'intersects'.
+        Returns:
+            list: The sorted feature indices.
+        """
+        return self.query(roi_to_geometry(roi), predicate)
+
+    def to_geojson(self, indices):
+        """Returns some of the features as a GeoJSON FeatureCollection.
+        Args:
+            indices (list): The feature indices.
+        Returns:
+            dict: The GeoJSON FeatureCollection.
+        """
+        return {
+            "type": "FeatureCollection",
+            "features": [self.features[i] for i in indices],
+        }
@@ -0,0 +1,508 @@
+"""Module for rendering maps to static PNG images without a browser, e.g. for nightly
+reports. The tiles of the basemaps and Earth Engine layers covering a bounding box are
+fetched concurrently over pooled HTTP connections, and composited with the GeoJSON layers,
+which are rasterized in the kernel. render_maps() renders many maps in a process pool.
+
+    m = nclpy.Map(headless=True)
+    m.add_ee_layer(image, vis_params, "NDVI")
+    m.to_png("ndvi.png", bbox=[-84.4, 33.8, -75.4, 36.6], zoom=7)
+
+    jobs = [map_spec(m, bbox, zoom=9, out_png=name + ".png") for name, bbox in counties]
+    errors = render_maps(jobs)
+"""
+
+import http.client
+import io
+import math
+import os
+import queue
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TILE_SIZE = 256
+
+# Number of connections kept open to each tile server, and of tiles fetched at a time.
+HTTP_POOL_SIZE = 8
+
+# Largest image rendered, to catch a zoom level too high for the bounding box.
+MAX_IMAGE_PIXELS = 8192 * 8192
+
+MAX_LATITUDE = 85.0511287798
+
+# Leaflet's default path style, used for the keys a layer style does not set.
+DEFAULT_STYLE = {
+    "stroke": True,
+    "color": "#3388ff",
+    "weight": 3,
+    "opacity": 1.0,
+    "fill": True,
+    "fillOpacity": 0.2,
+    "radius": 5,
+}
+
+
+def lonlat_to_pixel(lon, lat, zoom):
+    """Converts longitudes and latitudes to Web Mercator pixel coordinates.
+    Args:
+        lon (float|numpy.ndarray): The longitudes.
+        lat (float|numpy.ndarray): The latitudes.
+        zoom (int): The zoom level.
+    Returns:
+        tuple: The x and y pixel coordinates, counted from the north-west corner of the world.
+    """
+    size = TILE_SIZE * 2.0**zoom
+    lat = np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)
+    sin = np.sin(np.radians(lat))
+    x = (np.asarray(lon) + 180.0) / 360.0 * size
+    y = (0.5 - np.log((1 + sin) / (1 - sin)) / (4 * math.pi)) * size
+    return x, y
+
+
+def pixel_window(bbox, zoom):
+    """Returns the pixel window of a bounding box at a zoom level.
+    Args:
+        bbox (list): The bounding box as [west, south, east, north] in degrees.
+        zoom (int): The zoom level.
+    Raises:
+        ValueError: If the bounding box is empty, or the image would be too large.
+    Returns:
+        tuple: The (left, top, width, height) of the window in pixels.
+    """
+    west, south, east, north = bbox
+    if west >= east or south >= north:
+        raise ValueError("The bounding box {} is empty.".format(list(bbox)))
+    left, top = lonlat_to_pixel(west, north, zoom)
+    right, bottom = lonlat_to_pixel(east, south, zoom)
+    left, top = int(math.floor(left)), int(math.floor(top))
+    width = max(int(math.ceil(right)) - left, 1)
+    height = max(int(math.ceil(bottom)) - top, 1)
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValueError(
+            "A {}x{} image is too large; use a lower zoom level.".format(width, height)
+        )
+    return left, top, width, height
+
+
+def window_tiles(left, top, width, height, zoom):
+    """Returns the tiles covering a pixel window.
+    Args:
+        left (int): The left edge of the window in pixels.
+        top (int): The top edge of the window in pixels.
+        width (int): The width of the window in pixels.
+        height (int): The height of the window in pixels.
+        zoom (int): The zoom level.
+    Returns:
+        list: The (x, y) of each tile, row by row.
+    """
+    n = 1 << zoom
+    rows = range(max(top // TILE_SIZE, 0), min((top + height - 1) // TILE_SIZE + 1, n))
+    columns = range(left // TILE_SIZE, (left + width - 1) // TILE_SIZE + 1)
+    return [(x, y) for y in rows for x in columns]
+
+
+def tile_url(template, z, x, y):
+    """Fills in an XYZ tile URL template. Columns wrap around the antimeridian.
+    Args:
+        template (str): The URL template, e.g. 'https://tile.openstreetmap.org/{z}/{x}/{y}.png'.
+        z (int): The zoom level.
+        x (int): The tile column.
+        y (int): The tile row.
+    Returns:
+        str: The tile URL.
+    """
+    # Templates can hold other braces, e.g. in query strings, so str.format() is not used.
+    url = template.replace("{s}", "a").replace("{r}", "")
+    url = url.replace("{z}", str(z)).replace("{x}", str(x % (1 << z)))
+    return url.replace("{y}", str(y))
+
+
+class TileClient:
+    """Fetches tiles over HTTP. Connections to each server are kept open between requests,
+    and tiles are fetched on a thread pool.
+    Args:
+        pool_size (int, optional): The number of connections kept open to each server, and of tiles fetched at a time. Defaults to 8.
+        timeout (float, optional): The timeout of a request in seconds. Defaults to 10.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, timeout=10):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.requests = 0
+        self.connections = 0
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(pool_size, thread_name_prefix="nclpy-tiles")
+
+    def _pool(self, scheme, netloc):
+        with self._lock:
+            pool = self._pools.get((scheme, netloc))
+            if pool is None:
+                pool = (queue.LifoQueue(), threading.BoundedSemaphore(self.pool_size))
+                self._pools[(scheme, netloc)] = pool
+            return pool
+
+    def _connect(self, scheme, netloc):
+        with self._lock:
+            self.connections += 1
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _request(self, connection, path):
+        connection.request("GET", path, headers={"User-Agent": "nclpy-static-maps"})
+        response = connection.getresponse()
+        return response, response.read()
+
+    def fetch(self, url):
+        """Fetches a tile.
+        Args:
+            url (str): The tile URL.
+        Raises:
+            OSError: If the server could not be reached or returned an error.
+        Returns:
+            bytes: The tile, or None if the server does not have it.
+        """
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError("Only http and https tile URLs are supported: " + url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        connections, semaphore = self._pool(parts.scheme, parts.netloc)
+
+        with semaphore:
+            try:
+                connection = connections.get_nowait()
+                reused = True
+            except queue.Empty:
+                connection = self._connect(parts.scheme, parts.netloc)
+                reused = False
+            with self._lock:
+                self.requests += 1
+            try:
+                try:
+                    response, data = self._request(connection, path)
+                except (http.client.HTTPException, OSError):
+                    # The server may have closed a connection that was kept open.
+                    connection.close()
+                    if not reused:
+                        raise
+                    connection = self._connect(parts.scheme, parts.netloc)
+                    response, data = self._request(connection, path)
+            except http.client.HTTPException as e:
+                connection.close()
+                raise OSError("Could not fetch {}: {!r}".format(url, e))
+            except OSError:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                connections.put(connection)
+
+        if response.status in (204, 404):
+            return None
+        if response.status != 200:
+            raise OSError("{} returned HTTP {}.".format(url, response.status))
+        return data
+
+    def fetch_many(self, urls):
+        """Fetches tiles concurrently.
+        Args:
+            urls (list): The tile URLs.
+        Raises:
+            OSError: If a tile could not be fetched.
+        Returns:
+            list: The tiles, in the order of the URLs, with None for the missing ones.
+        """
+        return list(self._executor.map(self.fetch, urls))
+
+    def close(self):
+        """Stops the fetching threads and closes the open connections."""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools = {}
+        for connections, _ in pools:
+            while True:
+                try:
+                    connections.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+def _features(geojson):
+    if geojson.get("type") == "FeatureCollection":
+        return geojson.get("features", [])
+    if geojson.get("type") == "Feature":
+        return [geojson]
+    return [{"type": "Feature", "properties": {}, "geometry": geojson}]
+
+
+def _geometries(geometry):
+    if geometry is None:
+        return
+    if geometry["type"] == "GeometryCollection":
+        for part in geometry["geometries"]:
+            yield from _geometries(part)
+    elif geometry["type"].startswith("Multi"):
+        for coordinates in geometry["coordinates"]:
+            yield geometry["type"][5:], coordinates
+    else:
+        yield geometry["type"], geometry["coordinates"]
+
+
+def _color(color, opacity):
+    from PIL import ImageColor
+
+    return ImageColor.getrgb(color)[:3] + (int(round(255 * opacity)),)
+
+
+def rasterize_geojson(geojson, style, window, zoom):
+    """Draws GeoJSON features onto a transparent image.
+    Args:
+        geojson (dict): A GeoJSON FeatureCollection, Feature or geometry.
+        style (dict): The Leaflet path style of the layer, e.g. color, weight, opacity, fillColor, fillOpacity and radius (for points).
+        window (tuple): The (left, top, width, height) pixel window, see pixel_window().
+        zoom (int): The zoom level.
+    Returns:
+        PIL.Image.Image: The RGBA image.
+    """
+    from PIL import Image, ImageDraw
+
+    left, top, width, height = window
+    style = dict(DEFAULT_STYLE, **(style or {}))
+    stroke = _color(style["color"], style["opacity"]) if style["stroke"] else None
+    fill = None
+    if style["fill"]:
+        fill = _color(style.get("fillColor") or style["color"], style["fillOpacity"])
+    weight = max(int(round(style["weight"])), 1)
+    radius = style["radius"]
+
+    image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+
+    def pixels(coordinates):
+        coordinates = np.asarray(coordinates, dtype="float64").reshape(-1, 2)
+        x, y = lonlat_to_pixel(coordinates[:, 0], coordinates[:, 1], zoom)
+        return list(zip((x - left).tolist(), (y - top).tolist()))
+
+    for feature in _features(geojson):
+        for kind, coordinates in _geometries(feature.get("geometry")):
+            if kind == "Point":
+                ((x, y),) = pixels(coordinates[:2])
+                box = [x - radius, y - radius, x + radius, y + radius]
+                draw.ellipse(box, fill=fill, outline=stroke, width=weight)
+            elif kind == "LineString" and stroke is not None:
+                draw.line(pixels(coordinates), fill=stroke, width=weight, joint="curve")
+            elif kind == "Polygon" and len(coordinates) > 0:
+                rings = [pixels(ring) for ring in coordinates if len(ring) > 2]
+                if fill is not None and rings:
+                    draw.polygon(rings[0], fill=fill)
+                    for hole in rings[1:]:
+                        draw.polygon(hole, fill=(0, 0, 0, 0))
+                if stroke is not None:
+                    for ring in rings:
+                        draw.line(ring, fill=stroke, width=weight, joint="curve")
+    return image
+
+
+def _tile_image(data):
+    from PIL import Image
+
+    tile = Image.open(io.BytesIO(data)).convert("RGBA")
+    if tile.size != (TILE_SIZE, TILE_SIZE):
+        tile = tile.resize((TILE_SIZE, TILE_SIZE), Image.BILINEAR)
+    return tile
+
+
+def _set_opacity(image, opacity):
+    if opacity < 1:
+        alpha = image.getchannel("A").point(lambda a: int(round(a * opacity)))
+        image.putalpha(alpha)
+    return image
+
+
+def render_map(bbox, zoom, layers, out_png=None, client=None):
+    """Renders a map to a PNG image. The tiles of all the tile layers are fetched at once.
+    Args:
+        bbox (list): The bounding box as [west, south, east, north] in degrees.
+        zoom (int): The zoom level.
+        layers (list): The layers from bottom to top, see map_layers(). Each is a dict with a 'type' of 'tiles' (with 'url' and 'opacity') or 'geojson' (with 'data' and 'style').
+        out_png (str, optional): The file path to write the image to. Defaults to None.
+        client (TileClient, optional): The client fetching the tiles. Defaults to a new TileClient, closed afterwards.
+    Raises:
+        ValueError: If the bounding box is empty or too large for the zoom level.
+        OSError: If a tile could not be fetched.
+    Returns:
+        bytes: The PNG image.
+    """
+    from PIL import Image
+
+    window = pixel_window(bbox, zoom)
+    left, top, width, height = window
+    tiles = window_tiles(left, top, width, height, zoom)
+    tile_layers = [layer for layer in layers if layer["type"] == "tiles"]
+    urls = [
+        tile_url(layer["url"], zoom, x, y) for layer in tile_layers for x, y in tiles
+    ]
+
+    if client is None:
+        client = TileClient()
+        try:
+            data = iter(client.fetch_many(urls))
+        finally:
+            client.close()
+    else:
+        data = iter(client.fetch_many(urls))
+
+    image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    for layer in layers:
+        if layer["type"] == "tiles":
+            overlay = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+            for x, y in tiles:
+                tile = next(data)
+                if tile is not None:
+                    offset = (x * TILE_SIZE - left, y * TILE_SIZE - top)
+                    overlay.paste(_tile_image(tile), offset)
+        elif layer["type"] == "geojson":
+            overlay = rasterize_geojson(layer["data"], layer.get("style"), window, zoom)
+        else:
+            raise ValueError("Unknown layer type: {}".format(layer["type"]))
+        image.alpha_composite(_set_opacity(overlay, layer.get("opacity", 1.0)))
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    png = buffer.getvalue()
+    if out_png is not None:
+        out_dir = os.path.dirname(os.path.abspath(out_png))
+        os.makedirs(out_dir, exist_ok=True)
+        with open(out_png, "wb") as f:
+            f.write(png)
+    return png
+
+
+def map_layers(m, bbox=None, zoom=None):
+    """Returns the visible layers of a map in the form render_map() takes. Tile layers,
+    basemaps and Earth Engine layers included, are kept as URL templates; GeoJSON layers
+    carry their data. Other layers are skipped.
+    Args:
+        m (Map): The map.
+        bbox (list, optional): The bounding box to be rendered, used to only keep the features of tiled GeoJSON layers in it. Defaults to None.
+        zoom (int, optional): The zoom level to be rendered, used to simplify tiled GeoJSON layers. Defaults to the zoom of the map.
+    Returns:
+        list: The layers from bottom to top.
+    """
+    import ipyleaflet
+
+    zoom = int(m.zoom) if zoom is None else zoom
+    tiled = {tiles.layer.model_id: tiles.index for tiles in m.vector_tiles.values()}
+
+    def tiled_features(index):
+        if bbox is None:
+            indices = range(len(index))
+        else:
+            tiles = window_tiles(*pixel_window(bbox, zoom), zoom)
+            found = [index.tile_features(zoom, x % (1 << zoom), y) for x, y in tiles]
+            indices = np.unique(np.concatenate(found)) if found else []
+        features = [index.feature(int(i), zoom) for i in indices]
+        return [feature for feature in features if feature is not None]
+
+    def convert(layer):
+        if not getattr(layer, "visible", True):
+            return []
+        # GeoJSON layers are LayerGroups too, so they are checked first.
+        if isinstance(layer, ipyleaflet.GeoJSON):
+            data = layer.data
+            if layer.model_id in tiled:
+                features = tiled_features(tiled[layer.model_id])
+                data = {"type": "FeatureCollection", "features": features}
+            return [{"type": "geojson", "data": data, "style": dict(layer.style)}]
+        if isinstance(layer, ipyleaflet.LayerGroup):
+            return [spec for child in layer.layers for spec in convert(child)]
+        if isinstance(layer, ipyleaflet.TileLayer):
+            return [{"type": "tiles", "url": layer.url, "opacity": layer.opacity}]
+        return []
+
+    return [spec for layer in m.layers for spec in convert(layer)]
+
+
+def map_spec(m, bbox=None, zoom=None, out_png=None):
+    """Describes a map as a render job, for render_map() or render_maps().
+    Args:
+        m (Map): The map.
+        bbox (list, optional): The bounding box as [west, south, east, north] in degrees. Defaults to the bounds of the map as last shown.
+        zoom (int, optional): The zoom level. Defaults to the zoom of the map.
+        out_png (str, optional): The file path to write the image to. Defaults to None.
+    Raises:
+        ValueError: If no bounding box is given and the map has not been shown yet.
+    Returns:
+        dict: The bbox, zoom, layers and out_png of the job.
+    """
+    if bbox is None:
+        if not m.bounds:
+            raise ValueError("The map has not been shown yet, so a bbox is required.")
+        (south, west), (north, east) = m.bounds
+        bbox = [west, south, east, north]
+    zoom = int(round(m.zoom)) if zoom is None else zoom
+    return {
+        "bbox": list(bbox),
+        "zoom": zoom,
+        "layers": map_layers(m, bbox, zoom),
+        "out_png": out_png,
+    }
+
+
+# The tile client of a render_maps() worker process, reused by all its jobs.
+_worker_client = None
+
+
+def _init_worker(pool_size):
+    global _worker_client
+    _worker_client = TileClient(pool_size)
+
+
+def _render_job(job):
+    render_map(client=_worker_client, **job)
+    return job["out_png"]
+
+
+def render_maps(jobs, processes=None, pool_size=HTTP_POOL_SIZE):
+    """Renders maps to PNG files in a process pool. Each worker process keeps its own
+    pooled tile client for all the maps it renders.
+    Args:
+        jobs (list): The render jobs, see map_spec(). Each must have an out_png.
+        processes (int, optional): The number of worker processes. Defaults to the number of CPUs.
+        pool_size (int, optional): The number of tiles each process fetches at a time. Defaults to 8.
+    Returns:
+        dict: The exceptions of the maps that could not be rendered, keyed by their out_png.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    for job in jobs:
+        if not job.get("out_png"):
+            raise ValueError("Each job needs an out_png to write the image to.")
+
+    errors = {}
+    # Worker processes are spawned rather than forked, since the kernel runs threads,
+    # e.g. those of the tile proxy.
+    with ProcessPoolExecutor(
+        processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(pool_size,),
+    ) as executor:
+        futures = [(job["out_png"], executor.submit(_render_job, job)) for job in jobs]
+        for out_png, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors[out_png] = e
+
+    for out_png, error in errors.items():
+        print("Could not render {}: {}".format(out_png, error))
+    return errors
@@ -0,0 +1,531 @@
+"""Module for serving basemap tiles through a local caching proxy. Basemap TileLayer URLs are
+rewritten to point at a small HTTP server running in the kernel, which keeps the tiles in an
+on-disk LRU cache, fetches each missing tile from upstream only once however many requests
+ask for it at the same time, and prefetches a few tiles around the ones being viewed.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_TILE_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "nclpy", "tiles"
+)
+
+DEFAULT_TILE_CACHE_SIZE = 512 * 1024 * 1024
+
+# Maximum number of prefetch requests waiting to be sent upstream.
+MAX_PREFETCH_QUEUE = 256
+
+# Number of tiles prefetched around the tiles requested in one view.
+DEFAULT_PREFETCH = 4
+
+# Seconds without requests after which the tiles requested so far are taken as the view.
+PREFETCH_DELAY = 0.25
+
+# The cache directory is rescanned after this share of its maximum size is written, so
+# the tiles written by other kernels sharing the directory count towards the limit.
+RESCAN_FRACTION = 1 / 16
+
+
+def tile_content_type(data):
+    """Guesses the content type of a tile from its first bytes.
+    Args:
+        data (bytes): The tile.
+    Returns:
+        str: The content type.
+    """
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class TileCache:
+    """A size-bounded on-disk LRU cache of tiles.
+    The directory can be shared by several kernels. Each one reads the tiles the others
+    wrote, marks the tiles it reads by their modification time, and rescans the directory
+    regularly so that the limit applies to all the tiles in it.
+    Args:
+        cache_dir (str, optional): The cache directory. Defaults to ~/.cache/nclpy/tiles.
+        max_size (int, optional): The maximum size of the cache in bytes. Defaults to 512 MB.
+    """
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_TILE_CACHE_SIZE):
+        self.cache_dir = cache_dir or DEFAULT_TILE_CACHE_DIR
+        self.max_size = max_size
+        self.size = 0
+        self._written = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._scan()
+
+    def _scan(self):
+        # Tiles left by earlier sessions or written by other kernels are picked up,
+        # least recently used first.
+        with self._scan_lock:
+            with self._lock:
+                order = {path: i for i, path in enumerate(self._entries)}
+            found = []
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append(
+                        (stat.st_mtime, order.get(path, -1), path, stat.st_size)
+                    )
+            # Tiles with the same modification time keep the order this kernel used.
+            entries = OrderedDict((path, size) for _, _, path, size in sorted(found))
+            with self._lock:
+                self._entries = entries
+                self.size = sum(entries.values())
+                self._written = 0
+
+    def _path(self, tile):
+        key, z, x, y = tile
+        return os.path.join(self.cache_dir, key, str(z), str(x), str(y))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, tile):
+        """Returns a cached tile.
+        Args:
+            tile (tuple): The (source key, z, x, y) of the tile.
+        Returns:
+            bytes: The tile, or None if it is not cached.
+        """
+        path = self._path(tile)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Other kernels evict by modification time.
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.size -= self._entries.pop(path, 0)
+            return None
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+            else:
+                # Written by another kernel.
+                self._entries[path] = len(data)
+                self.size += len(data)
+        return data
+
+    def put(self, tile, data):
+        """Adds a tile, removing the least recently used tiles beyond max_size.
+        Args:
+            tile (tuple): The (source key, z, x, y) of the tile.
+            data (bytes): The tile.
+        """
+        path = self._path(tile)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+
+        with self._lock:
+            self.size += len(data) - self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            self._written += len(data)
+            rescan = self._written >= self.max_size * RESCAN_FRACTION
+        if rescan:
+            self._scan()
+
+        evicted = []
+        with self._lock:
+            while self.size > self.max_size and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                self.size -= old_size
+                evicted.append(old_path)
+        for old_path in evicted:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def __contains__(self, tile):
+        return self._path(tile) in self._entries
+
+
+class _Pending:
+    """A tile being fetched from upstream, shared by all the requests waiting for it."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.data = None
+        self.error = None
+
+
+class TileProxy:
+    """A caching HTTP proxy for XYZ tile services.
+    Args:
+        cache_dir (str, optional): The tile cache directory. Defaults to ~/.cache/nclpy/tiles.
+        max_size (int, optional): The maximum size of the tile cache in bytes. Defaults to 512 MB.
+        host (str, optional): The address the server listens on. Defaults to '127.0.0.1'.
+        port (int, optional): The port the server listens on. Defaults to 0 (any free port).
+        public_url (str, optional): The base URL the browser reaches the server at, e.g. through jupyter-server-proxy. Defaults to http://host:port.
+        prefetch (int, optional): The number of tiles fetched in the background around the tiles of each view, or False to prefetch nothing. Only tiles next to the view at the same zoom level are prefetched. Defaults to DEFAULT_PREFETCH (4).
+        workers (int, optional): The number of threads fetching tiles for prefetching. Defaults to 4.
+        timeout (float, optional): The timeout of upstream requests in seconds. Defaults to 10.
+    """
+
+    def __init__(
+        self,
+        cache_dir=None,
+        max_size=DEFAULT_TILE_CACHE_SIZE,
+        host="127.0.0.1",
+        port=0,
+        public_url=None,
+        prefetch=DEFAULT_PREFETCH,
+        workers=4,
+        timeout=10,
+    ):
+        self.cache = TileCache(cache_dir, max_size)
+        self.host = host
+        self.port = port
+        self.public_url = public_url
+        self.prefetch = prefetch
+        self.timeout = timeout
+        self.sources = {}
+        self.local_sources = {}
+        self.hot_cache = None
+        self.local_requests = 0
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.prefetched = 0
+        self.errors = 0
+        self._pending = {}
+        self._prefetch_queue = 0
+        self._viewed = {}
+        self._prefetch_timer = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._server = None
+
+    def register(self, url):
+        """Registers an upstream tile URL.
+        Args:
+            url (str): The tile URL template, with {x}, {y} and {z} placeholders.
+        Returns:
+            str: The key of the source.
+        """
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+        self.sources[key] = url
+        return key
+
+    def proxy_url(self, url):
+        """Returns the URL of a tile source served through the proxy. The server is started if needed.
+        Args:
+            url (str): The upstream tile URL template.
+        Returns:
+            str: The tile URL template on the proxy.
+        """
+        key = self.register(url)
+        self.start()
+        return "{}/tiles/{}/{{z}}/{{x}}/{{y}}".format(self.base_url, key)
+
+    def local_url(self, source):
+        """Returns the URL of a local tile package served by the proxy. The server is started if needed.
+        Args:
+            source (MBTilesSource | DirectorySource): The tile source, see local_tiles.open_tile_source().
+        Returns:
+            str: The tile URL template on the proxy.
+        """
+        from .local_tiles import MemoryTileCache
+
+        with self._lock:
+            if self.hot_cache is None:
+                self.hot_cache = MemoryTileCache()
+            self.local_sources[source.key] = source
+        self.start()
+        return "{}/tiles/{}/{{z}}/{{x}}/{{y}}".format(self.base_url, source.key)
+
+    def _get_local_tile(self, key, z, x, y):
+        # Local packages are read directly, without the disk cache or prefetching.
+        with self._lock:
+            self.local_requests += 1
+        tile = (key, z, x, y)
+        data = self.hot_cache.get(tile)
+        if data is None:
+            data = self.local_sources[key].get_tile(z, x, y)
+            if data is None:
+                raise KeyError(tile)
+            self.hot_cache.put(tile, data)
+        return data
+
+    @property
+    def base_url(self):
+        if self.public_url is not None:
+            return self.public_url.rstrip("/")
+        return "http://{}:{}".format(self.host, self.port)
+
+    def upstream_url(self, tile):
+        """Returns the upstream URL of a tile.
+        Args:
+            tile (tuple): The (source key, z, x, y) of the tile.
+        Returns:
+            str: The URL.
+        """
+        key, z, x, y = tile
+        url = self.sources[key]
+        for name, value in (("z", z), ("x", x), ("y", y), ("s", "a"), ("r", "")):
+            url = url.replace("{" + name + "}", str(value))
+        return url
+
+    def _fetch(self, tile):
+        import urllib.request
+
+        request = urllib.request.Request(
+            self.upstream_url(tile), headers={"User-Agent": "nclpy-tile-proxy"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+    def get_tile(self, key, z, x, y, prefetch=True):
+        """Returns a tile from the cache, or from upstream on a cache miss.
+        Concurrent requests for the same missing tile share a single upstream request.
+        Args:
+            key (str): The key of the source, see register().
+            z (int): The zoom level.
+            x (int): The tile column.
+            y (int): The tile row.
+            prefetch (bool, optional): Whether the tile is part of a view, whose surrounding tiles are prefetched. Defaults to True.
+        Raises:
+            KeyError: If the source is not registered, or a local package does not have the tile.
+            OSError: If the tile could not be fetched from upstream.
+        Returns:
+            bytes: The tile.
+        """
+        if key in self.local_sources:
+            return self._get_local_tile(key, z, x, y)
+        if key not in self.sources:
+            raise KeyError(key)
+        tile = (key, z, x, y)
+        data = self.cache.get(tile)
+
+        with self._lock:
+            if prefetch:
+                self.requests += 1
+            if data is not None:
+                if prefetch:
+                    self.hits += 1
+                pending = None
+            else:
+                pending = self._pending.get(tile)
+                owner = pending is None
+                if owner:
+                    pending = _Pending()
+                    self._pending[tile] = pending
+                if prefetch:
+                    if owner:
+                        self.misses += 1
+                    else:
+                        self.coalesced += 1
+
+        if pending is not None:
+            if owner:
+                try:
+                    pending.data = self._fetch(tile)
+                    self.cache.put(tile, pending.data)
+                except Exception as e:
+                    pending.error = e
+                    with self._lock:
+                        self.errors += 1
+                finally:
+                    with self._lock:
+                        del self._pending[tile]
+                    pending.event.set()
+            else:
+                pending.event.wait(self.timeout)
+            if pending.error is not None:
+                raise OSError("Could not fetch the tile: {}".format(pending.error))
+            data = pending.data
+            if data is None:
+                raise OSError("Timed out waiting for the tile.")
+
+        if prefetch and self.prefetch:
+            self._prefetch(tile)
+        return data
+
+    def _prefetch(self, tile):
+        # The browser requests all the tiles of a view at once, so the tiles requested
+        # until a short pause are taken as the view, and only tiles next to it are
+        # prefetched.
+        key, z, x, y = tile
+        with self._lock:
+            self._viewed.setdefault((key, z), set()).add((x, y))
+            if self._prefetch_timer is not None:
+                self._prefetch_timer.cancel()
+            self._prefetch_timer = threading.Timer(PREFETCH_DELAY, self._prefetch_views)
+            self._prefetch_timer.daemon = True
+            self._prefetch_timer.start()
+
+    def _prefetch_views(self):
+        with self._lock:
+            views = self._viewed
+            self._viewed = {}
+            self._prefetch_timer = None
+        limit = DEFAULT_PREFETCH if self.prefetch is True else int(self.prefetch or 0)
+
+        for (key, z), viewed in views.items():
+            n = 2**z
+            around = set()
+            for x, y in viewed:
+                for dx in (-1, 0, 1):
+                    for dy in (-1, 0, 1):
+                        if 0 <= y + dy < n:
+                            around.add(((x + dx) % n, y + dy))
+            around -= viewed
+            # The tiles closest to the middle of the view come first.
+            cx = sum(x for x, _ in viewed) / len(viewed)
+            cy = sum(y for _, y in viewed) / len(viewed)
+            around = sorted(
+                around, key=lambda t: ((t[0] - cx) ** 2 + (t[1] - cy) ** 2, t)
+            )
+
+            submitted = 0
+            for x, y in around:
+                if submitted >= limit:
+                    break
+                neighbor = (key, z, x, y)
+                if neighbor in self.cache:
+                    continue
+                with self._lock:
+                    if (
+                        neighbor in self._pending
+                        or self._prefetch_queue >= MAX_PREFETCH_QUEUE
+                    ):
+                        continue
+                    self._prefetch_queue += 1
+                submitted += 1
+                self._executor.submit(self._prefetch_tile, neighbor)
+
+    def _prefetch_tile(self, tile):
+        try:
+            if tile not in self.cache:
+                self.get_tile(*tile, prefetch=False)
+                with self._lock:
+                    self.prefetched += 1
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._prefetch_queue -= 1
+
+    def start(self):
+        """Starts the HTTP server in a background thread, if it is not running yet."""
+        if self._server is not None:
+            return
+        from http.server import ThreadingHTTPServer
+
+        self._server = ThreadingHTTPServer((self.host, self.port), _handler(self))
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.1,), daemon=True
+        )
+        thread.start()
+
+    def stop(self):
+        """Stops the HTTP server and the prefetching threads."""
+        with self._lock:
+            if self._prefetch_timer is not None:
+                self._prefetch_timer.cancel()
+                self._prefetch_timer = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        """Returns the proxy counters.
+        Returns:
+            dict: The number of requests, hits, misses, coalesced requests, prefetched tiles and errors, the hit rate and the size of the cache, and the number of local package requests served from memory.
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "prefetched": self.prefetched,
+                "errors": self.errors,
+                "local_requests": self.local_requests,
+                "local_hits": self.hot_cache.hits if self.hot_cache else 0,
+                "hit_rate": self.hits / self.requests if self.requests else 0.0,
+                "cache_tiles": len(self.cache),
+                "cache_bytes": self.cache.size,
+            }
+
+
+def _handler(proxy):
+    from http.server import BaseHTTPRequestHandler
+
+    class TileHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.split("?")[0].strip("/").split("/")
+            try:
+                if len(parts) != 5 or parts[0] != "tiles":
+                    raise KeyError(self.path)
+                data = proxy.get_tile(
+                    parts[1], int(parts[2]), int(parts[3]), int(parts[4])
+                )
+            except (KeyError, ValueError):
+                self.send_error(404)
+                return
+            except OSError:
+                self.send_error(502)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", tile_content_type(data))
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Cache-Control", "max-age=86400")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return TileHandler
+
+
+_tile_proxy = None
+
+
+def get_tile_proxy():
+    """Returns the tile proxy shared by the maps of this kernel, creating it on first use.
+    Set NCLPY_TILE_CACHE_DIR to move its cache and NCLPY_TILE_PROXY_URL to set the URL the
+    browser reaches it at.
+    Returns:
+        TileProxy: The tile proxy.
+    """
+    global _tile_proxy
+    if _tile_proxy is None:
+        _tile_proxy = TileProxy(
+            cache_dir=os.environ.get("NCLPY_TILE_CACHE_DIR"),
+            public_url=os.environ.get("NCLPY_TILE_PROXY_URL"),
+        )
+    return _tile_proxy
@@ -1,10 +1,7 @@
 import os
 import ipywidgets as widgets
-from ipyleaflet import WidgetControl, DrawControl
-from ipyfilechooser import FileChooser
-from IPython.display import display
-from .generate_points import random_points
-from .common import *
+from ipyleaflet import WidgetControl
+from .perf import timed
 
 
 def main_toolbar(m):
@@ -18,46 +15,66 @@ def main_toolbar(m):
         layout=widgets.Layout(width="28px", height="28px", padding=padding),
     )
 
-    close_button = widgets.ToggleButton(
-        value=False,
-        tooltip="Close the tool",
-        icon="times",
-        button_style="primary",
-        layout=widgets.Layout(height="28px", width="28px", padding=padding),
-    )
+    toolbar = widgets.VBox([toolbar_button])
 
-    toolbar = widgets.HBox([toolbar_button])
+    # Most maps never open the toolbar, so only the wrench button is built with the map.
+    # The tool grid and the widgets of each tool are built on first use and kept here.
+    tools = {}
 
-    def close_click(change):
-        if change["new"]:
-            toolbar_button.close()
-            close_button.close()
-            toolbar.close()
+    def tool_widget(name, build):
+        if name not in tools:
+            tools[name] = build()
+        return tools[name]
+
+    def build_grid():
+        close_button = widgets.ToggleButton(
+            value=False,
+            tooltip="Close the tool",
+            icon="times",
+            button_style="primary",
+            layout=widgets.Layout(height="28px", width="28px", padding=padding),
+        )
 
-    close_button.observe(close_click, "value")
+        def close_click(change):
+            if change["new"]:
+                toolbar_button.close()
+                close_button.close()
+                toolbar.close()
+
+        close_button.observe(close_click, "value")
+        close_button.observe(close_btn_click, "value")
+
+        rows = 2
+        cols = 2
+        grid = widgets.GridspecLayout(
+            rows, cols, grid_gap="0px", layout=widgets.Layout(width="62px")
+        )
 
-    rows = 2
-    cols = 2
-    grid = widgets.GridspecLayout(
-        rows, cols, grid_gap="0px", layout=widgets.Layout(width="62px")
-    )
+        icons = ["folder-open", "map", "gears", "circle"]
 
-    icons = ["folder-open", "map", "gears", "circle"]
+        for i in range(rows):
+            for j in range(cols):
+                grid[i, j] = widgets.Button(
+                    description="",
+                    button_style="primary",
+                    icon=icons[i * rows + j],
+                    layout=widgets.Layout(width="28px", padding="0px"),
+                )
+                grid[i, j].on_click(tool_click)
 
-    for i in range(rows):
-        for j in range(cols):
-            grid[i, j] = widgets.Button(
-                description="",
-                button_style="primary",
-                icon=icons[i * rows + j],
-                layout=widgets.Layout(width="28px", padding="0px"),
-            )
+        return widgets.HBox([close_button, toolbar_button]), grid
 
-    toolbar = widgets.VBox([toolbar_button])
+    def show_tools():
+        # The output of the tools is shown under the grid once a tool has been used.
+        children = list(tool_widget("grid", build_grid))
+        if "output" in tools:
+            children.append(tools["output"])
+        toolbar.children = children
 
+    @timed("toolbar.toolbar_click")
     def toolbar_click(change):
         if change["new"]:
-            toolbar.children = [widgets.HBox([close_button, toolbar_button]), grid]
+            show_tools()
         else:
             toolbar.children = [toolbar_button]
 
@@ -66,110 +83,108 @@ def main_toolbar(m):
     toolbar_ctrl = WidgetControl(widget=toolbar, position="topright")
 
     m.add_control(toolbar_ctrl)
+    m.toolbar = toolbar
+    m.toolbar_button = toolbar_button
+    m.tool_control = None
+    m.basemap_ctrl = None
+
+    def build_file_chooser():
+        # Importing ipyfilechooser and listing the directory wait until the tool is opened.
+        from ipyfilechooser import FileChooser
+
+        buttons = widgets.ToggleButtons(
+            value=None,
+            options=["Apply", "Reset", "Close"],
+            tooltips=["Apply", "Reset", "Close"],
+            button_style="primary",
+        )
+        buttons.style.button_width = "80px"
+
+        data_dir = os.path.abspath("./data")
+        if not os.path.isdir(data_dir):
+            data_dir = os.getcwd()
+
+        fc = FileChooser(data_dir)
+        fc.use_dir_icons = True
+        fc.filter_pattern = ["*.shp", "*.geojson"]
+
+        filechooser_widget = widgets.VBox([fc, buttons])
+
+        def button_click(change):
+            if change["new"] == "Apply" and fc.selected is not None:
+                # Files opened again, here or in another session, are not parsed again.
+                if fc.selected.endswith(".shp"):
+                    m.add_shapefile(fc.selected, layer_name="Shapefile", use_cache=True)
+                elif fc.selected.endswith(".geojson"):
+                    m.add_geojson(fc.selected, layer_name="GeoJSON", use_cache=True)
+            elif change["new"] == "Reset":
+                fc.reset()
+            elif change["new"] == "Close":
+                if m is not None:
+                    m.toolbar_reset()
+                    if m.tool_control is not None and m.tool_control in m.controls:
+                        m.remove_control(m.tool_control)
+            buttons.value = None
 
-    output = widgets.Output()
-    output_ctrl = WidgetControl(widget=output, position="topright")
-
-    buttons = widgets.ToggleButtons(
-        value=None,
-        options=["Apply", "Reset", "Close"],
-        tooltips=["Apply", "Reset", "Close"],
-        button_style="primary",
-    )
-    buttons.style.button_width = "80px"
-
-    data_dir = os.path.abspath("./data")
-
-    fc = FileChooser(data_dir)
-    fc.use_dir_icons = True
-    fc.filter_pattern = ["*.shp", "*.geojson"]
-
-    filechooser_widget = widgets.VBox([fc, buttons])
+        buttons.observe(button_click, "value")
 
-    draw_control = DrawControl()
-
-    def button_click(change):
-        if change["new"] == "Apply" and fc.selected is not None:
-            if fc.selected.endswith(".shp"):
-                m.add_shapefile(fc.selected, layer_name="Shapefile")
-            elif fc.selected.endswith(".geojson"):
-                m.add_geojson(fc.selected, layer_name="GeoJSON")
-        elif change["new"] == "Reset":
-            fc.reset()
-        elif change["new"] == "Close":
-            if m is not None:
-                m.toolbar_reset()
-                if m.tool_control is not None and m.tool_control in m.controls:
-                    m.remove_control(m.tool_control)
-                    m.tool_control = None
-            toolbar_widget.close()
-
-    buttons.observe(button_click, "value")
+        return WidgetControl(widget=filechooser_widget, position="topright")
 
+    @timed("toolbar.tool_click")
     def tool_click(b):
-        with output:
+        if "output" not in tools:
+            tool_widget("output", widgets.Output)
+            show_tools()
+        output = tools["output"]
+        with output, m.batch():
             output.clear_output()
             if b.icon == "folder-open":
-                dropdown = widgets.Dropdown(
-                    options=data_dir,
-                    value="csv",
-                    layout=widgets.Layout(width="200px")
-                )
-
-                close_btn = widgets.Button(
-                    icon="times",
-                    tooltip="Close the csv widget",
-                    button_style="primary",
-                    layout=widgets.Layout(width="32px"),
-                )
-
-                csv_widget = widgets.HBox([dropdown, close_btn])
-
-                def on_click(change):
-                    csv_name = change["new"]
-
-                    if len(m.layers) == 1:
-                        old_csv = m.layers[0]
-                    else:
-                        old_csv = m.layers[1]
-                    m.csv_toshapefile(old_csv)
-                dropdown.observe(on_click, "value")
-
-                def close_click(change):
-                    m.toolbar_reset()
-                    if m.csv_ctrl is not None and m.csv_ctrl in m.controls:
-                        m.remove_control(m.csv_ctrl)
-                    csv_widget.close()
-
-                close_btn.on_click(close_click)
-
-                csv_control = WidgetControl(widget=csv_widget)
-                m.add_control(csv_control)
-                m.csv_ctrl = csv_control
+                m.tool_control = tool_widget("folder-open", build_file_chooser)
+                if m.tool_control not in m.controls:
+                    m.add_control(m.tool_control)
             elif b.icon == "map":
                 change_basemap(m)
             elif b.icon == "gears":
-                import whiteboxgui.whiteboxgui as wbt
-
-                if hasattr(m, "whitebox") and m.whitebox is not None:
-                    if m.whitebox in m.controls:
-                        m.remove_control(m.whitebox)
-
-                tools_dict = wbt.get_wbt_dict()
-                wbt_toolbox = wbt.build_toolbox(
-                    tools_dict, max_width="800px", max_height="500px"
-                )
-
-                wbt_control = WidgetControl(widget=wbt_toolbox, position="bottomright")
-
-                m.whitebox = wbt_control
-                m.add_control(wbt_control)
+                # The toolbox is built once per map and shown again on later clicks.
+                if getattr(m, "whitebox", None) is None:
+                    from functools import partial
+                    from .whitebox_tools import (
+                        WhiteboxJobRunner,
+                        WhiteboxToolbox,
+                        add_output_to_map,
+                        get_tools_dict,
+                        job_panel,
+                    )
+
+                    def close_toolbox():
+                        if m.whitebox in m.controls:
+                            m.remove_control(m.whitebox)
+
+                    # Tools run in the background; set m.whitebox_jobs beforehand to
+                    # change the number of tools running at the same time.
+                    if getattr(m, "whitebox_jobs", None) is None:
+                        m.whitebox_jobs = WhiteboxJobRunner()
+                    wbt_toolbox = WhiteboxToolbox(
+                        get_tools_dict(),
+                        max_width="800px",
+                        max_height="500px",
+                        tool_panel=partial(
+                            job_panel,
+                            runner=m.whitebox_jobs,
+                            on_output=partial(add_output_to_map, m),
+                        ),
+                        on_close=close_toolbox,
+                    )
+                    m.whitebox = WidgetControl(
+                        widget=wbt_toolbox.widget, position="bottomright"
+                    )
+                    m.whitebox_toolbox = wbt_toolbox
+
+                if m.whitebox not in m.controls:
+                    m.add_control(m.whitebox)
             elif b.icon == "circle":
                 if m.user_roi is not None:
-                    print(m.user_roi)
-                    geom = geojson_to_ee(m.user_roi, False)
-                    r_points = random_points(geom)
-                    print(r_points)
+                    m.add_random_points()
 
     def close_btn_click(change):
         if change["new"]:
@@ -179,19 +194,24 @@ def main_toolbar(m):
                     m.remove_control(m.tool_control)
                     m.tool_control = None
                 m.toolbar_reset()
-            toolbar_widget.close()
-
-    close_button.observe(close_btn_click, "value")
 
     def change_basemap(m):
-        """Widget for change basemaps.
+        """Widget for change basemaps. It is built on the first call and shown again on
+        later calls.
         Args:
             m (object): geemap.Map()
         """
-        from .basemaps import _ee_basemaps
+        if m.basemap_ctrl is not None:
+            # Basemaps may have been added since, e.g. with m.add_local_basemap().
+            dropdown = m.basemap_ctrl.widget.children[0]
+            if list(dropdown.options) != list(m.basemap_tiles):
+                dropdown.options = list(m.basemap_tiles)
+            if m.basemap_ctrl not in m.controls:
+                m.add_control(m.basemap_ctrl)
+            return
 
         dropdown = widgets.Dropdown(
-            options=list(_ee_basemaps.keys()),
+            options=list(m.basemap_tiles),
             value="ROADMAP",
             layout=widgets.Layout(width="200px")
             # description="Basemaps",
@@ -206,6 +226,7 @@ def main_toolbar(m):
 
         basemap_widget = widgets.HBox([dropdown, close_btn])
 
+        @timed("toolbar.change_basemap")
         def on_click(change):
             basemap_name = change["new"]
 
@@ -213,7 +234,8 @@ def main_toolbar(m):
                 old_basemap = m.layers[0]
             else:
                 old_basemap = m.layers[1]
-            m.substitute_layer(old_basemap, _ee_basemaps[basemap_name])
+            with m.batch():
+                m.substitute_layer(old_basemap, m.basemap_tiles[basemap_name])
 
         dropdown.observe(on_click, "value")
 
@@ -221,17 +243,9 @@ def main_toolbar(m):
             m.toolbar_reset()
             if m.basemap_ctrl is not None and m.basemap_ctrl in m.controls:
                 m.remove_control(m.basemap_ctrl)
-            basemap_widget.close()
 
         close_btn.on_click(close_click)
 
         basemap_control = WidgetControl(widget=basemap_widget, position="topright")
         m.add_control(basemap_control)
         m.basemap_ctrl = basemap_control
-    
-    
-
-    for i in range(rows):
-        for j in range(cols):
-            tool = grid[i, j]
-            tool.on_click(tool_click)
@@ -0,0 +1,406 @@
+"""Module for cutting GeoJSON into per-zoom, simplified tiles inside the kernel, in the spirit
+of geojson-vt. A TiledGeoJSON layer only sends the features of the tiles that are visible at
+the current zoom to the front end, simplified for that zoom, instead of the whole dataset.
+"""
+
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+TILE_SIZE = 256
+
+
+def lonlat_to_mercator(coords):
+    """Projects longitude/latitude pairs to Web Mercator coordinates in the unit square.
+    Args:
+        coords (array-like): An (n, 2) array of longitude/latitude pairs.
+    Returns:
+        numpy.ndarray: An (n, 2) array where (0, 0) is the top-left corner of the world.
+    """
+    coords = np.asarray(coords, dtype="float64").reshape(-1, 2)
+    lat = np.clip(coords[:, 1], -85.0511287798, 85.0511287798)
+    x = coords[:, 0] / 360.0 + 0.5
+    sin = np.sin(np.radians(lat))
+    y = 0.5 - 0.25 * np.log((1 + sin) / (1 - sin)) / math.pi
+    return np.column_stack([x, y])
+
+
+def vertex_importance(points):
+    """Ranks the vertices of a line with the Douglas-Peucker algorithm.
+    The squared distance at which each vertex would be dropped is computed once, so the
+    line can then be simplified for any tolerance with a single comparison. Importance
+    never exceeds that of the vertex that split the segment, so every tolerance yields
+    the same result as running Douglas-Peucker with that tolerance. All the segments
+    at one depth of the recursion are split together.
+    Args:
+        points (numpy.ndarray): An (n, 2) array of projected coordinates.
+    Returns:
+        numpy.ndarray: The squared importance of each vertex. End points are infinite.
+    """
+    n = len(points)
+    importance = np.zeros(n)
+    importance[0] = importance[-1] = np.inf
+    first = np.array([0])
+    last = np.array([n - 1])
+    limit = np.array([np.inf])
+    while True:
+        keep = last - first >= 2
+        first, last, limit = first[keep], last[keep], limit[keep]
+        if len(first) == 0:
+            break
+
+        # The inner vertices of every segment, laid out one segment after the other.
+        counts = last - first - 1
+        starts = np.cumsum(counts) - counts
+        segment = np.repeat(np.arange(len(first)), counts)
+        index = np.arange(counts.sum()) - starts[segment] + first[segment] + 1
+
+        a = points[first]
+        ab = points[last] - a
+        length = (ab * ab).sum(axis=1)
+        a, ab, length = a[segment], ab[segment], length[segment]
+        inner = points[index] - a
+        t = (inner * ab).sum(axis=1) / np.where(length > 0, length, 1)
+        offset = inner - np.clip(t, 0, 1)[:, None] * ab
+        dist = (offset * offset).sum(axis=1)
+
+        # The first vertex with the largest distance in each segment.
+        largest = np.maximum.reduceat(dist, starts)
+        candidates = np.flatnonzero(dist == largest[segment])
+        _, chosen = np.unique(segment[candidates], return_index=True)
+        split = index[candidates[chosen]]
+        value = np.minimum(largest, limit)
+        importance[split] = value
+
+        first, last = np.concatenate([first, split]), np.concatenate([split, last])
+        limit = np.concatenate([value, value])
+    return importance
+
+
+def _coords(line):
+    coords = np.asarray(line, dtype="float64")
+    if coords.ndim == 1:
+        coords = coords.reshape(-1, len(coords) or 2)
+    return np.ascontiguousarray(coords[:, :2])
+
+
+def _bbox(coords):
+    if len(coords) == 0:
+        return [np.inf, np.inf, -np.inf, -np.inf]
+    return [
+        coords[:, 0].min(),
+        coords[:, 1].min(),
+        coords[:, 0].max(),
+        coords[:, 1].max(),
+    ]
+
+
+class _Feature:
+    """A feature split into parts (lines or rings) with their projected coordinates."""
+
+    def __init__(self, feature):
+        self.properties = feature.get("properties")
+        self.id = feature.get("id")
+        geometry = feature.get("geometry") or {}
+        self.type = geometry.get("type")
+        coordinates = geometry.get("coordinates")
+        self.geometries = None
+
+        if self.type == "GeometryCollection":
+            self.geometries = [
+                _Feature({"geometry": g}) for g in geometry.get("geometries", [])
+            ]
+            boxes = np.array([g.bbox for g in self.geometries] or [[0, 0, 0, 0]])
+            self.bbox = [*boxes[:, :2].min(axis=0), *boxes[:, 2:].max(axis=0)]
+            return
+
+        # Parts are kept as a nested structure mirroring the GeoJSON coordinates.
+        if self.type in ("Point", "MultiPoint", "LineString"):
+            parts = [[coordinates]]
+        elif self.type in ("MultiLineString", "Polygon"):
+            parts = [coordinates]
+        elif self.type == "MultiPolygon":
+            parts = coordinates
+        else:
+            parts = []
+
+        self.parts = [[_coords(line) for line in part] for part in parts]
+        self.projected = [
+            [lonlat_to_mercator(line) for line in part] for part in self.parts
+        ]
+        self._importance = None
+
+        points = [line for part in self.projected for line in part]
+        self.bbox = _bbox(np.concatenate(points) if points else np.empty((0, 2)))
+
+    @property
+    def importance(self):
+        if self._importance is None:
+            self._importance = [
+                [vertex_importance(line) for line in part] for part in self.projected
+            ]
+        return self._importance
+
+    def geometry(self, sq_tolerance):
+        """Returns the GeoJSON geometry simplified for a squared tolerance, or None if it vanishes."""
+        if self.geometries is not None:
+            geometries = [g.geometry(sq_tolerance) for g in self.geometries]
+            geometries = [g for g in geometries if g is not None]
+            if len(geometries) == 0:
+                return None
+            return {"type": "GeometryCollection", "geometries": geometries}
+
+        if self.type in ("Point", "MultiPoint"):
+            coordinates = self.parts[0][0].tolist()
+            if self.type == "Point":
+                coordinates = coordinates[0]
+            return {"type": self.type, "coordinates": coordinates}
+
+        is_polygon = self.type in ("Polygon", "MultiPolygon")
+        min_points = 4 if is_polygon else 2
+        parts = []
+        for lines, weights in zip(self.parts, self.importance):
+            kept = []
+            for index, (line, weight) in enumerate(zip(lines, weights)):
+                line = line[weight > sq_tolerance]
+                if len(line) < min_points:
+                    if is_polygon and index == 0:
+                        # The outer ring is smaller than the tolerance, drop its holes too.
+                        break
+                    continue
+                kept.append(line.tolist())
+            if len(kept) > 0:
+                parts.append(kept)
+
+        if len(parts) == 0:
+            return None
+        if self.type == "LineString":
+            coordinates = parts[0][0]
+        elif self.type in ("MultiLineString", "Polygon"):
+            coordinates = parts[0]
+        else:
+            coordinates = parts
+        return {"type": self.type, "coordinates": coordinates}
+
+
+class TileIndex:
+    """A tile index over a GeoJSON FeatureCollection.
+    Tiles are cut on request and cached. A tile holds the features whose bounding boxes
+    intersect it (plus a small buffer), each simplified with Douglas-Peucker for the
+    tile's zoom level.
+    Args:
+        geojson (dict): A GeoJSON FeatureCollection.
+        max_zoom (int, optional): The zoom level beyond which features are no longer simplified. Defaults to 14.
+        tolerance (float, optional): The simplification tolerance in screen pixels. Defaults to 1.
+        buffer (float, optional): The tile buffer in screen pixels. Defaults to 16.
+        cache_size (int, optional): The number of simplified features and tiles kept in memory. Defaults to 4096.
+    """
+
+    def __init__(self, geojson, max_zoom=14, tolerance=1, buffer=16, cache_size=4096):
+        self.max_zoom = max_zoom
+        self.tolerance = tolerance
+        self.buffer = buffer
+        self.cache_size = cache_size
+        features = geojson.get("features", []) if isinstance(geojson, dict) else []
+        self.features = [_Feature(f) for f in features]
+        boxes = np.array([f.bbox for f in self.features], dtype="float64")
+        self.bboxes = boxes.reshape(-1, 4)
+        self._tiles = OrderedDict()
+        self._simplified = OrderedDict()
+
+    def __len__(self):
+        return len(self.features)
+
+    def _cached(self, cache, key, func):
+        value = cache.get(key, cache)
+        if value is cache:
+            value = func()
+            cache[key] = value
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return value
+
+    def tile_features(self, z, x, y):
+        """Returns the indices of the features in a tile.
+        Args:
+            z (int): The zoom level.
+            x (int): The tile column.
+            y (int): The tile row.
+        Returns:
+            numpy.ndarray: The feature indices.
+        """
+
+        def query():
+            size = 1.0 / (1 << z)
+            pad = size * self.buffer / TILE_SIZE
+            x0, y0 = x * size - pad, y * size - pad
+            x1, y1 = (x + 1) * size + pad, (y + 1) * size + pad
+            b = self.bboxes
+            mask = (b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)
+            return np.nonzero(mask)[0]
+
+        return self._cached(self._tiles, (z, x, y), query)
+
+    def feature(self, index, z):
+        """Returns a feature simplified for a zoom level.
+        Args:
+            index (int): The feature index.
+            z (int): The zoom level.
+        Returns:
+            dict: The GeoJSON feature, or None if it is too small to show at this zoom.
+        """
+        z = min(z, self.max_zoom)
+
+        def simplify():
+            feature = self.features[index]
+            if z == self.max_zoom:
+                sq_tolerance = 0
+            else:
+                sq_tolerance = (self.tolerance / (TILE_SIZE * (1 << z))) ** 2
+            geometry = feature.geometry(sq_tolerance)
+            if geometry is None:
+                return None
+            result = {
+                "type": "Feature",
+                "properties": feature.properties,
+                "geometry": geometry,
+            }
+            if feature.id is not None:
+                result["id"] = feature.id
+            return result
+
+        return self._cached(self._simplified, (index, z), simplify)
+
+    def get_tile(self, z, x, y):
+        """Returns a tile as a GeoJSON FeatureCollection.
+        Args:
+            z (int): The zoom level.
+            x (int): The tile column.
+            y (int): The tile row.
+        Returns:
+            dict: The GeoJSON FeatureCollection of the tile.
+        """
+        features = [self.feature(i, z) for i in self.tile_features(z, x, y)]
+        return {
+            "type": "FeatureCollection",
+            "features": [f for f in features if f is not None],
+        }
+
+    @staticmethod
+    def tiles_for_bounds(bounds, z):
+        """Returns the tiles covering a bounding box.
+        Args:
+            bounds (list): The ((south, west), (north, east)) bounds, as reported by ipyleaflet.
+            z (int): The zoom level.
+        Returns:
+            list: The (z, x, y) tiles.
+        """
+        (south, west), (north, east) = bounds
+        corners = lonlat_to_mercator([[west, north], [east, south]])
+        n = 1 << z
+        x0, y0 = np.clip(np.floor(corners[0] * n), 0, n - 1).astype(int)
+        x1, y1 = np.clip(np.floor(corners[1] * n), 0, n - 1).astype(int)
+        return [(z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+    def tiles_features(self, tiles):
+        """Returns the features in a set of tiles. Features spanning several tiles are
+        only returned once.
+        Args:
+            tiles (list): The (z, x, y) tiles.
+        Returns:
+            list: The sorted feature indices.
+        """
+        indices = [self.tile_features(*tile) for tile in tiles]
+        if len(indices) > 0:
+            indices = np.unique(np.concatenate(indices))
+        return [int(i) for i in indices]
+
+    def to_geojson(self, indices, z):
+        """Returns features simplified for a zoom level as a GeoJSON FeatureCollection.
+        Args:
+            indices (list): The feature indices.
+            z (int): The zoom level.
+        Returns:
+            dict: The GeoJSON FeatureCollection, without the features too small to show.
+        """
+        features = [self.feature(i, z) for i in indices]
+        return {
+            "type": "FeatureCollection",
+            "features": [f for f in features if f is not None],
+        }
+
+    def features_for_bounds(self, bounds, zoom):
+        """Returns the features visible in a bounding box at a zoom level.
+        Features spanning several tiles are only returned once.
+        Args:
+            bounds (list): The ((south, west), (north, east)) bounds, as reported by ipyleaflet.
+            zoom (float): The map zoom level.
+        Returns:
+            tuple: The sorted feature indices and the GeoJSON FeatureCollection.
+        """
+        z = max(int(zoom), 0)
+        indices = self.tiles_features(self.tiles_for_bounds(bounds, z))
+        return indices, self.to_geojson(indices, z)
+
+
+def view_bounds(center, zoom, width=1024, height=768):
+    """Estimates the bounds of a map view before the front end has reported them.
+    Args:
+        center (list): The [latitude, longitude] of the map center.
+        zoom (float): The map zoom level.
+        width (int, optional): The assumed view width in pixels. Defaults to 1024.
+        height (int, optional): The assumed view height in pixels. Defaults to 768.
+    Returns:
+        tuple: The ((south, west), (north, east)) bounds.
+    """
+    scale = TILE_SIZE * 2 ** zoom
+    cx, cy = lonlat_to_mercator([[center[1], center[0]]])[0] * scale
+    x = np.array([cx - width / 2, cx + width / 2]) / scale
+    y = np.clip(np.array([cy + height / 2, cy - height / 2]) / scale, 0, 1)
+    lon = np.clip((x - 0.5) * 360, -180, 180)
+    lat = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * y))))
+    return ((lat[0], lon[0]), (lat[1], lon[1]))
+
+
+class TiledGeoJSON:
+    """Keeps an ipyleaflet GeoJSON layer filled with the tiles visible on a map.
+    The layer data is only replaced when the set of visible features or the zoom level
+    changes. Panning within the same tiles does not look at the features at all.
+    Args:
+        m (ipyleaflet.Map): The map.
+        layer (ipyleaflet.GeoJSON): The layer to fill.
+        index (TileIndex): The tile index of the data.
+    """
+
+    def __init__(self, m, layer, index):
+        self.map = m
+        self.layer = layer
+        self.index = index
+        self._key = None
+        self._tiles = None
+        m.observe(self.update, names=["bounds", "zoom"])
+        self.update()
+
+    def update(self, change=None):
+        """Sends the features of the visible tiles to the layer."""
+        bounds = self.map.bounds
+        if not bounds:
+            bounds = view_bounds(self.map.center, self.map.zoom)
+        z = max(int(self.map.zoom), 0)
+        tiles = self.index.tiles_for_bounds(bounds, z)
+        if tiles == self._tiles:
+            return
+        self._tiles = tiles
+        indices = self.index.tiles_features(tiles)
+        key = (min(z, self.index.max_zoom), tuple(indices))
+        if key == self._key:
+            return
+        self._key = key
+        self.layer.data = self.index.to_geojson(indices, z)
+
+    def close(self):
+        """Stops following the map view."""
+        self.map.unobserve(self.update, names=["bounds", "zoom"])
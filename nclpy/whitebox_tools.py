@@ -0,0 +1,687 @@
+"""Module for the WhiteboxTools toolbox of the toolbar. The tool dictionary is cached on disk
+for each WhiteboxTools version, the toolbox widget is built once per map, and the widgets of
+a category are only created when the category is opened. Tools run in the background, each
+in its own WhiteboxTools process, and their outputs are added to the map from the kernel's
+main thread when they finish.
+"""
+
+import atexit
+import json
+import os
+import queue
+import re
+import subprocess
+import tempfile
+import threading
+import weakref
+
+DEFAULT_WHITEBOX_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "nclpy", "whitebox"
+)
+
+_tools_dicts = {}
+_tools_lock = threading.Lock()
+
+
+def whitebox_version():
+    """Returns the version of the installed whitebox package, which pins the WhiteboxTools binary.
+    Returns:
+        str: The version, or 'unknown' if whitebox is not installed.
+    """
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+    except ImportError:  # Python 3.7
+        import pkg_resources
+
+        try:
+            return pkg_resources.get_distribution("whitebox").version
+        except pkg_resources.DistributionNotFound:
+            return "unknown"
+
+    try:
+        return version("whitebox")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def get_tools_dict(cache_dir=None, reset=False):
+    """Returns the dictionary describing every WhiteboxTools tool.
+    The dictionary is kept in memory, and on disk in a file named after the WhiteboxTools
+    version, so whiteboxgui is only asked for it once per version.
+    Args:
+        cache_dir (str, optional): The cache directory. Defaults to NCLPY_WHITEBOX_CACHE_DIR, or ~/.cache/nclpy/whitebox.
+        reset (bool, optional): Whether to build the dictionary again. Defaults to False.
+    Returns:
+        dict: The tool descriptions keyed by tool name.
+    """
+    version = whitebox_version()
+    with _tools_lock:
+        if not reset and version in _tools_dicts:
+            return _tools_dicts[version]
+
+        cache_dir = (
+            cache_dir
+            or os.environ.get("NCLPY_WHITEBOX_CACHE_DIR")
+            or DEFAULT_WHITEBOX_CACHE_DIR
+        )
+        path = os.path.join(cache_dir, "whitebox_tools-{}.json".format(version))
+        tools_dict = None
+        if not reset and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    tools_dict = json.load(f)
+            except (OSError, ValueError):
+                tools_dict = None
+
+        if tools_dict is None:
+            import whiteboxgui.whiteboxgui as wbt
+
+            tools_dict = wbt.get_wbt_dict(reset=reset)
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(tools_dict, f)
+                os.replace(tmp_path, path)
+            except OSError:
+                pass
+
+        _tools_dicts[version] = tools_dict
+        return tools_dict
+
+
+def tool_categories(tools_dict):
+    """Groups the tools by category.
+    Args:
+        tools_dict (dict): The tool descriptions, see get_tools_dict().
+    Returns:
+        dict: The sorted tool names keyed by category, in alphabetical order.
+    """
+    categories = {}
+    for name, tool in tools_dict.items():
+        categories.setdefault(tool["category"], []).append(name)
+    return {category: sorted(categories[category]) for category in sorted(categories)}
+
+
+def _default_tool_panel(tool_dict, max_height):
+    import whiteboxgui.whiteboxgui as wbt
+
+    return wbt.tool_gui(tool_dict, max_height=max_height)
+
+
+class WhiteboxToolbox:
+    """The WhiteboxTools toolbox widget. Only the category list is built up front: the tool
+    list of a category is created when the category is opened, and the panel of a tool when
+    the tool is first selected. Panels are kept, so reopening a tool shows its previous inputs.
+    Args:
+        tools_dict (dict): The tool descriptions, see get_tools_dict().
+        max_width (str, optional): The maximum width of the toolbox. Defaults to '800px'.
+        max_height (str, optional): The maximum height of the toolbox. Defaults to '500px'.
+        tool_panel (callable, optional): A function building the panel of a tool from its description and max_height. Defaults to whiteboxgui's tool_gui.
+        on_close (callable, optional): A function called when the close button is clicked. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        tools_dict,
+        max_width="800px",
+        max_height="500px",
+        tool_panel=None,
+        on_close=None,
+    ):
+        import ipywidgets as widgets
+
+        self.tools_dict = tools_dict
+        self.categories = tool_categories(tools_dict)
+        self.max_height = max_height
+        self.tool_panel = tool_panel or _default_tool_panel
+        self.panels = {}
+
+        self.search_box = widgets.Text(
+            placeholder="Search tools ...", layout=widgets.Layout(width="200px")
+        )
+        self.label = widgets.Label("{} Available Tools".format(len(tools_dict)))
+        self.results = widgets.Select(
+            options=[], layout=widgets.Layout(width="200px", height="150px")
+        )
+        self.results.observe(self._tool_selected, "value")
+        self.accordion = widgets.Accordion(
+            children=[widgets.VBox() for _ in self.categories],
+            titles=tuple(self.categories),
+            selected_index=None,
+        )
+        self.accordion.observe(self._category_opened, "selected_index")
+        close_button = widgets.Button(
+            description="Close Toolbox",
+            icon="close",
+            layout=widgets.Layout(width="200px"),
+        )
+        if on_close is not None:
+            close_button.on_click(lambda b: on_close())
+        self.search_box.observe(self._search, "value")
+
+        self.panel_box = widgets.VBox(
+            layout=widgets.Layout(width="600px", max_height=max_height)
+        )
+        self.left = widgets.VBox(
+            [self.search_box, self.label, close_button, self.accordion],
+            layout=widgets.Layout(
+                min_width="210px", max_height=max_height, overflow="auto"
+            ),
+        )
+        self.widget = widgets.HBox(
+            [self.left, self.panel_box],
+            layout=widgets.Layout(max_width=max_width, max_height=max_height),
+        )
+
+    def _tool_list(self, names):
+        import ipywidgets as widgets
+
+        tools = widgets.Select(
+            options=names,
+            value=None,
+            layout=widgets.Layout(width="200px", height="200px"),
+        )
+        tools.observe(self._tool_selected, "value")
+        return tools
+
+    def _category_opened(self, change):
+        index = change["new"]
+        if index is None:
+            return
+        box = self.accordion.children[index]
+        if not box.children:
+            category = list(self.categories)[index]
+            box.children = [self._tool_list(self.categories[category])]
+
+    def _tool_selected(self, change):
+        if change["new"]:
+            self.show_tool(change["new"])
+
+    def _search(self, change):
+        # Matching tools replace the categories while there is a search keyword.
+        keyword = change["new"].lower()
+        children = list(self.left.children[:3])
+        if keyword:
+            names = sorted(
+                name
+                for name, tool in self.tools_dict.items()
+                if keyword in name.lower() or keyword in tool["description"].lower()
+            )
+            self.results.options = names
+            self.label.value = "{} Available Tools".format(len(names))
+            self.left.children = children + [self.results]
+        else:
+            self.label.value = "{} Available Tools".format(len(self.tools_dict))
+            self.left.children = children + [self.accordion]
+
+    def show_tool(self, name):
+        """Shows the panel of a tool, building it on first use.
+        Args:
+            name (str): The name of the tool.
+        Returns:
+            object: The panel widget.
+        """
+        panel = self.panels.get(name)
+        if panel is None:
+            panel = self.tool_panel(self.tools_dict[name], self.max_height)
+            self.panels[name] = panel
+        self.panel_box.children = [panel]
+        return panel
+
+
+# Number of WhiteboxTools processes run at the same time by default.
+WHITEBOX_WORKERS = 2
+
+PROGRESS_PATTERN = re.compile(r"(\d{1,3})%")
+
+
+def whitebox_exe():
+    """Returns the path to the WhiteboxTools binary, downloading it on first use.
+    Returns:
+        str: The path to the binary.
+    """
+    import whitebox
+
+    wbt = whitebox.WhiteboxTools()
+    return os.path.join(wbt.exe_path, wbt.exe_name)
+
+
+def tool_arguments(args):
+    """Converts tool parameter values to WhiteboxTools command line arguments.
+    Args:
+        args (dict): The parameter values keyed by parameter, e.g. {'dem': 'dem.tif', 'output': 'slope.tif'}. True adds a flag, and False or empty values are left out.
+    Returns:
+        list: The command line arguments.
+    """
+    arguments = []
+    for key, value in args.items():
+        flag = "-i" if key == "i" else "--" + key
+        if value is True:
+            arguments.append(flag)
+        elif value is not False and value is not None and value != "":
+            arguments.append("{}={}".format(flag, value))
+    return arguments
+
+
+def tool_outputs(tool_dict, args):
+    """Returns the raster and vector files a tool will write.
+    Args:
+        tool_dict (dict): The tool description, see get_tools_dict().
+        args (dict): The parameter values keyed by parameter.
+    Returns:
+        list: (path, kind) tuples, where kind is 'raster' or 'vector'.
+    """
+    outputs = []
+    for key, param in tool_dict["parameters"].items():
+        param_type = param["parameter_type"]
+        if not args.get(key) or not isinstance(param_type, dict):
+            continue
+        kind = param_type.get("NewFile")
+        if kind == "Raster":
+            outputs.append((os.path.abspath(args[key]), "raster"))
+        elif isinstance(kind, dict) and "Vector" in kind:
+            outputs.append((os.path.abspath(args[key]), "vector"))
+    return outputs
+
+
+class WhiteboxJob:
+    """A WhiteboxTools run submitted to a WhiteboxJobRunner.
+    Attributes:
+        tool (str): The name of the tool.
+        arguments (list): The command line arguments.
+        outputs (list): The (path, kind) of the files the tool writes.
+        status (str): 'queued', 'running', 'done', 'failed' or 'cancelled'.
+        progress (int): The progress in percent.
+        output (list): The lines printed by the tool so far.
+        returncode (int): The exit code of the tool, once it has finished.
+    """
+
+    def __init__(self, tool, arguments, outputs=None, on_progress=None, on_done=None):
+        self.tool = tool
+        self.arguments = arguments
+        self.outputs = outputs or []
+        self.status = "queued"
+        self.progress = 0
+        self.output = []
+        self.returncode = None
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self._process = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+
+    def __repr__(self):
+        return "WhiteboxJob({!r}, status={!r}, progress={})".format(
+            self.tool, self.status, self.progress
+        )
+
+    def cancel(self):
+        """Cancels the job, stopping the tool if it is already running."""
+        with self._lock:
+            self._cancelled = True
+            queued = self.status == "queued"
+            process = self._process
+        if queued:
+            self._finish("cancelled")
+        elif process is not None:
+            process.terminate()
+
+    def done(self):
+        """Returns whether the job has finished, failed or been cancelled."""
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """Waits for the job to finish.
+        Args:
+            timeout (float, optional): The timeout in seconds. Defaults to None (no timeout).
+        Returns:
+            bool: Whether the job has finished.
+        """
+        return self._finished.wait(timeout)
+
+    def _finish(self, status):
+        self.status = status
+        if status == "done":
+            self.progress = 100
+        if self.on_done is not None:
+            try:
+                self.on_done(self)
+            except Exception as e:
+                print("Could not handle the end of {}: {}".format(self.tool, e))
+        self._finished.set()
+
+
+class WhiteboxJobRunner:
+    """Runs WhiteboxTools in the background, in separate processes, so long analyses do not
+    block the notebook. At most max_workers tools run at the same time and the others wait
+    in a queue. The worker threads do not keep the interpreter alive, and the tools still
+    running when it exits are stopped.
+    Args:
+        max_workers (int, optional): The maximum number of tools running at the same time. Defaults to 2.
+        command (list, optional): The command running WhiteboxTools. Defaults to the binary of the whitebox package.
+    """
+
+    def __init__(self, max_workers=WHITEBOX_WORKERS, command=None):
+        self.max_workers = max_workers
+        self.command = command
+        self.jobs = []
+        self._queue = queue.Queue()
+        self._pending = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        _runners.add(self)
+
+    def submit(self, tool, args, outputs=None, on_progress=None, on_done=None):
+        """Queues a tool run.
+        Args:
+            tool (str): The name of the tool, e.g. 'Slope'.
+            args (dict | list): The parameter values keyed by parameter, or command line arguments.
+            outputs (list, optional): The (path, kind) of the files the tool writes, see tool_outputs(). Defaults to None.
+            on_progress (callable, optional): Called with the job and each line the tool prints, from a worker thread. Defaults to None.
+            on_done (callable, optional): Called with the job once it has finished, failed or been cancelled, from a worker thread. Use call_in_main_thread() to update the map. Defaults to None.
+        Returns:
+            WhiteboxJob: The job.
+        """
+        if self.command is None:
+            self.command = [whitebox_exe()]
+        if isinstance(args, dict):
+            args = tool_arguments(args)
+        arguments = ["--run={}".format(tool)] + list(args) + ["-v"]
+        job = WhiteboxJob(tool, arguments, outputs, on_progress, on_done)
+        self.jobs.append(job)
+        self._queue.put((job, os.getcwd()))
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return job
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._run(*item)
+
+    def _run(self, job, work_dir):
+        with job._lock:
+            # A job cancelled while queued has already finished.
+            if job._cancelled:
+                return
+            job.status = "running"
+        try:
+            job._process = subprocess.Popen(
+                self.command + job.arguments,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                bufsize=1,
+                cwd=work_dir,
+            )
+        except OSError as e:
+            job.output.append(str(e))
+            job._finish("failed")
+            return
+        if job._cancelled:
+            job._process.terminate()
+
+        for line in job._process.stdout:
+            line = line.rstrip()
+            job.output.append(line)
+            match = PROGRESS_PATTERN.search(line)
+            if match:
+                job.progress = min(int(match.group(1)), 100)
+            if job.on_progress is not None:
+                try:
+                    job.on_progress(job, line)
+                except Exception:
+                    pass
+        job.returncode = job._process.wait()
+        job._process.stdout.close()
+
+        if job._cancelled:
+            job._finish("cancelled")
+        elif job.returncode == 0:
+            job._finish("done")
+        else:
+            job._finish("failed")
+
+    def call_in_main_thread(self, function, *args):
+        """Calls a function from the main thread, e.g. to add the output of a job to a map.
+        In a Jupyter kernel the call is scheduled on the kernel's event loop. Elsewhere it
+        is queued until apply_pending() is called.
+        Args:
+            function (callable): The function.
+            *args: The arguments of the function.
+        """
+        if threading.current_thread() is threading.main_thread():
+            function(*args)
+            return
+        io_loop = _kernel_io_loop()
+        if io_loop is not None:
+            io_loop.add_callback(function, *args)
+        else:
+            self._pending.put((function, args))
+
+    def apply_pending(self):
+        """Makes the calls queued by call_in_main_thread() outside of a Jupyter kernel.
+        Returns:
+            int: The number of calls made.
+        """
+        count = 0
+        while True:
+            try:
+                function, args = self._pending.get_nowait()
+            except queue.Empty:
+                return count
+            try:
+                function(*args)
+            except Exception as e:
+                print("Could not apply the update of a job: {}".format(e))
+            count += 1
+
+    def running(self):
+        """Returns the jobs that are queued or running."""
+        return [job for job in self.jobs if not job.done()]
+
+    def cancel_all(self):
+        """Cancels every queued or running job."""
+        for job in self.running():
+            job.cancel()
+
+    def shutdown(self):
+        """Cancels every job and stops the worker threads."""
+        self.cancel_all()
+        with self._lock:
+            for _ in self._threads:
+                self._queue.put(None)
+            self._threads = []
+
+
+_runners = weakref.WeakSet()
+
+
+@atexit.register
+def _stop_runners():
+    # The worker threads are daemons, so the WhiteboxTools processes still running are
+    # stopped here rather than left behind.
+    for runner in list(_runners):
+        runner.cancel_all()
+
+
+def _kernel_io_loop():
+    try:
+        from IPython import get_ipython
+    except ImportError:
+        return None
+    kernel = getattr(get_ipython(), "kernel", None)
+    return getattr(kernel, "io_loop", None)
+
+
+def add_output_to_map(m, path, kind):
+    """Adds a file written by a tool to a map. Vectors are added as layers; rasters need
+    localtileserver, and are otherwise only reported.
+    Args:
+        m (Map): The map.
+        path (str): The path to the file.
+        kind (str): 'raster' or 'vector'.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    if kind == "vector":
+        m.add_shapefile(path, layer_name=name)
+        return
+    try:
+        from localtileserver import TileClient, get_leaflet_tile_layer
+    except ImportError:
+        print("Created {}. Install localtileserver to display rasters.".format(path))
+        return
+    m.add_layer(get_leaflet_tile_layer(TileClient(path), name=name))
+
+
+def _optional(param):
+    return param["optional"] not in (False, "false")
+
+
+FILE_PARAMETER_TYPES = (
+    "Directory",
+    "ExistingFile",
+    "ExistingFileOrFloat",
+    "FileList",
+    "NewFile",
+)
+
+
+def _is_file(param_type):
+    if isinstance(param_type, dict):
+        param_type = next(iter(param_type), None)
+    return param_type in FILE_PARAMETER_TYPES
+
+
+def job_panel(tool_dict, max_height="500px", runner=None, on_output=None):
+    """Builds the panel of a tool, which runs the tool in the background with a job runner.
+    File parameters are picked with a file chooser, as in whiteboxgui, when ipyfilechooser
+    is installed, and typed in otherwise.
+    Args:
+        tool_dict (dict): The tool description, see get_tools_dict().
+        max_height (str, optional): The maximum height of the panel. Defaults to '500px'.
+        runner (WhiteboxJobRunner, optional): The job runner. Defaults to a new WhiteboxJobRunner.
+        on_output (callable, optional): Called from the main thread with the (path, kind) of each file written by a finished job. Like the progress shown in the panel, it goes through WhiteboxJobRunner.call_in_main_thread(). Defaults to None.
+    Returns:
+        object: The panel widget.
+    """
+    import ipywidgets as widgets
+
+    try:
+        from ipyfilechooser import FileChooser
+    except ImportError:
+        FileChooser = None
+
+    if runner is None:
+        runner = WhiteboxJobRunner()
+    style = {"description_width": "initial"}
+    layout = widgets.Layout(width="560px")
+    inputs = {}
+    children = [
+        widgets.HTML("<b>{}</b>".format(tool_dict["label"])),
+        widgets.HTML(tool_dict["description"]),
+    ]
+    for key, param in tool_dict["parameters"].items():
+        label = param["name"] + ("" if _optional(param) else "*")
+        param_type = param["parameter_type"]
+        default = param["default_value"]
+        if param_type == "Boolean":
+            widget = widgets.Checkbox(
+                value=default == "true", description=label, style=style
+            )
+        elif isinstance(param_type, dict) and "OptionList" in param_type:
+            options = param_type["OptionList"]
+            widget = widgets.Dropdown(
+                options=options,
+                value=default if default in options else options[0],
+                description=label,
+                style=style,
+                layout=layout,
+            )
+        elif FileChooser is not None and _is_file(param_type):
+            # FileChooser.value is the selected path, or None.
+            widget = FileChooser(title=label)
+        else:
+            widget = widgets.Text(
+                value=default.strip('"') if default and default != "null" else "",
+                description=label,
+                placeholder=param["description"],
+                style=style,
+                layout=layout,
+            )
+        inputs[key] = widget
+        children.append(widget)
+
+    run_button = widgets.Button(description="Run", button_style="primary")
+    cancel_button = widgets.Button(description="Cancel")
+    progress = widgets.IntProgress(value=0, max=100, description="Ready", style=style)
+    output = widgets.Output(layout=widgets.Layout(max_height="150px", overflow="auto"))
+    children += [widgets.HBox([run_button, cancel_button, progress]), output]
+    jobs = []
+
+    # The job callbacks run on a worker thread, so the widgets are only updated from the
+    # main thread.
+    def show_progress(value, line):
+        progress.value = value
+        output.append_stdout(line + "\n")
+
+    def show_done(job):
+        progress.value = job.progress
+        progress.description = job.status.capitalize()
+        progress.bar_style = {"done": "success", "failed": "danger"}.get(
+            job.status, "warning"
+        )
+        if job.status == "done" and on_output is not None:
+            for path, kind in job.outputs:
+                if os.path.exists(path):
+                    on_output(path, kind)
+
+    def on_progress(job, line):
+        runner.call_in_main_thread(show_progress, job.progress, line)
+
+    def on_done(job):
+        runner.call_in_main_thread(show_done, job)
+
+    def run_clicked(b):
+        runner.apply_pending()
+        args = {key: widget.value for key, widget in inputs.items()}
+        missing = [
+            param["name"]
+            for key, param in tool_dict["parameters"].items()
+            if not _optional(param) and args[key] in ("", None)
+        ]
+        output.clear_output()
+        if missing:
+            output.append_stdout("Missing: {}\n".format(", ".join(missing)))
+            return
+        progress.value = 0
+        progress.description = "Queued"
+        progress.bar_style = ""
+        job = runner.submit(
+            tool_dict["name"],
+            args,
+            outputs=tool_outputs(tool_dict, args),
+            on_progress=on_progress,
+            on_done=on_done,
+        )
+        jobs.append(job)
+
+    def cancel_clicked(b):
+        runner.apply_pending()
+        for job in jobs:
+            if not job.done():
+                job.cancel()
+
+    run_button.on_click(run_clicked)
+    cancel_button.on_click(cancel_clicked)
+    return widgets.VBox(
+        children, layout=widgets.Layout(max_height=max_height, overflow="auto")
+    )
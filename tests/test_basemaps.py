@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""Tests for the `basemaps` module."""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from ipyleaflet import TileLayer
+
+from nclpy import nclpy
+from nclpy.basemaps import BasemapTiles, _ee_basemaps
+
+# The package exports a ``basemaps`` Box, which shadows the module of the same name.
+basemaps_module = sys.modules["nclpy.basemaps"]
+
+
+class TestBasemaps(unittest.TestCase):
+    """Tests for the basemap descriptors and `BasemapTiles`."""
+
+    def test_descriptors(self):
+        self.assertIn("ROADMAP", _ee_basemaps)
+        for descriptor in _ee_basemaps.values():
+            self.assertIsInstance(descriptor, dict)
+            self.assertNotIsInstance(descriptor, TileLayer)
+
+    def test_built_on_first_access(self):
+        tiles = BasemapTiles()
+        with mock.patch.object(
+            basemaps_module,
+            "basemap_to_layer",
+            wraps=basemaps_module.basemap_to_layer,
+        ) as build:
+            self.assertEqual(build.call_count, 0)
+            layer = tiles["ROADMAP"]
+            self.assertIsInstance(layer, TileLayer)
+            self.assertIs(tiles["ROADMAP"], layer)
+            self.assertIs(tiles.ROADMAP, layer)
+            self.assertEqual(build.call_count, 1)
+
+    def test_maps_own_their_layers(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                first, second = nclpy.Map(), nclpy.Map()
+            finally:
+                os.chdir(cwd)
+        first_layer = first.basemap_tiles["ROADMAP"]
+        second_layer = second.basemap_tiles["ROADMAP"]
+        self.assertIsNot(first_layer, second_layer)
+        self.assertEqual(first_layer.url, second_layer.url)
+        self.assertIn(first_layer, first.layers)
+        self.assertNotIn(first_layer, second.layers)
+
+
+if __name__ == "__main__":
+    unittest.main()
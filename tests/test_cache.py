@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""Tests for the `cache` module."""
+
+import os
+import tempfile
+import time
+import unittest
+
+from nclpy.cache import MapIdCache
+
+
+class FakeTileFetcher:
+    def __init__(self, url_format):
+        self.url_format = url_format
+
+
+class FakeImage:
+    """Stands in for ee.Image and counts getMapId() calls."""
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.calls = 0
+
+    def serialize(self):
+        return self.expression
+
+    def getMapId(self, vis_params):
+        self.calls += 1
+        return {"tile_fetcher": FakeTileFetcher(self.expression + "/{z}/{x}/{y}")}
+
+
+class TestMapIdCache(unittest.TestCase):
+    """Tests for `MapIdCache`."""
+
+    def test_hit_and_miss(self):
+        cache = MapIdCache()
+        image = FakeImage("a")
+        cache.get_url_format(image, {"bands": ["B4", "B3", "B2"], "min": 0})
+        url = cache.get_url_format(image, {"min": 0, "bands": "B4,B3,B2"})
+        self.assertEqual(url, "a/{z}/{x}/{y}")
+        self.assertEqual(image.calls, 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_lru_eviction(self):
+        cache = MapIdCache(max_size=2)
+        images = [FakeImage(name) for name in "abc"]
+        for image in images:
+            cache.get_url_format(image)
+        cache.get_url_format(images[0])
+        self.assertEqual(images[0].calls, 2)
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_ttl(self):
+        cache = MapIdCache(ttl=0)
+        image = FakeImage("a")
+        cache.get_url_format(image)
+        cache.get_url_format(image)
+        self.assertEqual(image.calls, 2)
+
+    def test_disk_tier(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            MapIdCache(cache_dir=cache_dir).get_url_format(FakeImage("a"))
+            other_kernel = MapIdCache(cache_dir=cache_dir)
+            image = FakeImage("a")
+            other_kernel.get_url_format(image)
+            self.assertEqual(image.calls, 0)
+            self.assertEqual(other_kernel.stats()["hits"], 1)
+
+    def test_disk_pruning(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = MapIdCache(ttl=60, cache_dir=cache_dir, max_disk_size=3)
+            expired = os.path.join(cache_dir, "expired.json")
+            leftover = os.path.join(cache_dir, "leftover.tmp")
+            for path in [expired, leftover]:
+                with open(path, "w") as f:
+                    f.write("{}")
+                os.utime(path, (time.time() - 120,) * 2)
+
+            for i, name in enumerate("abcd"):
+                cache.set(name, name + "/{z}/{x}/{y}")
+                path = os.path.join(cache_dir, name + ".json")
+                os.utime(path, (time.time() - 10 + i,) * 2)
+            # Expired files and the oldest entries beyond max_disk_size are removed.
+            self.assertEqual(
+                sorted(os.listdir(cache_dir)), ["b.json", "c.json", "d.json"]
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+"""Tests for the `common` module."""
+
+import collections
+import json
+import os
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from nclpy import common
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "docs", "data")
+
+
+class FakeFeatureCollection:
+    """Stands in for ee.FeatureCollection and records what would be sent to the server."""
+
+    def __init__(self, args):
+        self.args = args
+        self.merged = []
+
+    def merge(self, other):
+        merged = FakeFeatureCollection(self.args)
+        merged.merged = self.merged + [other]
+        return merged
+
+
+class FakeTask:
+    """Stands in for an ee.batch.Task exporting a collection to a table asset."""
+
+    def __init__(self, exports, collection, description, assetId):
+        self.exports = exports
+        self.collection = collection
+        self.asset_id = assetId
+        self.states = ["READY", "RUNNING", "COMPLETED"]
+
+    def start(self):
+        self.exports.append(self)
+
+    def status(self):
+        return {"state": self.states.pop(0), "description": self.asset_id}
+
+
+def fake_ee(exports=None):
+    ee = types.ModuleType("ee")
+    ee.FeatureCollection = FakeFeatureCollection
+    ee.batch = types.SimpleNamespace(
+        Export=types.SimpleNamespace(
+            table=types.SimpleNamespace(
+                toAsset=lambda **kwargs: FakeTask(exports, **kwargs)
+            )
+        )
+    )
+    return ee
+
+
+class TestCommon(unittest.TestCase):
+    """Tests for `common` module."""
+
+    def setUp(self):
+        self.in_shp = os.path.abspath(os.path.join(DATA_DIR, "countries.shp"))
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_shp_to_geojson_stream(self):
+        out_geojson = os.path.join(self.tmp_dir.name, "countries.geojson")
+        common.shp_to_geojson(self.in_shp, out_geojson)
+        with open(out_geojson) as f:
+            streamed = json.load(f)
+        expected = json.loads(json.dumps(common.shp_to_geojson(self.in_shp)))
+        self.assertEqual(streamed, expected)
+
+    def test_iter_shp_features(self):
+        features = common.iter_shp_features(self.in_shp)
+        feature = next(features)
+        self.assertEqual(feature["type"], "Feature")
+        features.close()
+
+    def test_geojson_to_ee(self):
+        features = [
+            {
+                "type": "Feature",
+                "properties": {"id": i},
+                "geometry": {"type": "Point", "coordinates": [i * 0.001, 1.0]},
+            }
+            for i in range(10)
+        ]
+        in_geojson = os.path.join(self.tmp_dir.name, "points.geojson")
+        with open(in_geojson, "w") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f)
+
+        with mock.patch.dict(sys.modules, {"ee": fake_ee()}), mock.patch.object(
+            common, "ee_initialize"
+        ):
+            collection = common.geojson_to_ee(in_geojson)
+        self.assertEqual(collection.args, features)
+
+    def test_upload_geojson(self):
+        features = [
+            {
+                "type": "Feature",
+                "properties": {"id": i},
+                "geometry": {"type": "Point", "coordinates": [i * 0.001, 1.0]},
+            }
+            for i in range(1000)
+        ]
+        geo_json = {"type": "FeatureCollection", "features": features}
+        max_bytes = 10000
+        exports = []
+        with mock.patch.dict(sys.modules, {"ee": fake_ee(exports)}), mock.patch.object(
+            common, "ee_initialize"
+        ), mock.patch("time.sleep") as sleep:
+            # Collections that fit are sent inline.
+            small = {"type": "FeatureCollection", "features": features[:10]}
+            collection = common.geojson_to_ee(
+                small, asset_id="users/me/points", max_bytes=max_bytes
+            )
+            self.assertEqual(collection.args, features[:10])
+            self.assertEqual(exports, [])
+
+            collection = common.geojson_to_ee(
+                geo_json, asset_id="users/me/points", max_bytes=max_bytes
+            )
+        # Every export stays under the limit, and together they hold every feature.
+        self.assertGreater(len(exports), 1)
+        for task in exports:
+            size = len(json.dumps(task.collection.args, separators=(",", ":")))
+            self.assertLessEqual(size, max_bytes)
+        exported = [f for task in exports for f in task.collection.args]
+        self.assertEqual(exported, features)
+        self.assertEqual(sleep.call_count, 2 * len(exports))
+
+        # The result only refers to the assets.
+        asset_ids = ["users/me/points_{}".format(i) for i in range(len(exports))]
+        self.assertEqual([task.asset_id for task in exports], asset_ids)
+        self.assertEqual(collection.args, asset_ids[0])
+        self.assertEqual([c.args for c in collection.merged], asset_ids[1:])
+
+    def test_upload_geojson_failed(self):
+        exports = []
+        geo_json = {"type": "FeatureCollection", "features": [{}]}
+
+        def status(task):
+            return {"state": "FAILED", "error_message": "quota exceeded"}
+
+        with mock.patch.dict(sys.modules, {"ee": fake_ee(exports)}), mock.patch.object(
+            common, "ee_initialize"
+        ), mock.patch.object(FakeTask, "status", status):
+            collection = common.upload_geojson(geo_json, "users/me/points", wait=False)
+            self.assertEqual(collection.args, "users/me/points")
+            with self.assertRaisesRegex(RuntimeError, "quota exceeded"):
+                common.upload_geojson(geo_json, "users/me/points")
+        self.assertEqual(len(exports), 2)
+
+    def test_read_geojson_cache(self):
+        paths = []
+        for i, n in enumerate([1, 1, 1, 200]):
+            paths.append(os.path.join(self.tmp_dir.name, "{}.geojson".format(i)))
+            with open(paths[-1], "w") as f:
+                json.dump({"type": "FeatureCollection", "features": [{}] * n}, f)
+        limit = 2 * os.path.getsize(paths[0])
+
+        cache = collections.OrderedDict()
+        with mock.patch.object(
+            common, "GEOJSON_CACHE_BYTES", limit
+        ), mock.patch.object(common, "_geojson_cache", cache):
+            first = common.read_geojson(paths[0])
+            second = common.read_geojson(paths[1])
+            self.assertIs(common.read_geojson(paths[0]), first)
+            # The least recently read file is dropped once the limit is reached.
+            common.read_geojson(paths[2])
+            self.assertIs(common.read_geojson(paths[0]), first)
+            self.assertIsNot(common.read_geojson(paths[1]), second)
+            # Files larger than the limit are parsed every time.
+            large = common.read_geojson(paths[3])
+            self.assertIsNot(common.read_geojson(paths[3]), large)
+            self.assertEqual(len(cache), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""Tests for the `feature_store` module."""
+
+import unittest
+
+from nclpy.feature_store import FeatureStore, feature_id
+
+
+def point(x, y, **properties):
+    return {
+        "type": "Feature",
+        "properties": dict(style={}, **properties),
+        "geometry": {"type": "Point", "coordinates": [x, y]},
+    }
+
+
+class TestFeatureStore(unittest.TestCase):
+    """Tests for `FeatureStore`."""
+
+    def test_id_in_properties(self):
+        store = FeatureStore()
+        key = store.add(point(0, 0))
+        self.assertIsNone(feature_id(point(0, 0)))
+        self.assertEqual(feature_id(store.get(key)), key)
+        self.assertEqual(store.get(key)["properties"]["style"], {})
+
+    def test_delete_by_drawn_feature(self):
+        store = FeatureStore([point(0, 0), point(1, 1)])
+        first = store.get(store.ids()[0])
+        self.assertEqual(store.remove(first), feature_id(first))
+        self.assertEqual(len(store), 1)
+        self.assertIsNone(store.remove(point(5, 5)))
+        self.assertIsNone(store.remove(point(1, 1, id="unknown")))
+        self.assertEqual(len(store), 1)
+
+    def test_find_by_geometry(self):
+        store = FeatureStore()
+        first = store.add(point(0, 0))
+        second = store.add(point(0, 0))
+        self.assertEqual(store.find(point(0, 0)), first)
+        store.edit(point(1, 1), first)
+        self.assertEqual(store.find(point(0, 0)), second)
+        self.assertEqual(store.find(point(1, 1)), first)
+        self.assertEqual(store.remove(point(0, 0)), second)
+        self.assertIsNone(store.find(point(0, 0)))
+        store.clear()
+        self.assertIsNone(store.find(point(1, 1)))
+
+    def test_edit_by_id(self):
+        store = FeatureStore()
+        key = store.add(point(0, 0, id="a"))
+        store.edit(point(2, 2, id="a"))
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.get(key)["geometry"]["coordinates"], [2, 2])
+
+    def test_duplicate_features(self):
+        store = FeatureStore()
+        first = store.add(point(0, 0, id="a"))
+        second = store.add(point(0, 0, id="a"))
+        self.assertEqual((first, second), ("a", "a-1"))
+        store.remove(store.get(second))
+        self.assertEqual(store.ids(), ["a"])
+        store.remove(point(0, 0, id="a"))
+        self.assertEqual(len(store), 0)
+
+    def test_round_trip(self):
+        store = FeatureStore([point(0, 0), point(1, 1)])
+        copy = FeatureStore(store.to_geojson())
+        self.assertEqual(copy.ids(), store.ids())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+"""Tests for the `generate_points` module."""
+
+import math
+import unittest
+
+import numpy as np
+import shapely
+
+from nclpy.generate_points import points_to_geojson, random_points_local
+from nclpy.spatial_index import METERS_PER_DEGREE, roi_to_geometry
+
+TRIANGLE = {
+    "type": "Feature",
+    "properties": {},
+    "geometry": {
+        "type": "Polygon",
+        "coordinates": [[[-100, 40], [-90, 40], [-95, 48], [-100, 40]]],
+    },
+}
+
+CIRCLE = {
+    "type": "Feature",
+    "properties": {"style": {"radius": 5000}},
+    "geometry": {"type": "Point", "coordinates": [10, 60]},
+}
+
+
+class TestGeneratePoints(unittest.TestCase):
+    """Tests for `generate_points` module."""
+
+    def assert_inside(self, roi, coords):
+        geometry = roi_to_geometry(roi)
+        self.assertTrue(shapely.contains_xy(geometry, coords[:, 0], coords[:, 1]).all())
+
+    def test_uniform(self):
+        """Test that points fall inside the region and are reproducible."""
+        coords = random_points_local(TRIANGLE, 10000, seed=1)
+        self.assertEqual(coords.shape, (10000, 2))
+        self.assert_inside(TRIANGLE, coords)
+        np.testing.assert_array_equal(
+            coords, random_points_local(TRIANGLE, 10000, seed=1)
+        )
+        self.assertFalse(
+            np.array_equal(coords, random_points_local(TRIANGLE, 10000, seed=2))
+        )
+
+    def test_stratified(self):
+        """Test that stratified points cover the region evenly."""
+        coords = random_points_local(TRIANGLE, 1000, mode="stratified")
+        self.assertEqual(len(coords), 1000)
+        self.assert_inside(TRIANGLE, coords)
+        # The lower half of the triangle holds three quarters of its area.
+        share = (coords[:, 1] < 44).mean()
+        self.assertAlmostEqual(share, 0.75, delta=0.03)
+
+    def test_poisson(self):
+        """Test that Poisson-disk points keep the minimum distance on the ground."""
+        coords = random_points_local(CIRCLE, None, mode="poisson", min_distance=500)
+        self.assertGreater(len(coords), 200)
+        self.assert_inside(CIRCLE, coords)
+        meters = coords * [
+            math.cos(math.radians(60)) * METERS_PER_DEGREE,
+            METERS_PER_DEGREE,
+        ]
+        dist = np.sqrt(((meters[:, None] - meters[None]) ** 2).sum(axis=2))
+        np.fill_diagonal(dist, np.inf)
+        self.assertGreaterEqual(dist.min(), 499)
+
+        coords = random_points_local(CIRCLE, 100, mode="poisson")
+        self.assertEqual(len(coords), 100)
+
+        with self.assertRaisesRegex(ValueError, "POISSON_MAX_CELLS"):
+            random_points_local(CIRCLE, None, mode="poisson", min_distance=1)
+
+    def test_invalid(self):
+        """Test errors and the GeoJSON output."""
+        with self.assertRaises(ValueError):
+            random_points_local(TRIANGLE, mode="hexagonal")
+        point = {"type": "Point", "coordinates": [0, 0]}
+        with self.assertRaises(ValueError):
+            random_points_local(point)
+        geojson = points_to_geojson(random_points_local(TRIANGLE, 5))
+        self.assertEqual(len(geojson["features"]), 5)
+
+    def test_point_count(self):
+        """Test that no points give an empty result and invalid counts are rejected."""
+        for mode in ["uniform", "stratified", "poisson"]:
+            coords = random_points_local(TRIANGLE, 0, mode=mode)
+            self.assertEqual(coords.shape, (0, 2))
+            with self.assertRaisesRegex(ValueError, "negative"):
+                random_points_local(TRIANGLE, -1, mode=mode)
+            with self.assertRaisesRegex(ValueError, "required"):
+                random_points_local(TRIANGLE, None, mode=mode)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+"""Import-time tests for the `nclpy` package."""
+
+import json
+import subprocess
+import sys
+import unittest
+
+# Generous enough for slow CI runners, but far below the cost of importing
+# ipyleaflet or earthengine-api (several hundred milliseconds each).
+IMPORT_BUDGET_SECONDS = 0.25
+
+HEAVY_MODULES = ["ee", "ipyleaflet", "ipywidgets", "ipyfilechooser", "box"]
+
+
+def run_in_subprocess(code):
+    """Runs code in a fresh interpreter and returns the JSON it prints."""
+    output = subprocess.check_output([sys.executable, "-c", code])
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+class TestImport(unittest.TestCase):
+    """Tests for the lazy `nclpy` package layout."""
+
+    def test_import_budget(self):
+        result = run_in_subprocess(
+            "import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            "import nclpy\n"
+            "elapsed = time.perf_counter() - start\n"
+            "print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))\n"
+        )
+        self.assertLess(result["elapsed"], IMPORT_BUDGET_SECONDS)
+        for name in HEAVY_MODULES:
+            self.assertNotIn(name, result["modules"])
+
+    def test_conversion_functions_stay_light(self):
+        result = run_in_subprocess(
+            "import json, sys\n"
+            "from nclpy import shp_to_geojson, csv_to_shp\n"
+            "print(json.dumps({'modules': sorted(sys.modules)}))\n"
+        )
+        for name in HEAVY_MODULES:
+            self.assertNotIn(name, result["modules"])
+
+    def test_public_names(self):
+        import nclpy
+
+        for name in nclpy.__all__:
+            self.assertIn(name, dir(nclpy))
+        with self.assertRaises(AttributeError):
+            nclpy.does_not_exist
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+"""Tests for the `layer_cache` module."""
+
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from nclpy.layer_cache import LayerCache, decode_features, encode_features
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "docs", "data")
+
+
+class TestLayerCache(unittest.TestCase):
+    """Tests for `LayerCache`."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = LayerCache(cache_dir=os.path.join(self.tmp_dir.name, "cache"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_geojson(self, name, features):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, "w") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f)
+        return path
+
+    def test_round_trip(self):
+        """Test that every geometry type survives encoding. Coordinates are stored as floats."""
+        geometries = [
+            {"type": "Point", "coordinates": [1.5, 2.5]},
+            {"type": "MultiPoint", "coordinates": [[1.0, 2.0], [3.0, 4.0]]},
+            {"type": "LineString", "coordinates": [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]},
+            {
+                "type": "MultiLineString",
+                "coordinates": [[[1.0, 2.0], [3.0, 4.0]], [[5.0, 6.0], [7.0, 8.0]]],
+            },
+            {
+                "type": "Polygon",
+                "coordinates": [
+                    [[0.0, 0.0], [4.0, 0.0], [4.0, 4.0], [0.0, 0.0]],
+                    [[1.0, 1.0], [2.0, 1.0], [2.0, 2.0], [1.0, 1.0]],
+                ],
+            },
+            {
+                "type": "MultiPolygon",
+                "coordinates": [
+                    [[[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 0.0]]],
+                    [[[5.0, 5.0], [6.0, 5.0], [6.0, 6.0], [5.0, 5.0]]],
+                ],
+            },
+            {
+                "type": "GeometryCollection",
+                "geometries": [{"type": "Point", "coordinates": [0.0, 0.0]}],
+            },
+            None,
+        ]
+        geojson = {
+            "type": "FeatureCollection",
+            "bbox": [0, 0, 7, 8],
+            "features": [
+                {"type": "Feature", "id": i, "properties": {"n": i}, "geometry": g}
+                for i, g in enumerate(geometries)
+            ],
+        }
+        geojson["features"][0]["properties"]["extra"] = "mixed keys"
+        decoded = decode_features(*encode_features(json.loads(json.dumps(geojson))))
+        self.assertEqual(
+            json.dumps(decoded, sort_keys=True), json.dumps(geojson, sort_keys=True)
+        )
+
+    def test_shapefile(self):
+        """Test that a cached shapefile loads the same features from memory-mapped arrays."""
+        in_shp = os.path.join(DATA_DIR, "countries.shp")
+        first = self.cache.load(in_shp)
+        second = self.cache.load(in_shp)
+        self.assertEqual(
+            json.dumps(first, sort_keys=True), json.dumps(second, sort_keys=True)
+        )
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        arrays, table = self.cache.read_arrays(in_shp)
+        self.assertIsInstance(arrays["coords"], np.memmap)
+        self.assertEqual(len(table["columns"]["name"]), 179)
+
+    def test_value_types(self):
+        """Test that a hit returns dates as a miss does, and unsupported values are not cached."""
+        point = {
+            "type": "Feature",
+            "properties": {
+                "day": datetime.date(2020, 1, 2),
+                "time": datetime.datetime(2020, 1, 2, 3, 4, 5),
+                "tag": {"__date__": "not a date", "other": 1},
+            },
+            "geometry": {"type": "Point", "coordinates": [1.0, 2.0]},
+        }
+        path = self.write_geojson("dates.geojson", [])
+        geojson = {"type": "FeatureCollection", "features": [point]}
+        self.cache.write(path, geojson)
+        arrays, table = self.cache.read_arrays(path)
+        self.assertEqual(decode_features(arrays, table), geojson)
+
+        point["properties"]["value"] = object()
+        with self.assertRaises(TypeError):
+            self.cache.write(path, geojson)
+        self.assertEqual(len(self.cache.info()), 1)
+
+    def test_invalidation(self):
+        """Test that a modified file is parsed again and its old entry removed."""
+        point = {
+            "type": "Feature",
+            "properties": {"v": 1},
+            "geometry": {"type": "Point", "coordinates": [1, 2]},
+        }
+        path = self.write_geojson("points.geojson", [point])
+        self.cache.load(path)
+        point["properties"]["v"] = 2
+        self.write_geojson("points.geojson", [point, point])
+        os.utime(path, ns=(0, 10**18))
+        geojson = self.cache.load(path)
+        self.assertEqual(len(geojson["features"]), 2)
+        self.assertEqual(self.cache.stats()["misses"], 2)
+        self.assertEqual(len(self.cache.info()), 1)
+
+    def test_eviction(self):
+        """Test that the least recently used entries are removed beyond max_size."""
+        paths = []
+        for i in range(3):
+            point = {
+                "type": "Feature",
+                "properties": {},
+                "geometry": {"type": "Point", "coordinates": [i, i]},
+            }
+            paths.append(self.write_geojson("p{}.geojson".format(i), [point]))
+        self.cache.load(paths[0])
+        size = self.cache.info()[0]["bytes"]
+        self.cache.max_size = 2 * size
+        for index, path in enumerate(paths[1:]):
+            entry = self.cache.info()[0]
+            meta = os.path.join(self.cache.cache_dir, entry["key"], "meta.json")
+            os.utime(meta, (index, index))
+            self.cache.load(path)
+        sources = [os.path.basename(entry["source"]) for entry in self.cache.info()]
+        self.assertEqual(sources, ["p2.geojson", "p1.geojson"])
+        self.cache.clear()
+        self.assertEqual(self.cache.info(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
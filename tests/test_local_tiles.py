@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+"""Tests for the `local_tiles` module."""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+
+from nclpy.local_tiles import (
+    DirectorySource,
+    MBTilesSource,
+    MemoryTileCache,
+    local_basemap,
+    open_tile_source,
+)
+from nclpy.tile_proxy import TileProxy
+
+
+def write_mbtiles(path, tiles, metadata):
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+    connection.execute(
+        "CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, "
+        "tile_row INTEGER, tile_data BLOB)"
+    )
+    connection.executemany("INSERT INTO metadata VALUES (?, ?)", metadata.items())
+    if metadata.get("scheme") != "xyz":
+        tiles = {(z, x, (1 << z) - 1 - y): data for (z, x, y), data in tiles.items()}
+    connection.executemany(
+        "INSERT INTO tiles VALUES (?, ?, ?, ?)",
+        [(z, x, y, data) for (z, x, y), data in tiles.items()],
+    )
+    connection.commit()
+    connection.close()
+
+
+class TestLocalTiles(unittest.TestCase):
+    """Tests for the local tile sources."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tiles = {
+            (z, x, y): "{}/{}/{}".format(z, x, y).encode("utf-8")
+            for z in range(3)
+            for x in range(1 << z)
+            for y in range(1 << z)
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_mbtiles(self):
+        path = os.path.join(self.tmp_dir.name, "offline.mbtiles")
+        write_mbtiles(path, self.tiles, {"name": "Offline", "format": "png"})
+        source = MBTilesSource(path)
+        self.assertEqual(source.get_tile(2, 1, 3), b"2/1/3")
+        self.assertIsNone(source.get_tile(5, 0, 0))
+        self.assertEqual(
+            (source.metadata["minzoom"], source.metadata["maxzoom"]), (0, 2)
+        )
+        source.close()
+
+        descriptor = local_basemap(path)
+        self.assertEqual(descriptor["name"], "Offline")
+        self.assertEqual(descriptor["max_native_zoom"], 2)
+
+    def test_mbtiles_xyz(self):
+        path = os.path.join(self.tmp_dir.name, "xyz.mbtiles")
+        write_mbtiles(path, self.tiles, {"scheme": "xyz"})
+        source = MBTilesSource(path)
+        self.assertEqual(source.get_tile(2, 1, 3), b"2/1/3")
+        source.close()
+
+    def test_mbtiles_without_tiles(self):
+        path = os.path.join(self.tmp_dir.name, "no_tiles.mbtiles")
+        write_mbtiles(path, {}, {"name": "Empty"})
+        with self.assertRaisesRegex(ValueError, "does not have any tiles"):
+            local_basemap(path)
+
+    def test_not_mbtiles(self):
+        path = os.path.join(self.tmp_dir.name, "empty.mbtiles")
+        with open(path, "wb") as f:
+            f.write(b"not a database" * 100)
+        with self.assertRaises(ValueError):
+            MBTilesSource(path)
+
+    def test_directory(self):
+        for (z, x, y), data in self.tiles.items():
+            os.makedirs(os.path.join(self.tmp_dir.name, str(z), str(x)), exist_ok=True)
+            with open(
+                os.path.join(self.tmp_dir.name, str(z), str(x), "{}.jpg".format(y)),
+                "wb",
+            ) as f:
+                f.write(data)
+        source = DirectorySource(self.tmp_dir.name)
+        self.assertEqual(source.extension, ".jpg")
+        self.assertEqual(source.get_tile(2, 1, 3), b"2/1/3")
+        self.assertIsNone(source.get_tile(3, 0, 0))
+        self.assertEqual(
+            DirectorySource(self.tmp_dir.name, tms=True).get_tile(2, 1, 3), b"2/1/0"
+        )
+
+        xyz = open_tile_source(self.tmp_dir.name)
+        tms = open_tile_source(self.tmp_dir.name, tms=True)
+        self.assertIs(open_tile_source(self.tmp_dir.name), xyz)
+        self.assertEqual(tms.get_tile(2, 1, 3), b"2/1/0")
+        self.assertNotEqual(tms.key, xyz.key)
+
+    def test_served_by_proxy(self):
+        path = os.path.join(self.tmp_dir.name, "offline.mbtiles")
+        write_mbtiles(path, self.tiles, {"name": "Offline"})
+        proxy = TileProxy(cache_dir=os.path.join(self.tmp_dir.name, "cache"))
+        try:
+            url = proxy.local_url(MBTilesSource(path))
+            for _ in range(2):
+                with urllib.request.urlopen(url.format(z=1, x=1, y=0)) as response:
+                    self.assertEqual(response.read(), b"1/1/0")
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(url.format(z=4, x=0, y=0))
+            stats = proxy.stats()
+            self.assertEqual((stats["local_requests"], stats["local_hits"]), (3, 1))
+            self.assertEqual(len(proxy.cache), 0)
+        finally:
+            proxy.stop()
+
+
+class TestMemoryTileCache(unittest.TestCase):
+    """Tests for `MemoryTileCache`."""
+
+    def test_eviction(self):
+        cache = MemoryTileCache(max_size=250)
+        for x in range(3):
+            cache.put(("key", 1, x, 0), bytes(100))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(("key", 1, 0, 0)))
+        self.assertEqual(cache.get(("key", 1, 2, 0)), bytes(100))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
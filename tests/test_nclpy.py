@@ -2,19 +2,370 @@
 
 """Tests for `nclpy` package."""
 
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
 
-# import unittest
+from ipyleaflet import DrawControl, ScaleControl, TileLayer
+from ipywidgets import Output
 
-# from nclpy import nclpy
+from nclpy import nclpy, perf
+from nclpy.tile_proxy import TileProxy
 
-# class TestNclpy(unittest.TestCase):
-#     """Tests for `nclpy` package."""
 
-#     def setUp(self):
-#         """Set up test fixtures, if any."""
+def point(x, y):
+    return {
+        "type": "Feature",
+        "properties": {"style": {}},
+        "geometry": {"type": "Point", "coordinates": [x, y]},
+    }
 
-#     def tearDown(self):
-#         """Tear down test fixtures, if any."""
 
-#     def test_000_something(self):
-#         """Test something."""
\ No newline at end of file
+class TestNclpy(unittest.TestCase):
+    """Tests for `nclpy` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        # The toolbar's file chooser browses ./data, so the map is built in a scratch
+        # directory.
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp_dir.name, "data"))
+        os.chdir(self.tmp_dir.name)
+        self.map = nclpy.Map()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def draw(self, action, geo_json):
+        """Sends a DrawControl event to the map, as the front end does."""
+        draw_control = next(c for c in self.map.controls if isinstance(c, DrawControl))
+        content = {"event": "draw:" + action, "geo_json": geo_json}
+        draw_control._handle_leaflet_event(draw_control, content, None)
+
+    def test_draw_without_ee(self):
+        """Test that drawn features are shown client-side and user_rois is built lazily."""
+        with mock.patch.object(nclpy, "ee") as ee, mock.patch.object(
+            nclpy, "ee_initialize"
+        ) as ee_initialize:
+            self.draw("created", point(0, 0))
+            draw_layer = self.map.draw_layer
+            bucket = draw_layer.layers[0]
+            first = bucket.layers[0]
+
+            with mock.patch.object(self.map, "_send") as send:
+                self.draw("created", point(1, 1))
+            # The second feature is appended to the same bucket; nothing is rebuilt and
+            # the map's layer list is not sent again.
+            send.assert_not_called()
+            self.assertIs(self.map.draw_layer, draw_layer)
+            self.assertEqual(draw_layer.layers, (bucket,))
+            self.assertIs(bucket.layers[0], first)
+            self.assertEqual(len(bucket.layers), 2)
+            self.assertEqual(ee.mock_calls, [])
+            ee_initialize.assert_not_called()
+
+            rois = self.map.user_rois
+            self.assertIs(rois, ee.FeatureCollection.return_value)
+            self.assertEqual(ee.Feature.call_count, 2)
+            self.assertIs(self.map.user_rois, rois)
+            self.assertEqual(ee.FeatureCollection.call_count, 1)
+
+            self.draw("created", point(2, 2))
+            self.assertEqual(ee.FeatureCollection.call_count, 1)
+            self.map.user_rois
+            self.assertEqual(ee.FeatureCollection.call_count, 2)
+
+    def test_draw_edit_delete(self):
+        """Test that edited and deleted features are matched against the stored ones."""
+        self.draw("created", point(0, 0))
+        self.draw("created", point(1, 1))
+        self.assertEqual(self.map.draw_count, 2)
+        keys = self.map.draw_features.ids()
+        self.assertEqual(self.map.draw_control.data, [])
+
+        # An edited shape comes back without an id; the front end then syncs the
+        # shapes in the order they were drawn.
+        edited = point(3, 3)
+        self.draw("edited", edited)
+        self.map.draw_control.data = [point(0, 0), edited]
+        self.assertEqual(self.map.draw_count, 2)
+        self.assertEqual(self.map.draw_features.ids(), keys)
+        self.assertEqual(
+            self.map.draw_features.get(keys[1])["geometry"]["coordinates"], [3, 3]
+        )
+        layer = self.map._draw_feature_layers[keys[1]][1]
+        self.assertEqual(layer.data["geometry"]["coordinates"], [3, 3])
+
+        self.draw("deleted", point(3, 3))
+        self.assertEqual(self.map.draw_count, 1)
+        self.assertEqual(self.map.draw_features.ids(), keys[:1])
+        self.assertNotIn(keys[1], self.map._draw_feature_layers)
+
+        self.draw("edited", point(4, 4))
+        self.map.draw_control.data = [point(4, 4)]
+        self.assertEqual(
+            self.map.draw_features.get(keys[0])["geometry"]["coordinates"], [4, 4]
+        )
+        self.draw("created", point(5, 5))
+        self.assertEqual(self.map.draw_features.ids()[0], keys[0])
+        self.map.clear_drawn_features()
+        self.assertEqual(self.map.draw_count, 0)
+        self.assertEqual(self.map._draw_order, [])
+
+    def test_draw_message_size(self):
+        """Test that the messages sent per drawn shape do not grow with draw_count."""
+        from ipywidgets import Widget
+
+        sizes = []
+        original_send = Widget._send
+
+        def send(widget, msg, buffers=None):
+            self.assertIsNot(widget, self.map.draw_control)
+            sizes[-1] += len(json.dumps(msg, default=str))
+            return original_send(widget, msg, buffers)
+
+        with mock.patch.object(Widget, "_send", send):
+            for _ in range(3 * nclpy.DRAW_LAYER_BUCKET_SIZE):
+                sizes.append(0)
+                self.draw("created", point(0.5, 0.5))
+        self.assertEqual(self.map.draw_count, len(sizes))
+        self.assertEqual(self.map.draw_control.data, [])
+        # Only the new shape and its bucket's layer list are sent, so the traffic for
+        # the nth shape in a bucket is the same in every bucket.
+        n = nclpy.DRAW_LAYER_BUCKET_SIZE
+        self.assertEqual(sizes[n + 1 : 2 * n], sizes[1:n])
+        self.assertEqual(sizes[2 * n + 1 :], sizes[1:n])
+        self.assertLess(max(sizes), 50 * n)
+
+    def test_clear_keeps_vector_layers(self):
+        """Test that clearing the drawn features leaves the tiled layers in place."""
+        points = {"type": "FeatureCollection", "features": [point(0, 0)]}
+        self.map.add_geojson(points, layer_name="points", tiled=True)
+        tiles = self.map.vector_tiles["points"]
+        self.draw("created", point(1, 1))
+        self.map.clear_drawn_features()
+        self.assertIs(self.map.vector_tiles["points"], tiles)
+        self.assertIn(tiles.layer, self.map.layers)
+
+    def test_add_random_points(self):
+        """Test that random points are added as one layer and the count is validated."""
+        roi = {
+            "type": "Polygon",
+            "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]],
+        }
+        n_layers = len(self.map.layers)
+        self.assertEqual(self.map.add_random_points(10, roi=roi).shape, (10, 2))
+        self.assertEqual(self.map.add_random_points(0, roi=roi).shape, (0, 2))
+        self.assertEqual(len(self.map.layers), n_layers + 2)
+        for points in [-1, None]:
+            with self.assertRaises(ValueError):
+                self.map.add_random_points(points, roi=roi)
+        self.assertEqual(len(self.map.layers), n_layers + 2)
+
+    def test_identify(self):
+        """Test that identify hits points within a few pixels at the current zoom."""
+        points = {"type": "FeatureCollection", "features": [point(0, 0)]}
+        self.map.add_geojson(points, layer_name="points", spatial_index=True)
+        self.map.zoom = 10
+        # A pixel is about 0.0014 degrees at zoom 10.
+        found = self.map.identify(0.004, 0.004, layer_name="points")
+        self.assertEqual(len(found["points"]["features"]), 1)
+        found = self.map.identify(0.02, 0, layer_name="points")
+        self.assertEqual(found["points"]["features"], [])
+
+        self.map.clear_drawn_features()
+        self.assertIn("points", self.map.spatial_indexes)
+
+    def test_add_ee_layers(self):
+        """Test that map IDs are requested concurrently and failures are reported."""
+        lock = threading.Lock()
+        active = [0, 0]
+
+        def fake_url(ee_object, vis_params):
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            if ee_object == "bad":
+                raise ValueError("getMapId failed")
+            return "https://tiles/{}/{{z}}/{{x}}/{{y}}".format(ee_object)
+
+        layers = [("image{}".format(i), {}, "layer{}".format(i)) for i in range(8)]
+        layers.insert(3, {"ee_object": "bad", "name": "broken"})
+        layers.append(("bad", {}, "broken"))
+        n_layers = len(self.map.layers)
+
+        with mock.patch.object(nclpy, "ee_initialize"), mock.patch.object(
+            nclpy, "ee_tile_url", side_effect=fake_url
+        ):
+            with mock.patch("builtins.print"):
+                start = time.time()
+                errors = self.map.add_ee_layers(layers, max_workers=4)
+                elapsed = time.time() - start
+
+        # Failures sharing a name are reported separately.
+        self.assertEqual(list(errors), [(3, "broken"), (9, "broken")])
+        self.assertIsInstance(errors[(3, "broken")], ValueError)
+        names = [layer.name for layer in self.map.layers[n_layers:]]
+        self.assertEqual(names, ["layer{}".format(i) for i in range(8)])
+        self.assertEqual(active[1], 4)
+        self.assertLess(elapsed, 10 * 0.05)
+
+    def test_add_local_basemap(self):
+        """Test that a local tile pyramid is served by the tile proxy and listed as a basemap."""
+        os.makedirs(os.path.join("pyramid", "0", "0"))
+        with open(os.path.join("pyramid", "0", "0", "0.png"), "wb") as f:
+            f.write(b"\x89PNG")
+        proxy = TileProxy(cache_dir="cache")
+        try:
+            with mock.patch("nclpy.tile_proxy._tile_proxy", proxy):
+                name = self.map.add_local_basemap("pyramid", name="Offline")
+            self.assertEqual(name, "Offline")
+            self.assertIn("Offline", self.map.basemap_tiles)
+            self.assertNotIn("Offline", nclpy.basemap_tiles)
+            layer = self.map.layers[-1]
+            self.assertTrue(layer.url.startswith(proxy.base_url))
+            self.assertEqual(layer.max_native_zoom, 0)
+        finally:
+            proxy.stop()
+
+    def test_batch(self):
+        """Test that layer and control changes in a batch reach the front end in one update."""
+        layers = [
+            TileLayer(url="https://tiles/{}/{{z}}/{{x}}/{{y}}".format(i))
+            for i in range(12)
+        ]
+        with mock.patch.object(self.map, "_send") as send:
+            with self.map.batch():
+                for layer in layers[:6]:
+                    self.map.add_layer(layer)
+                with self.map.batch():
+                    for layer in layers[6:]:
+                        self.map.add_layer(layer)
+                self.map.add_control(ScaleControl(position="bottomright"))
+                self.assertEqual(send.call_count, 0)
+        self.assertEqual(send.call_count, 1)
+        state = send.call_args[0][0]["state"]
+        self.assertEqual(sorted(state), ["controls", "layers"])
+        self.assertEqual(len(state["layers"]), len(self.map.layers))
+        self.assertEqual(self.map.layers[-12:], tuple(layers))
+
+    def test_lazy_toolbar(self):
+        """Test that the toolbar builds each tool on first use, and only then."""
+        from ipyfilechooser import FileChooser
+
+        os.rmdir("data")
+        with mock.patch(
+            "ipyfilechooser.FileChooser", wraps=FileChooser
+        ) as file_chooser:
+            m = nclpy.Map()
+            toolbar = m.controls[2].widget
+            self.assertEqual(len(toolbar.children), 1)
+            file_chooser.assert_not_called()
+
+            m.toolbar_button.value = True
+            grid = toolbar.children[1]
+            m.toolbar_button.value = False
+            self.assertEqual(len(toolbar.children), 1)
+            m.toolbar_button.value = True
+            self.assertIs(toolbar.children[1], grid)
+
+            tools = {button.icon: button for button in grid.children}
+            n_controls = len(m.controls)
+            for _ in range(2):
+                tools["folder-open"].click()
+                tools["map"].click()
+            file_chooser.assert_called_once_with(os.getcwd())
+            self.assertEqual(len(m.controls), n_controls + 2)
+
+            # The output of the tools is shown under the grid, also after reopening.
+            self.assertIs(m.toolbar, toolbar)
+            output = toolbar.children[2]
+            self.assertIsInstance(output, Output)
+            m.toolbar_button.value = False
+            m.toolbar_button.value = True
+            self.assertIs(toolbar.children[2], output)
+            m.toolbar_reset()
+            self.assertTrue(m.toolbar_button.value)
+
+            m.remove_control(m.basemap_ctrl)
+            tools["map"].click()
+            self.assertIn(m.basemap_ctrl, m.controls)
+
+    def test_toolbar_apply_uses_layer_cache(self):
+        """Test that applying the same file twice in the toolbar parses it once."""
+        from nclpy.layer_cache import LayerCache
+
+        with open(os.path.join("data", "points.geojson"), "w") as f:
+            json.dump({"type": "FeatureCollection", "features": [point(0, 0)]}, f)
+
+        cache = LayerCache(cache_dir="layer_cache")
+        with mock.patch("nclpy.layer_cache.layer_cache", cache):
+            self.map.toolbar_button.value = True
+            grid = self.map.toolbar.children[1]
+            tools = {button.icon: button for button in grid.children}
+            tools["folder-open"].click()
+            fc, buttons = self.map.tool_control.widget.children
+            fc.reset(os.path.abspath("data"), "points.geojson")
+            fc._apply_selection()
+            n_layers = len(self.map.layers)
+            buttons.value = "Apply"
+            buttons.value = "Apply"
+        self.assertEqual(len(self.map.layers), n_layers + 2)
+        self.assertEqual((cache.misses, cache.hits), (1, 1))
+
+    def test_headless(self):
+        """Test that a headless map is a bare layer container that still takes layers."""
+        m = nclpy.Map(headless=True)
+        self.assertEqual((m.layers, m.controls), ((), ()))
+        self.assertIsNone(m.toolbar)
+
+        geojson = {
+            "type": "Feature",
+            "properties": {},
+            "geometry": {"type": "Point", "coordinates": [0.0, 0.0]},
+        }
+        m.add_geojson(geojson, layer_name="point")
+        with mock.patch.object(nclpy, "ee_initialize"), mock.patch.object(
+            nclpy, "ee_tile_url", return_value="https://tiles/{z}/{x}/{y}"
+        ):
+            m.add_ee_layer("image", {}, "image")
+        self.assertEqual([layer.name for layer in m.layers], ["point", "image"])
+        self.assertEqual(m.controls, ())
+
+    def test_perf_report(self):
+        """Test that map methods are timed and their widget traffic counted."""
+        geojson = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {"id": i},
+                    "geometry": {"type": "Point", "coordinates": [i * 0.01, 0.0]},
+                }
+                for i in range(1000)
+            ],
+        }
+        perf.profiler.reset()
+        perf.enable()
+        try:
+            self.map.add_geojson(geojson, layer_name="points")
+        finally:
+            perf.disable()
+        report = self.map.perf_report(reset=True)
+        self.assertEqual(report["spans"]["Map.add_geojson"]["count"], 1)
+        self.assertGreater(report["counters"]["widget.bytes"], 50000)
+        self.assertEqual(self.map.perf_report()["spans"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
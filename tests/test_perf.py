@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+"""Tests for the `perf` module."""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from nclpy import perf
+from nclpy.cache import MapIdCache
+from nclpy.perf import profiler, timed
+
+
+@timed("outer")
+def outer():
+    inner()
+    inner()
+
+
+@timed()
+def inner():
+    time.sleep(0.001)
+
+
+class FakeImage:
+    def serialize(self):
+        return "image"
+
+    def getMapId(self, vis_params):
+        return {"tile_fetcher": type("TileFetcher", (), {"url_format": "url"})}
+
+
+class TestPerf(unittest.TestCase):
+    """Tests for the profiler."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        profiler.reset()
+
+    def tearDown(self):
+        perf.disable()
+        profiler.reset()
+        self.tmp_dir.cleanup()
+
+    def test_disabled(self):
+        outer()
+        perf.count("ee.getMapId")
+        self.assertEqual(perf.report()["spans"], {})
+        self.assertEqual(perf.report()["counters"], {})
+
+        # A disabled span adds about one attribute check to each call.
+        wrapped = timed()(len)
+        calls = 100000
+        start = time.perf_counter()
+        for _ in range(calls):
+            wrapped(())
+        self.assertLess((time.perf_counter() - start) / calls, 20e-6)
+
+    def test_spans_and_log(self):
+        log = os.path.join(self.tmp_dir.name, "perf.jsonl")
+        perf.enable(log=log)
+        outer()
+        cache = MapIdCache()
+        cache.get_url_format(FakeImage())
+        cache.get_url_format(FakeImage())
+        perf.disable()
+
+        report = perf.report()
+        self.assertFalse(report["enabled"])
+        self.assertEqual(list(report["spans"]), ["outer", "inner"])
+        self.assertEqual(report["spans"]["inner"]["count"], 2)
+        self.assertGreaterEqual(report["spans"]["outer"]["total_ms"], 2)
+        self.assertEqual(report["counters"], {"ee.getMapId": 1})
+
+        with open(log) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(
+            [(e["type"], e["name"], e.get("depth")) for e in entries],
+            [
+                ("span", "inner", 1),
+                ("span", "inner", 1),
+                ("span", "outer", 0),
+                ("count", "ee.getMapId", None),
+            ],
+        )
+
+    def test_widget_messages(self):
+        import ipywidgets as widgets
+
+        send = widgets.Widget._send
+        perf.enable()
+        text = widgets.Text()
+        # The text box, its layout and its style each send their state when created.
+        self.assertEqual(profiler.counters["widget.messages"], 3)
+        opened = profiler.counters["widget.bytes"]
+        text.value = "x" * 1000
+        perf.disable()
+        text.value = "y"
+
+        self.assertEqual(profiler.counters["widget.messages"], 4)
+        self.assertGreater(profiler.counters["widget.bytes"], opened + 1000)
+        self.assertIs(widgets.Widget._send, send)
+
+
+if __name__ == "__main__":
+    unittest.main()
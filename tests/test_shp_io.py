@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""Tests for the `shp_io` module."""
+
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+import shapefile
+
+from nclpy import shp_io
+
+CSV = """name,latitude,longitude,count,speed,day
+Bombo,0.5833,32.5333,75000,1.5,2020-01-31
+Fort Portal,0.671,-30.275,,-0.25,2020-02-01
+Émile,-1.5,30,12,3,
+"""
+
+
+class TestShpIO(unittest.TestCase):
+    """Tests for `shp_io` module."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.in_csv = os.path.join(self.tmp_dir.name, "points.csv")
+        with open(self.in_csv, "w", encoding="utf-8") as f:
+            f.write(CSV)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def convert(self, **kwargs):
+        out_shp = os.path.join(self.tmp_dir.name, "points.shp")
+        stats = shp_io.csv_to_points(self.in_csv, out_shp, **kwargs)
+        self.assertEqual(stats["rows"], 3)
+        return shapefile.Reader(out_shp)
+
+    def test_field_types(self):
+        with self.convert() as sf:
+            fields = {f[0]: (f[1], f[2], f[3]) for f in sf.fields[1:]}
+            self.assertEqual(fields["name"], ("C", 11, 0))
+            self.assertEqual(fields["count"], ("N", 5, 0))
+            self.assertEqual(fields["speed"], ("N", 5, 2))
+            self.assertEqual(fields["day"], ("D", 8, 0))
+
+    def test_records_and_shapes(self):
+        with self.convert(chunk_size=2) as sf:
+            self.assertEqual(sf.shapeType, shapefile.POINT)
+            self.assertEqual(sf.shape(1).points, [(-30.275, 0.671)])
+            self.assertEqual(
+                list(sf.record(0)),
+                ["Bombo", 0.5833, 32.5333, 75000, 1.5, datetime.date(2020, 1, 31)],
+            )
+            self.assertEqual(sf.record(1)["count"], None)
+            self.assertEqual(sf.record(2)["name"], "Émile")
+            self.assertEqual(list(sf.bbox), [-30.275, -1.5, 32.5333, 0.671])
+
+    def test_invalid_coordinates(self):
+        with open(self.in_csv, "a", encoding="utf-8") as f:
+            f.write("Nowhere,north,10,1,1,\n")
+        with self.assertRaises(ValueError):
+            shp_io.csv_to_points(
+                self.in_csv, os.path.join(self.tmp_dir.name, "points.shp")
+            )
+
+    def assert_same_geojson(self, in_shp):
+        with shapefile.Reader(in_shp) as sf:
+            expected = json.loads(json.dumps(sf.__geo_interface__))
+        self.assertEqual(
+            json.loads(json.dumps(shp_io.read_shapefile(in_shp))), expected
+        )
+
+    def test_read_points(self):
+        self.convert()
+        self.assert_same_geojson(os.path.join(self.tmp_dir.name, "points.shp"))
+
+    def test_read_polylines(self):
+        in_shp = os.path.join(self.tmp_dir.name, "lines.shp")
+        with shapefile.Writer(in_shp, shapeType=shapefile.POLYLINE) as w:
+            w.field("name", "C")
+            w.field("count", "N", 10, 0)
+            w.field("speed", "N", 12, 4)
+            w.field("day", "D")
+            w.field("ok", "L")
+            w.line([[[0, 0], [1, 1], [2, 0]]])
+            w.record("a", 1, 1.5, datetime.date(2020, 1, 2), True)
+            w.line([[[0, 0], [1, 1]], [[5, 5], [6, 6], [7, 7]]])
+            w.record("Émile", None, None, None, None)
+            w.null()
+            w.record("c", 3, -2.25, "", False)
+        self.assert_same_geojson(in_shp)
+
+        geojson = shp_io.read_shapefile(in_shp, start=1, stop=2)
+        self.assertEqual(geojson["features"][0]["geometry"]["type"], "MultiLineString")
+        with self.assertRaises(ValueError):
+            shp_io.read_shapefile(
+                os.path.join(
+                    os.path.dirname(__file__),
+                    os.pardir,
+                    "docs",
+                    "data",
+                    "countries.shp",
+                )
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
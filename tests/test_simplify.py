@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""Tests for the `simplify` module."""
+
+import math
+import unittest
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from nclpy.simplify import precision_for_zoom, simplify_geojson, tolerance_for_zoom
+
+
+def circle(lon, lat, radius, n=1000):
+    angles = np.linspace(0, 2 * math.pi, n)
+    ring = np.column_stack([lon + radius * np.cos(angles), lat + radius * np.sin(angles)])
+    ring[-1] = ring[0]
+    return {
+        "type": "Feature",
+        "properties": {"name": "circle"},
+        "geometry": {"type": "Polygon", "coordinates": [ring.tolist()]},
+    }
+
+
+class TestSimplify(unittest.TestCase):
+    """Tests for `simplify` module."""
+
+    def setUp(self):
+        self.geojson = {
+            "type": "FeatureCollection",
+            "features": [
+                circle(0, 0, 1),
+                {
+                    "type": "Feature",
+                    "properties": {"name": "point"},
+                    "geometry": {"type": "Point", "coordinates": [1.23456789, 2.5]},
+                },
+                {"type": "Feature", "properties": {}, "geometry": None},
+            ],
+        }
+
+    def test_simplify(self):
+        """Test that simplified geometries stay valid and close to the original."""
+        result, stats = simplify_geojson(self.geojson, tolerance=0.01)
+        polygon = shape(result["features"][0]["geometry"])
+        self.assertTrue(polygon.is_valid)
+        self.assertLess(stats["vertices_after"], stats["vertices_before"] / 5)
+        self.assertLess(stats["bytes_after"], stats["bytes_before"] / 5)
+        original = shape(self.geojson["features"][0]["geometry"])
+        self.assertLess(original.hausdorff_distance(polygon), 0.01)
+        self.assertEqual(result["features"][1]["properties"]["name"], "point")
+        self.assertIsNone(result["features"][2]["geometry"])
+
+    def test_precision(self):
+        """Test that coordinates are rounded to the requested decimals."""
+        result, stats = simplify_geojson(self.geojson, precision=3)
+        self.assertEqual(result["features"][1]["geometry"]["coordinates"], [1.235, 2.5])
+        coords = shapely.get_coordinates(shape(result["features"][0]["geometry"]))
+        np.testing.assert_allclose(coords, np.round(coords, 3), rtol=0, atol=1e-12)
+        self.assertLessEqual(stats["vertices_after"], stats["vertices_before"])
+
+    def test_precision_keeps_valid(self):
+        """Test that rounding does not turn a sliver into an invalid polygon."""
+        sliver = {
+            "type": "Feature",
+            "properties": {},
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[0, 0], [1, 0], [1, 0.0001], [0, 0.0002], [0, 0]]],
+            },
+        }
+        result, _ = simplify_geojson(
+            {"type": "FeatureCollection", "features": [sliver]}, precision=3
+        )
+        polygon = shape(result["features"][0]["geometry"])
+        self.assertTrue(polygon.is_valid)
+        self.assertTrue(polygon.is_empty)
+
+    def test_zoom(self):
+        """Test the tolerance and precision derived from a zoom level."""
+        self.assertAlmostEqual(tolerance_for_zoom(0), 360 / 256)
+        self.assertAlmostEqual(tolerance_for_zoom(4, pixels=2), 2 * 360 / 4096)
+        self.assertEqual(precision_for_zoom(4), 2)
+        self.assertEqual(precision_for_zoom(18), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""Tests for the `spatial_index` module."""
+
+import unittest
+
+from nclpy.spatial_index import SpatialIndex, roi_to_geometry
+
+
+def point(lon, lat, name):
+    return {
+        "type": "Feature",
+        "properties": {"name": name},
+        "geometry": {"type": "Point", "coordinates": [lon, lat]},
+    }
+
+
+def square(west, south, size, name):
+    ring = [
+        [west, south],
+        [west + size, south],
+        [west + size, south + size],
+        [west, south + size],
+        [west, south],
+    ]
+    return {
+        "type": "Feature",
+        "properties": {"name": name},
+        "geometry": {"type": "Polygon", "coordinates": [ring]},
+    }
+
+
+class TestSpatialIndex(unittest.TestCase):
+    """Tests for `spatial_index` module."""
+
+    def setUp(self):
+        self.index = SpatialIndex(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    square(0, 0, 10, "a"),
+                    square(20, 0, 10, "b"),
+                    point(5, 5, "p"),
+                    point(50, 50, "q"),
+                    {"type": "Feature", "properties": {}, "geometry": None},
+                ],
+            }
+        )
+
+    def test_query_point(self):
+        """Test identifying the features at a location."""
+        self.assertEqual(self.index.query_point(5, 5), [0, 2])
+        self.assertEqual(self.index.query_point(25, 5), [1])
+        self.assertEqual(self.index.query_point(15, 5), [])
+
+    def test_query_point_tolerance(self):
+        """Test that points and edges are hit within a tolerance."""
+        self.assertEqual(self.index.query_point(50.001, 50), [])
+        self.assertEqual(self.index.query_point(50.001, 50, tolerance=0.01), [3])
+        self.assertEqual(self.index.query_point(19.995, 5, tolerance=0.01), [1])
+
+    def test_query_bbox(self):
+        """Test selecting the features in a bounding box."""
+        self.assertEqual(self.index.query_bbox(8, -5, 22, 5), [0, 1])
+        self.assertEqual(self.index.query_bbox(40, 40, 60, 60), [3])
+
+    def test_query_roi(self):
+        """Test drawn polygons and circles as regions of interest."""
+        roi = square(4, 4, 2, "roi")
+        self.assertEqual(self.index.query_roi(roi), [0, 2])
+        self.assertEqual(self.index.query_roi(roi, predicate="contains"), [2])
+
+        circle = point(50, 50, "circle")
+        circle["properties"]["style"] = {"radius": 1000}
+        self.assertEqual(self.index.query_roi(circle), [3])
+        self.assertAlmostEqual(roi_to_geometry(circle).bounds[3], 50.009, places=3)
+
+    def test_to_geojson(self):
+        """Test returning the matching features."""
+        geojson = self.index.to_geojson(self.index.query_point(25, 5))
+        self.assertEqual(geojson["features"][0]["properties"]["name"], "b")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+"""Tests for the `static_maps` module."""
+
+import io
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from nclpy import nclpy
+from nclpy.static_maps import (
+    TileClient,
+    lonlat_to_pixel,
+    map_spec,
+    pixel_window,
+    render_map,
+    render_maps,
+    tile_url,
+    window_tiles,
+)
+
+# The whole world at zoom 1: four tiles in a 512x512 image.
+WORLD = [-180, -85.0511287798, 180, 85.0511287798]
+
+
+def tile_color(prefix, x, y):
+    if prefix == "sparse":
+        return (255, 255, 255)
+    return (30 * x, 30 * y, 200)
+
+
+class TileServer:
+    """A stand-in tile server drawing each tile in a color made of its column and row.
+    The /sparse/ tiles are white and missing south of the equator at zoom 1, and the
+    /error/ tiles fail."""
+
+    def __init__(self):
+        self.connections = set()
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.connections.add(self.client_address)
+                server.requests += 1
+                parts = self.path.strip("/").rsplit(".", 1)[0].split("/")
+                z, x, y = (int(part) for part in parts[-3:])
+                if parts[0] == "error":
+                    self.send_error(500)
+                    return
+                if z == 1 and y == 1 and parts[0] == "sparse":
+                    self.send_error(404)
+                    return
+                image = Image.new("RGB", (256, 256), tile_color(parts[0], x, y))
+                buffer = io.BytesIO()
+                image.save(buffer, format="PNG")
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(buffer.getvalue())))
+                self.end_headers()
+                self.wfile.write(buffer.getvalue())
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}".format(self.httpd.server_port)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.1,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestStaticMaps(unittest.TestCase):
+    """Tests for rendering maps to PNG images."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = TileServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def tiles(self, prefix="tiles", opacity=1.0):
+        url = "{}/{}/{{z}}/{{x}}/{{y}}.png".format(self.server.url, prefix)
+        return {"type": "tiles", "url": url, "opacity": opacity}
+
+    def test_tile_math(self):
+        self.assertEqual(lonlat_to_pixel(0, 0, 0), (128.0, 128.0))
+        self.assertEqual(pixel_window(WORLD, 1), (0, 0, 512, 512))
+        window = pixel_window([-1, -1, 1, 1], 4)
+        self.assertEqual(window_tiles(*window, 4), [(7, 7), (8, 7), (7, 8), (8, 8)])
+        self.assertEqual(
+            tile_url("https://{s}.tiles/{z}/{x}/{y}.png?k={key}", 2, 5, 1),
+            "https://a.tiles/2/1/1.png?k={key}",
+        )
+        with self.assertRaises(ValueError):
+            pixel_window([1, 0, -1, 1], 4)
+        with self.assertRaises(ValueError):
+            pixel_window(WORLD, 10)
+
+    def test_pooled_client(self):
+        client = TileClient(pool_size=2)
+        try:
+            urls = [
+                tile_url(self.tiles()["url"], 3, x, y)
+                for x in range(8)
+                for y in range(4)
+            ]
+            tiles = client.fetch_many(urls)
+            self.assertTrue(all(tile.startswith(b"\x89PNG") for tile in tiles))
+            self.assertIsNone(
+                client.fetch(tile_url(self.tiles("sparse")["url"], 1, 0, 1))
+            )
+            with self.assertRaises(OSError):
+                client.fetch(tile_url(self.tiles("error")["url"], 1, 0, 0))
+        finally:
+            client.close()
+        self.assertEqual(client.requests, 34)
+        # The missing and failed tiles close their connections.
+        self.assertLessEqual(client.connections, 4)
+
+    def test_render_map(self):
+        polygon = {
+            "type": "Feature",
+            "properties": {},
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [
+                    [[10, 10], [60, 10], [60, 60], [10, 60], [10, 10]],
+                    [[30, 30], [40, 30], [40, 40], [30, 40], [30, 30]],
+                ],
+            },
+        }
+        style = {
+            "color": "#ff0000",
+            "weight": 2,
+            "fillColor": "#00ff00",
+            "fillOpacity": 1,
+        }
+        layers = [
+            self.tiles(),
+            self.tiles("sparse", opacity=0.5),
+            {"type": "geojson", "data": polygon, "style": style},
+        ]
+        out_png = os.path.join(self.tmp_dir.name, "maps", "world.png")
+        png = render_map(WORLD, 1, layers, out_png=out_png)
+
+        with open(out_png, "rb") as f:
+            self.assertEqual(f.read(), png)
+        image = Image.open(io.BytesIO(png))
+        self.assertEqual(image.size, (512, 512))
+        # The sparse layer is blended over the northern tiles and missing in the south.
+        for value, expected in zip(image.getpixel((100, 100)), (128, 128, 228, 255)):
+            self.assertAlmostEqual(value, expected, delta=1)
+        self.assertEqual(image.getpixel((100, 400)), (0, 30, 200, 255))
+        # The polygon is filled, but not its hole.
+        x, y = (int(v) for v in lonlat_to_pixel(20, 20, 1))
+        self.assertEqual(image.getpixel((x, y)), (0, 255, 0, 255))
+        x, y = (int(v) for v in lonlat_to_pixel(35, 35, 1))
+        for value, expected in zip(image.getpixel((x, y)), (143, 128, 228, 255)):
+            self.assertAlmostEqual(value, expected, delta=1)
+
+    def test_render_maps(self):
+        layers = [self.tiles()]
+        jobs = [
+            {
+                "bbox": [-170 + 40 * i, -60, -140 + 40 * i, 60],
+                "zoom": 3,
+                "layers": layers,
+                "out_png": os.path.join(self.tmp_dir.name, "{}.png".format(i)),
+            }
+            for i in range(6)
+        ]
+        jobs[2]["layers"] = [self.tiles("error")]
+        with mock.patch("builtins.print"):
+            errors = render_maps(jobs, processes=2)
+
+        self.assertEqual(list(errors), [jobs[2]["out_png"]])
+        self.assertIsInstance(errors[jobs[2]["out_png"]], OSError)
+        for i, job in enumerate(jobs):
+            self.assertEqual(os.path.exists(job["out_png"]), i != 2)
+        with Image.open(jobs[0]["out_png"]) as image:
+            self.assertEqual(image.size, pixel_window(jobs[0]["bbox"], 3)[2:])
+
+    def test_map_to_png(self):
+        m = nclpy.Map(headless=True)
+        m.add_layer(nclpy.TileLayer(url=self.tiles()["url"], name="tiles"))
+        m.add_geojson(
+            {"type": "Point", "coordinates": [0, 0]},
+            style={"radius": 4, "color": "#ff0000", "fillOpacity": 1},
+        )
+        with self.assertRaises(ValueError):
+            m.to_png()
+
+        spec = map_spec(m, bbox=[-10, -10, 10, 10], zoom=4)
+        self.assertEqual(
+            [layer["type"] for layer in spec["layers"]], ["tiles", "geojson"]
+        )
+        image = Image.open(io.BytesIO(m.to_png(bbox=[-10, -10, 10, 10], zoom=4)))
+        self.assertEqual(
+            image.getpixel((image.width // 2, image.height // 2))[:3], (255, 0, 0)
+        )
+        self.assertEqual(image.getpixel((0, 0))[:3], tile_color("tiles", 7, 7))
+
+
+if __name__ == "__main__":
+    unittest.main()
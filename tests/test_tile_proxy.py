@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+"""Tests for the `tile_proxy` module."""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from nclpy.tile_proxy import TileCache, TileProxy
+
+PNG = b"\x89PNG\r\n\x1a\n"
+
+
+class TileServer:
+    """A stand-in upstream tile server that counts the requests for each tile."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.counts = {}
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.counts[self.path] = server.counts.get(self.path, 0) + 1
+                time.sleep(server.delay)
+                if self.path.startswith("/missing"):
+                    self.send_error(404)
+                    return
+                data = PNG + self.path.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}/{{z}}/{{x}}/{{y}}.png".format(
+            self.httpd.server_address[1]
+        )
+        threading.Thread(
+            target=self.httpd.serve_forever, args=(0.1,), daemon=True
+        ).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return response.read(), response.headers["Content-Type"]
+
+
+class TestTileProxy(unittest.TestCase):
+    """Tests for `TileProxy`."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.upstream = TileServer()
+        self.proxy = TileProxy(cache_dir=self.tmp_dir.name, prefetch=False)
+
+    def tearDown(self):
+        self.proxy.stop()
+        self.upstream.close()
+        self.tmp_dir.cleanup()
+
+    def tile_url(self, z, x, y):
+        url = self.proxy.proxy_url(self.upstream.url)
+        return url.format(z=z, x=x, y=y)
+
+    def test_cache_hits(self):
+        data, content_type = fetch(self.tile_url(3, 2, 1))
+        self.assertEqual(data, PNG + b"/3/2/1.png")
+        self.assertEqual(content_type, "image/png")
+        self.assertEqual(fetch(self.tile_url(3, 2, 1))[0], data)
+        self.assertEqual(self.upstream.counts, {"/3/2/1.png": 1})
+
+        stats = self.proxy.stats()
+        self.assertEqual((stats["requests"], stats["hits"], stats["misses"]), (2, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_cache_survives_restart(self):
+        fetch(self.tile_url(3, 2, 1))
+        self.proxy.stop()
+        self.proxy = TileProxy(cache_dir=self.tmp_dir.name, prefetch=False)
+        fetch(self.tile_url(3, 2, 1))
+        self.assertEqual(self.upstream.counts, {"/3/2/1.png": 1})
+        self.assertEqual(self.proxy.stats()["hits"], 1)
+
+    def test_coalescing(self):
+        self.upstream.delay = 0.3
+        url = self.tile_url(5, 10, 12)
+        threads = [threading.Thread(target=fetch, args=(url,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.upstream.counts, {"/5/10/12.png": 1})
+        stats = self.proxy.stats()
+        self.assertEqual(stats["misses"] + stats["coalesced"] + stats["hits"], 8)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_prefetch(self):
+        self.proxy.prefetch = 3
+        view = [(4, x, y) for x in (5, 6) for y in (6, 7)]
+        for tile in view:
+            fetch(self.tile_url(*tile))
+        deadline = time.time() + 10
+        while self.proxy.stats()["prefetched"] < 3 and time.time() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.1)
+        # Only tiles next to the view, at the same zoom level, are prefetched.
+        self.assertEqual(self.proxy.stats()["prefetched"], 3)
+        self.assertEqual(len(self.upstream.counts), len(view) + 3)
+        for path in self.upstream.counts:
+            z, x, y = (int(v) for v in path[1:-4].split("/"))
+            self.assertEqual(z, 4)
+            self.assertTrue(4 <= x <= 7 and 5 <= y <= 8)
+        self.assertTrue(all(count == 1 for count in self.upstream.counts.values()))
+
+    def test_errors(self):
+        key = self.proxy.register(self.upstream.url.replace("/{z}", "/missing/{z}"))
+        base = self.proxy.proxy_url(self.upstream.url).split("/tiles/")[0]
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            fetch("{}/tiles/{}/1/0/0".format(base, key))
+        self.assertEqual(cm.exception.code, 502)
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            fetch("{}/tiles/unknown/1/0/0".format(base))
+        self.assertEqual(cm.exception.code, 404)
+        self.assertEqual(self.proxy.stats()["errors"], 1)
+
+
+class TestTileCache(unittest.TestCase):
+    """Tests for `TileCache`."""
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = TileCache(tmp_dir, max_size=250)
+            for x in range(3):
+                cache.put(("key", 1, x, 0), bytes(100))
+            self.assertEqual(len(cache), 2)
+            self.assertIsNone(cache.get(("key", 1, 0, 0)))
+            self.assertFalse(
+                os.path.exists(os.path.join(tmp_dir, "key", "1", "0", "0"))
+            )
+
+            # Reading a tile makes it the most recently used one.
+            cache.get(("key", 1, 1, 0))
+            cache.put(("key", 1, 3, 0), bytes(100))
+            self.assertIsNotNone(cache.get(("key", 1, 1, 0)))
+            self.assertIsNone(cache.get(("key", 1, 2, 0)))
+            self.assertEqual(cache.size, 200)
+
+    def test_shared_directory(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            kernels = [TileCache(tmp_dir, max_size=1000) for _ in range(2)]
+            for x in range(8):
+                for i, cache in enumerate(kernels):
+                    cache.put(("key", i, x, 0), bytes(100))
+            # Each kernel counts the tiles of the other one, so the directory as a
+            # whole stays within the limit.
+            total = sum(
+                os.path.getsize(os.path.join(root, name))
+                for root, _, names in os.walk(tmp_dir)
+                for name in names
+            )
+            self.assertLessEqual(total, 1000)
+            self.assertEqual(kernels[0].get(("key", 1, 7, 0)), bytes(100))
+
+
+if __name__ == "__main__":
+    unittest.main()
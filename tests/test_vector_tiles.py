@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+"""Tests for the `vector_tiles` module."""
+
+import math
+import unittest
+from unittest import mock
+
+import numpy as np
+from ipyleaflet import GeoJSON, Map
+
+from nclpy.vector_tiles import TiledGeoJSON, TileIndex, vertex_importance
+
+
+def circle(lon, lat, radius, n=2000):
+    angles = np.linspace(0, 2 * math.pi, n)
+    ring = np.column_stack([lon + radius * np.cos(angles), lat + radius * np.sin(angles)])
+    ring[-1] = ring[0]
+    return {
+        "type": "Feature",
+        "properties": {"name": "circle"},
+        "geometry": {"type": "Polygon", "coordinates": [ring.tolist()]},
+    }
+
+
+def douglas_peucker(points, sq_tolerance):
+    """Returns the indices of the vertices Douglas-Peucker keeps, one segment at a time."""
+    kept = [0, len(points) - 1]
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        a, b = points[first], points[last]
+        ab = b - a
+        length = ab @ ab
+        inner = points[first + 1 : last] - a
+        t = np.clip(inner @ ab / length, 0, 1) if length > 0 else 0
+        dist = ((inner - np.outer(t, ab)) ** 2).sum(axis=1)
+        index = int(np.argmax(dist))
+        if dist[index] > sq_tolerance:
+            split = first + 1 + index
+            kept.append(split)
+            stack += [(first, split), (split, last)]
+    return sorted(kept)
+
+
+class TestVectorTiles(unittest.TestCase):
+    """Tests for `vector_tiles` module."""
+
+    def setUp(self):
+        self.index = TileIndex(
+            {
+                "type": "FeatureCollection",
+                "features": [circle(-100, 40, 5), circle(100, -40, 0.001)],
+            }
+        )
+
+    def test_vertex_importance(self):
+        points = np.array([[0, 0], [1, 0.1], [2, -0.1], [3, 5], [4, 0]], dtype=float)
+        importance = vertex_importance(points)
+        self.assertTrue(np.isinf(importance[[0, -1]]).all())
+        self.assertEqual(int(np.argmax(importance[1:-1])) + 1, 3)
+
+        rng = np.random.default_rng(0)
+        lines = [rng.random((500, 2)), np.cumsum(rng.random((500, 2)) - 0.5, axis=0)]
+        lines.append(np.repeat(rng.random((50, 2)), 3, axis=0))
+        for line in lines:
+            importance = vertex_importance(line)
+            for sq_tolerance in [0, 1e-4, 1e-2, 1]:
+                kept = np.flatnonzero(importance > sq_tolerance).tolist()
+                self.assertEqual(kept, douglas_peucker(line, sq_tolerance))
+        self.assertEqual(vertex_importance(np.zeros((1, 2))).tolist(), [np.inf])
+
+    def test_simplified_per_zoom(self):
+        low = self.index.feature(0, 2)["geometry"]["coordinates"][0]
+        high = self.index.feature(0, self.index.max_zoom)["geometry"]["coordinates"][0]
+        self.assertLess(len(low), 100)
+        self.assertEqual(len(high), 2000)
+        self.assertIsNone(self.index.feature(1, 2))
+
+    def test_features_for_bounds(self):
+        indices, geojson = self.index.features_for_bounds(((30, -120), (50, -80)), 4)
+        self.assertEqual(indices, [0])
+        self.assertEqual(geojson["features"][0]["properties"]["name"], "circle")
+        tile = self.index.get_tile(0, 0, 0)
+        self.assertEqual(len(tile["features"]), 1)
+
+    def test_tiled_geojson(self):
+        m = Map(center=(40, -100), zoom=4)
+        m.set_trait("bounds", ((30, -120), (50, -80)))
+        layer = GeoJSON(data={})
+        tiled = TiledGeoJSON(m, layer, self.index)
+        self.assertEqual(len(layer.data["features"]), 1)
+
+        # Panning within the same tiles neither looks up nor simplifies features.
+        with mock.patch.object(
+            self.index, "tiles_features", wraps=self.index.tiles_features
+        ) as tiles_features, mock.patch.object(
+            self.index, "to_geojson", wraps=self.index.to_geojson
+        ) as to_geojson:
+            m.set_trait("bounds", ((31, -119), (49, -81)))
+            tiles_features.assert_not_called()
+            m.set_trait("bounds", ((0, -170), (60, -60)))
+            tiles_features.assert_called_once()
+            to_geojson.assert_not_called()
+            m.zoom = 5
+            to_geojson.assert_called_once()
+        tiled.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
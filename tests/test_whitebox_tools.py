@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+
+"""Tests for the `whitebox_tools` module."""
+
+import os
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+import ipywidgets as widgets
+
+from ipyfilechooser import FileChooser
+
+from nclpy import whitebox_tools
+from nclpy.whitebox_tools import (
+    WhiteboxJobRunner,
+    WhiteboxToolbox,
+    get_tools_dict,
+    job_panel,
+    tool_arguments,
+    tool_categories,
+    tool_outputs,
+)
+
+TOOLS = {
+    "Slope": {
+        "category": "Geomorphometric Analysis",
+        "description": "Calculates slope.",
+    },
+    "Aspect": {
+        "category": "Geomorphometric Analysis",
+        "description": "Calculates aspect.",
+    },
+    "FillDepressions": {
+        "category": "Hydrological Analysis",
+        "description": "Fills pits.",
+    },
+    "Clip": {"category": "GIS Analysis", "description": "Extracts features by slope."},
+}
+
+
+def fake_whiteboxgui(calls):
+    module = types.ModuleType("whiteboxgui.whiteboxgui")
+
+    def get_wbt_dict(reset=False):
+        calls.append(reset)
+        return TOOLS
+
+    module.get_wbt_dict = get_wbt_dict
+    package = types.ModuleType("whiteboxgui")
+    package.whiteboxgui = module
+    return {"whiteboxgui": package, "whiteboxgui.whiteboxgui": module}
+
+
+class TestWhiteboxTools(unittest.TestCase):
+    """Tests for the WhiteboxTools toolbox."""
+
+    def test_tools_dict_cache(self):
+        calls = []
+        with tempfile.TemporaryDirectory() as tmp_dir, mock.patch.dict(
+            sys.modules, fake_whiteboxgui(calls)
+        ), mock.patch.object(whitebox_tools, "_tools_dicts", {}):
+            self.assertEqual(get_tools_dict(cache_dir=tmp_dir), TOOLS)
+            self.assertEqual(get_tools_dict(cache_dir=tmp_dir), TOOLS)
+            self.assertEqual(calls, [False])
+
+            # A new session reads the file written for this version.
+            whitebox_tools._tools_dicts.clear()
+            self.assertEqual(get_tools_dict(cache_dir=tmp_dir), TOOLS)
+            self.assertEqual(calls, [False])
+            name = "whitebox_tools-{}.json".format(whitebox_tools.whitebox_version())
+            self.assertEqual(os.listdir(tmp_dir), [name])
+
+            with mock.patch.object(
+                whitebox_tools, "whitebox_version", return_value="9.9"
+            ):
+                get_tools_dict(cache_dir=tmp_dir)
+            self.assertEqual(calls, [False, False])
+
+    def test_whitebox_version_without_importlib_metadata(self):
+        class DistributionNotFound(Exception):
+            pass
+
+        def get_distribution(name):
+            if name != "whitebox":
+                raise DistributionNotFound(name)
+            return mock.Mock(version="2.3.0")
+
+        pkg_resources = mock.Mock(
+            get_distribution=get_distribution,
+            DistributionNotFound=DistributionNotFound,
+        )
+        # On Python 3.7 importlib.metadata does not exist.
+        with mock.patch.dict(
+            sys.modules,
+            {"importlib.metadata": None, "pkg_resources": pkg_resources},
+        ):
+            self.assertEqual(whitebox_tools.whitebox_version(), "2.3.0")
+            pkg_resources.get_distribution = mock.Mock(
+                side_effect=DistributionNotFound
+            )
+            self.assertEqual(whitebox_tools.whitebox_version(), "unknown")
+
+    def test_lazy_toolbox(self):
+        built = []
+
+        def tool_panel(tool_dict, max_height):
+            built.append(tool_dict["description"])
+            return widgets.Label(tool_dict["description"])
+
+        toolbox = WhiteboxToolbox(TOOLS, tool_panel=tool_panel)
+        categories = tool_categories(TOOLS)
+        self.assertEqual(list(categories)[0], "GIS Analysis")
+        self.assertTrue(all(not box.children for box in toolbox.accordion.children))
+
+        toolbox.accordion.selected_index = 1
+        tools = toolbox.accordion.children[1].children[0]
+        self.assertEqual(tools.options, ("Aspect", "Slope"))
+        self.assertFalse(toolbox.accordion.children[2].children)
+
+        tools.value = "Slope"
+        panel = toolbox.panel_box.children[0]
+        toolbox.show_tool("Aspect")
+        toolbox.show_tool("Slope")
+        self.assertIs(toolbox.panel_box.children[0], panel)
+        self.assertEqual(built, ["Calculates slope.", "Calculates aspect."])
+
+    def test_search(self):
+        toolbox = WhiteboxToolbox(TOOLS, tool_panel=lambda *args: widgets.Label())
+        toolbox.search_box.value = "slope"
+        self.assertEqual(toolbox.results.options, ("Clip", "Slope"))
+        self.assertIs(toolbox.left.children[-1], toolbox.results)
+        toolbox.search_box.value = ""
+        self.assertIs(toolbox.left.children[-1], toolbox.accordion)
+
+
+# A stand-in for the WhiteboxTools binary: it reports progress, then writes the output file.
+FAKE_WHITEBOX = textwrap.dedent("""
+    import sys, time
+    args = dict((a.lstrip("-") + "=1").split("=")[:2] for a in sys.argv[1:])
+    for percent in (25, 50, 75, 100):
+        print("Progress: {}%".format(percent), flush=True)
+        time.sleep(float(args.get("delay", 0)))
+    if args.get("fail"):
+        sys.exit(1)
+    if "output" in args:
+        open(args["output"], "w").close()
+    """)
+
+SLOPE = {
+    "name": "Slope",
+    "label": "Slope",
+    "description": "Calculates slope.",
+    "parameters": {
+        "dem": {
+            "name": "Input DEM File",
+            "description": "Input raster DEM file.",
+            "parameter_type": {"ExistingFile": "Raster"},
+            "default_value": None,
+            "optional": False,
+        },
+        "output": {
+            "name": "Output File",
+            "description": "Output file.",
+            "parameter_type": {"NewFile": {"Vector": "Line"}},
+            "default_value": None,
+            "optional": False,
+        },
+        "delay": {
+            "name": "Delay",
+            "description": "Seconds between progress reports.",
+            "parameter_type": "Float",
+            "default_value": "0",
+            "optional": True,
+        },
+        "fail": {
+            "name": "Fail",
+            "description": "Exit with an error.",
+            "parameter_type": "Boolean",
+            "default_value": "false",
+            "optional": True,
+        },
+    },
+}
+
+
+def choose(chooser, path):
+    chooser.reset(os.path.dirname(path), os.path.basename(path))
+    chooser._apply_selection()
+
+
+class TestWhiteboxJobs(unittest.TestCase):
+    """Tests for `WhiteboxJobRunner`."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        script = os.path.join(self.tmp_dir.name, "whitebox_tools.py")
+        with open(script, "w") as f:
+            f.write(FAKE_WHITEBOX)
+        self.runner = WhiteboxJobRunner(max_workers=2, command=[sys.executable, script])
+        self.output = os.path.join(self.tmp_dir.name, "streams.shp")
+
+    def tearDown(self):
+        self.runner.shutdown()
+        self.tmp_dir.cleanup()
+
+    def test_arguments(self):
+        args = {
+            "i": "dem.tif",
+            "output": "out.tif",
+            "log": True,
+            "fill": False,
+            "z": "",
+        }
+        self.assertEqual(
+            tool_arguments(args), ["-i=dem.tif", "--output=out.tif", "--log"]
+        )
+        self.assertEqual(
+            tool_outputs(SLOPE, {"dem": "dem.tif", "output": self.output}),
+            [(self.output, "vector")],
+        )
+
+    def test_run(self):
+        lines = []
+        finished = []
+        job = self.runner.submit(
+            "Slope",
+            {"dem": "dem.tif", "output": self.output},
+            on_progress=lambda job, line: lines.append((job.progress, line)),
+            on_done=finished.append,
+        )
+        self.assertTrue(job.wait(10))
+        self.assertEqual((job.status, job.progress, job.returncode), ("done", 100, 0))
+        self.assertEqual(lines[1], (50, "Progress: 50%"))
+        self.assertEqual(finished, [job])
+        self.assertTrue(os.path.exists(self.output))
+
+        job = self.runner.submit("Slope", {"fail": True})
+        self.assertTrue(job.wait(10))
+        self.assertEqual((job.status, job.returncode), ("failed", 1))
+
+    def test_concurrency_and_cancel(self):
+        jobs = [self.runner.submit("Slope", {"delay": 5}) for _ in range(3)]
+        time.sleep(0.5)
+        self.assertEqual([job.status for job in jobs], ["running", "running", "queued"])
+        start = time.time()
+        self.runner.cancel_all()
+        for job in jobs:
+            self.assertTrue(job.wait(5))
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual([job.status for job in jobs], ["cancelled"] * 3)
+        self.assertEqual(self.runner.running(), [])
+
+    def test_panel(self):
+        outputs = []
+
+        def on_output(*args):
+            outputs.append((args, threading.current_thread()))
+
+        panel = job_panel(SLOPE, runner=self.runner, on_output=on_output)
+        inputs = panel.children[2:6]
+        buttons = panel.children[6]
+        progress = buttons.children[2]
+        updates = []
+        progress.observe(
+            lambda change: updates.append(threading.current_thread()), "value"
+        )
+        self.assertIsInstance(inputs[0], FileChooser)
+        self.assertIsInstance(inputs[1], FileChooser)
+        buttons.children[0].click()
+        self.assertEqual(self.runner.jobs, [])
+
+        choose(inputs[0], os.path.join(self.tmp_dir.name, "dem.tif"))
+        choose(inputs[1], self.output)
+        buttons.children[0].click()
+        self.assertTrue(self.runner.jobs[0].wait(10))
+        # Outside of a kernel, the progress is shown and the output is added to the map
+        # from the main thread once the panel is used again.
+        self.assertEqual(progress.description, "Queued")
+        self.assertEqual(outputs, [])
+        buttons.children[1].click()
+        self.assertEqual(progress.description, "Done")
+        self.assertEqual(progress.value, 100)
+        self.assertTrue(updates)
+        self.assertTrue(all(t is threading.main_thread() for t in updates))
+        self.assertEqual(outputs, [((self.output, "vector"), threading.main_thread())])
+
+    def test_shutdown(self):
+        job = self.runner.submit("Slope", {"delay": 5})
+        threads = list(self.runner._threads)
+        # The workers do not keep the interpreter alive, and the tools still running are
+        # stopped at exit.
+        self.assertTrue(all(thread.daemon for thread in threads))
+        whitebox_tools._stop_runners()
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, "cancelled")
+        self.runner.shutdown()
+        for thread in threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()